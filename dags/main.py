@@ -1,53 +1,33 @@
-from scripts.find_parquet_links import find_parquet_links,TLC_DATA_PAGE_URL
+from scripts.catalog import load_catalog, select_files
 from scripts.download_files import download_files #!!!!downloads ALL parquet!!!
 from scripts.download_files_v2 import download_files_sample #ceci download un sample de parquet
 from scripts.download_files import empty_folder
 import os
-from urllib.parse import urlparse
-import re
 #from scripts.find_parquet_links2 import find_parquet_links_by_section
 
-
-found_links = find_parquet_links(TLC_DATA_PAGE_URL)
-
-
-  
-
-#print(len(found_links))
-
-
-#empty_folder('data\staging')
-
-download_files_sample(found_links,5,'data\staging')  
-
-
-
-
-
-
-
-
+# Ce fichier est dans le dossier des DAGs : rien ne doit s'exécuter à l'import
+# (la page TLC n'est consultée qu'au lancement du script, via le catalogue en cache).
 
 
+ANNEES_A_ANALYSER = ["2023"]
+annee = "2015"
 
 
+def main():
+    catalog = load_catalog()
+    found_links = [entry["url"] for entry in catalog["files"]]
 
+    #print(len(found_links))
 
+    #empty_folder('data\staging')
 
+    download_files_sample(found_links,5,'data\staging')
 
+    if found_links:
+        print(f"\n--- {len(found_links)} LIENS PARQUET TROUVÉS ---")
+    c = len(select_files(catalog, start=(int(annee), 1), end=(int(annee), 12)))
+    print(c)
 
 
-ANNEES_A_ANALYSER = ["2023"]
-annee = "2015"
-c=0  
-if found_links:
-    print(f"\n--- {len(found_links)} LIENS PARQUET TROUVÉS ---")
-    for link in found_links:
-        if annee in link : 
-            #print(link)
-            c+=1
-        if 'parquet' not in link : 
-            print(link)
-        
-
-print(c)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,212 @@
-from datetime import datetime
-from airflow.decorators import dag 
+from datetime import datetime, timedelta
+from airflow.decorators import dag
 from airflow.operators.python import PythonOperator
 
 
-import polars as pl
+import os
 
-import glob
-import pandas as pd
-import geopandas as gpd
-from polars._typing import SchemaDict
-import polars_st as st
+# Ce fichier est relu en permanence par le dag processor : rien de lourd ici.
+# Les imports polars / geopandas, la recherche des fichiers, le schéma cible et les
+# zones sont chargés au moment où une tâche s'exécute (voir scripts.resources).
 
 
-from scripts.transformation import order_columns_by_schema, add_location_ids, col_rename, values_map, add_missing_columns, enforce_schema_types
 
+TARGET_SCHEMA_GLOB = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\test-in\yellow\2025\*.parquet"
+INPUT_GLOB = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\test-in\yellow\**\*.parquet"
+SHAPEFILE_PATH = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\taxi_zones\\"
 
+# Nombre de décimales pour le cache quantifié des LocationID (None = géocodage exact de chaque ligne).
+LOCATION_ID_PRECISION = None
 
-DIR = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\test-in\yellow\2025\*.parquet"
-files = glob.glob(DIR)
-target_schema_2025_dict = pl.scan_parquet(files[0]).collect_schema()
+# Nombre de fichiers transformés en parallèle et threads Polars par worker (None = cœurs / workers).
+TRANSFORM_WORKERS = int(os.environ.get("TAXI_TRANSFORM_WORKERS", 4))
+POLARS_THREADS_PER_WORKER = None
 
-DIR = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\test-in\yellow\**\*.parquet"
-files = glob.glob(DIR)
-SHAPEFILE_PATH = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\taxi_zones\\"
-zones_gdf = gpd.read_file(SHAPEFILE_PATH)
-zones_df = st.from_geopandas(zones_gdf.to_crs("EPSG:4326"))
-zones_lazy = zones_df.select(['geometry', 'LocationID']).lazy()
-
-def run_transformation(
-    source_lazy_df: pl.LazyFrame,
-    zones_df: pl.DataFrame,
-    target_schema: SchemaDict
-) -> pl.LazyFrame:
-    """
-        renvoie Un nouveau LazyFrame aligné sur le schéma cible.
-    """
-    print("--- START ---")
+# Nombre maximum de partitions (fichiers mensuels) transformées en même temps sur les workers Celery.
+MAX_ACTIVE_TRANSFORMS = int(os.environ.get("TAXI_MAX_ACTIVE_TRANSFORMS", 8))
 
-   
-    df_step1 = col_rename(source_lazy_df)
+# Manifeste des partitions déjà produites : seuls les fichiers nouveaux ou modifiés sont retraités.
+MANIFEST_PATH = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\manifest.sqlite"
+# TAXI_FORCE_REBUILD=1 ignore le manifeste et retraite tout l'historique.
+FORCE_REBUILD = os.environ.get("TAXI_FORCE_REBUILD") == "1"
 
-    
-    df_step2 = add_location_ids(df_step1, zones_df)
+# Dataset de sortie partitionné : <OUTPUT_ROOT>\year=AAAA\month=MM\<fichier>.parquet
+OUTPUT_ROOT = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\test_out\yellow"
 
-    
-    df_step3 = values_map(df_step2)
+# Agrégats zone x heure x fournisseur x paiement, recalculés pour chaque mois transformé
+# (voir scripts.rollups) : <ROLLUP_ROOT>\year=AAAA\month=MM\<fichier>.parquet
+ROLLUP_ROOT = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\rollups\zone_hour"
 
-    
-    df_step4 = add_missing_columns(df_step3, target_schema)
+# Matrices origine-destination (zone x zone x heure de la semaine) de chaque mois, en .npy
+# memory-mappables (voir scripts.od_matrix) : <OD_ROOT>\year=AAAA\month=MM\
+OD_ROOT = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\od_matrix"
 
-    
-    df_step5 = enforce_schema_types(df_step4, target_schema)
-    
-    
-    final_lazy_df = order_columns_by_schema(df_step5, target_schema)
+# Rapports qualité par fichier (règles de scripts.quality, comptées pendant la transformation).
+QUALITY_DIR = r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\quality"
+# TAXI_QUARANTINE=1 écrit les courses en échec dans un dataset à part au lieu de la sortie.
+QUARANTINE_ROOT = (
+    r"C:\Users\stgadmin\Desktop\Taxi_AirFlow\data\quarantine\yellow"
+    if os.environ.get("TAXI_QUARANTINE") == "1" else None
+)
+
+# Réglages des fichiers de sortie (voir scripts.output_writer.write_partition).
+OUTPUT_OPTIONS = {
+    "compression": "zstd",
+    "compression_level": 3,
+    "row_group_size": 250_000,
+    "statistics": True,
+    "sort_by": "tpep_pickup_datetime",
+}
+
+# Mode basse mémoire pour l'historique complet (fichiers 2009-2014 volumineux) :
+# TAXI_MEMORY_BUDGET_MB=<Mo> traite chaque fichier par tranches sous ce pic de mémoire.
+MEMORY_BUDGET_MB = os.environ.get("TAXI_MEMORY_BUDGET_MB")
+LOW_MEMORY = (
+    {"batch_rows": 2_000_000, "memory_budget_mb": float(MEMORY_BUDGET_MB)}
+    if MEMORY_BUDGET_MB else None
+)
 
-    print("--- END ---")
-    
-    return final_lazy_df
+# TAXI_PROFILE_DIR=<dossier> : plans Polars par fichier et rapport de profilage par étape.
+PROFILE_DIR = os.environ.get("TAXI_PROFILE_DIR") or None
 
-def run_all(files): 
-    for file in files : 
-        data = pl.scan_parquet(file)
-        file_name = file
-        file_again = file.split('\\')
-        file_again[6] = 'test_out'
-        file_name = ('\\').join(file_again)
-        print(file_name)
-        result = run_transformation(data,zones_lazy,target_schema_2025_dict)
-        result.sink_parquet(file_name) 
+# Chargement dans la base destination (CONNECTION_STRING_DESTINATION du fichier .env).
+LOAD_TABLE = "yellow_tripdata"
+LOAD_BATCH_SIZE = int(os.environ.get("TAXI_LOAD_BATCH_SIZE", 100_000))
+
+def manifest_options():
+    """
+    Réglages qui changent les sorties : en modifier un fait retraiter tout l'historique (voir scripts.manifest).
+    LOW_MEMORY n'en fait pas partie : le mode basse mémoire donne la même sortie triée.
+    """
+    return {
+        "quantize_precision": LOCATION_ID_PRECISION,
+        "output_options": OUTPUT_OPTIONS,
+        "rollups": ROLLUP_ROOT is not None,
+        "od_matrix": OD_ROOT is not None,
+        "quality": QUALITY_DIR is not None,
+        "quarantine": QUARANTINE_ROOT is not None,
+    }
+
+def output_path(file):
+    """Chemin de sortie d'un fichier dans le dataset partitionné par année / mois."""
+    from scripts.output_writer import partition_path
+
+    return partition_path(OUTPUT_ROOT, file)
+
+def run_all(files=None, workers=TRANSFORM_WORKERS, polars_threads=POLARS_THREADS_PER_WORKER, force=FORCE_REBUILD):
+    from scripts.manifest import filter_jobs, record_reports
+    from scripts.parallel_transform import run_files_parallel
+    from scripts.resources import get_target_schema, list_input_files
+
+    if files is None:
+        files = list_input_files(INPUT_GLOB)
+    target_schema = get_target_schema(TARGET_SCHEMA_GLOB)
+    jobs = [(file, output_path(file)) for file in files]
+    if not force:
+        jobs = filter_jobs(jobs, target_schema, MANIFEST_PATH, manifest_options())
+    summary = run_files_parallel(
+        jobs,
+        target_schema,
+        workers=workers,
+        polars_threads=polars_threads,
+        shapefile_path=SHAPEFILE_PATH,
+        quantize_precision=LOCATION_ID_PRECISION,
+        writer_options=OUTPUT_OPTIONS,
+        low_memory=LOW_MEMORY,
+        profile_dir=PROFILE_DIR,
+        rollup_root=ROLLUP_ROOT,
+        od_root=OD_ROOT,
+        quality_dir=QUALITY_DIR,
+        quarantine_root=QUARANTINE_ROOT,
+    )
+    record_reports(summary, target_schema, MANIFEST_PATH, manifest_options())
+    failed = [report["file"] for report in summary if report["status"] != "OK"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} fichier(s) en erreur : {failed}")
+
+def list_partitions(force=FORCE_REBUILD):
+    """
+    Une entrée par fichier mensuel nouveau ou modifié (voir scripts.manifest) :
+    chaque entrée devient une tâche 'transformation' mappée.
+    """
+    from scripts.manifest import filter_jobs
+    from scripts.resources import get_target_schema, list_input_files
+
+    jobs = [(file, output_path(file)) for file in list_input_files(INPUT_GLOB)]
+    if not force:
+        jobs = filter_jobs(jobs, get_target_schema(TARGET_SCHEMA_GLOB), MANIFEST_PATH, manifest_options())
+    return [{"file": file} for file, _ in jobs]
+
+def transform_partition(file):
+    """
+    Transforme un seul fichier mensuel ; en cas d'erreur seule cette partition est relancée.
+    Renvoie les arguments de la tâche 'load_sql' de ce fichier, qui n'est lancée qu'une
+    fois la partition transformée.
+    """
+    from scripts.manifest import record_reports
+    from scripts.parallel_transform import transform_file
+    from scripts.resources import get_target_schema, get_zones
+
+    zones_lazy, zone_grid = get_zones(SHAPEFILE_PATH)
+    target_schema = get_target_schema(TARGET_SCHEMA_GLOB)
+    report = transform_file(
+        file,
+        output_path(file),
+        target_schema,
+        zones_lazy,
+        zone_grid,
+        LOCATION_ID_PRECISION,
+        OUTPUT_OPTIONS,
+        LOW_MEMORY,
+        PROFILE_DIR,
+        ROLLUP_ROOT,
+        OD_ROOT,
+        QUALITY_DIR,
+        QUARANTINE_ROOT,
+    )
+    record_reports([report], target_schema, MANIFEST_PATH, manifest_options())
+    print(f"{file} -> {report['rows']} lignes en {report['seconds']:.1f} s")
+    return {"file": file}
+
+def load_partition(file):
+    """Charge dans SQL Server la sortie transformée d'un fichier mensuel, par tranches."""
+    from scripts.sql_loader import load_parquet_file
+
+    report = load_parquet_file(output_path(file), LOAD_TABLE, LOAD_BATCH_SIZE)
+    return report["rows"]
 
 @dag(
     dag_id ="test_taxi",
     schedule="@daily",
     start_date = datetime(2025,9,18),
-    tags=["taxi"] 
+    tags=["taxi"]
 )
 def generate_dag():
-    task1 = PythonOperator( 
-        task_id = "transformation",
-        python_callable=run_all,
-        op_kwargs={"files": files}
+    task1 = PythonOperator(
+        task_id = "list_partitions",
+        python_callable=list_partitions,
     )
-    
 
-    task1
+    task2 = PythonOperator.partial(
+        task_id = "transformation",
+        python_callable=transform_partition,
+        max_active_tis_per_dag=MAX_ACTIVE_TRANSFORMS,
+        retries=2,
+        retry_delay=timedelta(minutes=5),
+        map_index_template="{{ task.op_kwargs['file'] }}",
+    ).expand(op_kwargs=task1.output)
+
+    task3 = PythonOperator.partial(
+        task_id = "load_sql",
+        python_callable=load_partition,
+        max_active_tis_per_dag=MAX_ACTIVE_TRANSFORMS,
+        retries=2,
+        retry_delay=timedelta(minutes=5),
+        map_index_template="{{ task.op_kwargs['file'] }}",
+    ).expand(op_kwargs=task2.output)
+
+    # Les dépendances suivent les sorties : list_partitions -> transformation -> load_sql,
+    # et chaque chargement attend la transformation de son propre fichier.
 
 
 generate_dag()
-
-
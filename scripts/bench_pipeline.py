@@ -0,0 +1,302 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import contextlib
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+
+from scripts.output_writer import write_partition
+from scripts.profiling import profile_transformation
+from scripts.transformation import ERA_DATETIME_FORMATS, parse_datetime, run_transformation
+from scripts.zone_index import ZONES_SHAPEFILE, load_zones
+
+# Lignes générées par défaut pour chaque époque de schéma.
+NUMBER_OF_ROWS = 1_000_000
+DEFAULT_REPEATS = 3
+BENCH_DIR = "data/bench"
+BASELINE_PATH = os.path.join(BENCH_DIR, "pipeline_baseline.json")
+# Écart toléré par rapport au baseline avant de signaler une régression (10 %).
+DEFAULT_TOLERANCE = 0.10
+# En dessous de cette durée, l'écart relatif n'est que du bruit de mesure.
+MIN_COMPARABLE_SECONDS = 0.05
+
+# Emprise approximative des zones de taxi (lon min, lat min, lon max, lat max).
+NYC_BOUNDS = (-74.26, 40.49, -73.70, 40.92)
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+ERAS = ["2009", "2010", "modern"]
+# Nom de fichier de chaque époque (le mois sert au dataset partitionné).
+ERA_FILES = {
+    "2009": "yellow_tripdata_2009-01.parquet",
+    "2010": "yellow_tripdata_2010-01.parquet",
+    "modern": "yellow_tripdata_2025-01.parquet",
+}
+
+
+def _trip_times(rng, n_rows: int, year: int):
+    """Dates de prise en charge aléatoires dans le mois de janvier et dépose 1 à 60 minutes après."""
+    start = np.datetime64(f"{year}-01-01T00:00:00", "us")
+    pickup = start + rng.integers(0, 31 * 24 * 3600, n_rows).astype("timedelta64[s]")
+    dropoff = pickup + rng.integers(60, 3600, n_rows).astype("timedelta64[s]")
+    return pl.Series(pickup), pl.Series(dropoff)
+
+
+def _coordinates(rng, n_rows: int):
+    """Coordonnées dans l'emprise des zones, avec une petite part de 0/0 comme dans les vrais fichiers."""
+    minx, miny, maxx, maxy = NYC_BOUNDS
+    lon = rng.uniform(minx, maxx, n_rows)
+    lat = rng.uniform(miny, maxy, n_rows)
+    zeros = rng.random(n_rows) < 0.02
+    lon[zeros] = 0.0
+    lat[zeros] = 0.0
+    return lon, lat
+
+
+def _amounts(rng, n_rows: int) -> dict:
+    fare = np.round(rng.gamma(2.0, 6.0, n_rows), 2)
+    tip = np.round(fare * rng.choice([0.0, 0.1, 0.2], n_rows), 2)
+    return {"fare": fare, "extra": rng.choice([0.0, 0.5, 1.0], n_rows), "tip": tip, "tolls": rng.choice([0.0, 5.76], n_rows, p=[0.95, 0.05])}
+
+
+def generate_2009(n_rows: int, seed: int = 0) -> pl.DataFrame:
+    """Schéma 2009 : vendor_name texte, Trip_*_DateTime en texte, coordonnées Start_/End_."""
+    rng = np.random.default_rng(seed)
+    pickup, dropoff = _trip_times(rng, n_rows, 2009)
+    start_lon, start_lat = _coordinates(rng, n_rows)
+    end_lon, end_lat = _coordinates(rng, n_rows)
+    amounts = _amounts(rng, n_rows)
+    return pl.DataFrame({
+        "vendor_name": rng.choice(["CMT", "VTS", "DDS"], n_rows),
+        "Trip_Pickup_DateTime": pickup.dt.strftime(DATETIME_FORMAT),
+        "Trip_Dropoff_DateTime": dropoff.dt.strftime(DATETIME_FORMAT),
+        "Passenger_Count": rng.integers(1, 6, n_rows),
+        "Trip_Distance": np.round(rng.gamma(1.5, 2.0, n_rows), 2),
+        "Start_Lon": start_lon,
+        "Start_Lat": start_lat,
+        "Rate_Code": rng.choice([1.0, 2.0, 5.0], n_rows, p=[0.95, 0.03, 0.02]),
+        "store_and_forward": pl.Series(rng.choice([0.0, 1.0, np.nan], n_rows, p=[0.1, 0.02, 0.88])),
+        "End_Lon": end_lon,
+        "End_Lat": end_lat,
+        "Payment_Type": rng.choice(["CASH", "Cash", "CREDIT", "Credit", "No Charge", "Dispute"], n_rows),
+        "Fare_Amt": amounts["fare"],
+        "surcharge": amounts["extra"],
+        "mta_tax": np.full(n_rows, 0.5),
+        "Tip_Amt": amounts["tip"],
+        "Tolls_Amt": amounts["tolls"],
+        "Total_Amt": amounts["fare"] + amounts["extra"] + 0.5 + amounts["tip"] + amounts["tolls"],
+    })
+
+
+def generate_2010(n_rows: int, seed: int = 0) -> pl.DataFrame:
+    """Schéma 2010 : colonnes en minuscules, vendor_id texte, pickup_/dropoff_ longitude/latitude."""
+    rng = np.random.default_rng(seed)
+    pickup, dropoff = _trip_times(rng, n_rows, 2010)
+    start_lon, start_lat = _coordinates(rng, n_rows)
+    end_lon, end_lat = _coordinates(rng, n_rows)
+    amounts = _amounts(rng, n_rows)
+    return pl.DataFrame({
+        "vendor_id": rng.choice(["CMT", "VTS"], n_rows),
+        "pickup_datetime": pickup.dt.strftime(DATETIME_FORMAT),
+        "dropoff_datetime": dropoff.dt.strftime(DATETIME_FORMAT),
+        "passenger_count": rng.integers(1, 6, n_rows),
+        "trip_distance": np.round(rng.gamma(1.5, 2.0, n_rows), 2),
+        "pickup_longitude": start_lon,
+        "pickup_latitude": start_lat,
+        "rate_code": rng.integers(1, 3, n_rows),
+        "store_and_fwd_flag": pl.Series(rng.choice([0.0, 1.0, np.nan], n_rows, p=[0.1, 0.02, 0.88])),
+        "dropoff_longitude": end_lon,
+        "dropoff_latitude": end_lat,
+        "payment_type": rng.choice(["CAS", "CRE", "NOC", "DIS"], n_rows),
+        "fare_amount": amounts["fare"],
+        "surcharge": amounts["extra"],
+        "mta_tax": np.full(n_rows, 0.5),
+        "tip_amount": amounts["tip"],
+        "tolls_amount": amounts["tolls"],
+        "total_amount": amounts["fare"] + amounts["extra"] + 0.5 + amounts["tip"] + amounts["tolls"],
+    })
+
+
+def generate_modern(n_rows: int, seed: int = 0) -> pl.DataFrame:
+    """Schéma actuel (2025) : tpep_*, LocationID déjà présents. Sert aussi de schéma cible."""
+    rng = np.random.default_rng(seed)
+    pickup, dropoff = _trip_times(rng, n_rows, 2025)
+    amounts = _amounts(rng, n_rows)
+    return pl.DataFrame({
+        "VendorID": pl.Series(rng.choice([1, 2, 6, 7], n_rows), dtype=pl.Int32),
+        "tpep_pickup_datetime": pickup,
+        "tpep_dropoff_datetime": dropoff,
+        "passenger_count": rng.integers(0, 6, n_rows),
+        "trip_distance": np.round(rng.gamma(1.5, 2.0, n_rows), 2),
+        "RatecodeID": rng.choice([1, 2, 5, 99], n_rows, p=[0.9, 0.05, 0.04, 0.01]),
+        "store_and_fwd_flag": rng.choice(["N", "Y"], n_rows, p=[0.99, 0.01]),
+        "PULocationID": pl.Series(rng.integers(1, 266, n_rows), dtype=pl.Int32),
+        "DOLocationID": pl.Series(rng.integers(1, 266, n_rows), dtype=pl.Int32),
+        "payment_type": rng.integers(0, 5, n_rows),
+        "fare_amount": amounts["fare"],
+        "extra": amounts["extra"],
+        "mta_tax": np.full(n_rows, 0.5),
+        "tip_amount": amounts["tip"],
+        "tolls_amount": amounts["tolls"],
+        "improvement_surcharge": np.full(n_rows, 1.0),
+        "total_amount": amounts["fare"] + amounts["extra"] + 2.0 + amounts["tip"] + amounts["tolls"],
+        "congestion_surcharge": rng.choice([0.0, 2.5], n_rows),
+        "Airport_fee": rng.choice([0.0, 1.75], n_rows, p=[0.9, 0.1]),
+        "cbd_congestion_fee": rng.choice([0.0, 0.75], n_rows),
+    })
+
+
+GENERATORS = {"2009": generate_2009, "2010": generate_2010, "modern": generate_modern}
+
+
+def write_era_files(n_rows: int, work_dir: str = BENCH_DIR, eras: list = ERAS, seed: int = 0) -> dict:
+    """Génère un fichier parquet par époque (mêmes données pour une même graine)."""
+    os.makedirs(os.path.join(work_dir, "input"), exist_ok=True)
+    paths = {}
+    for era in eras:
+        path = os.path.join(work_dir, "input", ERA_FILES[era])
+        GENERATORS[era](n_rows, seed).write_parquet(path)
+        paths[era] = path
+    return paths
+
+
+def run_datetime_benchmark(n_rows: int = NUMBER_OF_ROWS, repeats: int = DEFAULT_REPEATS, seed: int = 0) -> dict:
+    """
+    Compare les trois lectures des dates texte 2009 (voir transformation.parse_datetime) :
+    format deviné par Polars, format fixe, format fixe sur les valeurs distinctes.
+    """
+    column = "Trip_Pickup_DateTime"
+    data = generate_2009(n_rows, seed).select(column)
+    modes = {
+        "datetime_inferred": parse_datetime(column, pl.Datetime("us")),
+        "datetime_format": parse_datetime(column, pl.Datetime("us"), ERA_DATETIME_FORMATS[column]),
+        "datetime_unique": parse_datetime(column, pl.Datetime("us"), ERA_DATETIME_FORMATS[column], unique=True),
+    }
+    timings = {}
+    for mode, expr in modes.items():
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            data.lazy().select(expr).collect()
+            durations.append(time.perf_counter() - start)
+        timings[mode] = round(statistics.median(durations), 4)
+
+    distinct = data[column].n_unique()
+    print(
+        f"dates   : devinées {timings['datetime_inferred']:.2f} s, format fixe {timings['datetime_format']:.2f} s "
+        f"(x{timings['datetime_inferred'] / timings['datetime_format']:.1f}), valeurs distinctes "
+        f"{timings['datetime_unique']:.2f} s ({distinct} valeurs pour {n_rows} lignes)"
+    )
+    return timings
+
+
+def run_benchmark(
+    n_rows: int = NUMBER_OF_ROWS,
+    repeats: int = DEFAULT_REPEATS,
+    eras: list = ERAS,
+    shapefile_path: str = ZONES_SHAPEFILE,
+    use_grid: bool = True,
+    work_dir: str = BENCH_DIR,
+) -> dict:
+    """
+    Mesure chaque étape (voir scripts.profiling.profile_transformation) et la transformation
+    complète (run_transformation + écriture, telle qu'en production) pour chaque époque.
+    Chaque mesure est la médiane de `repeats` exécutions.
+    """
+    zones_lazy, zone_grid = load_zones(shapefile_path, with_grid=use_grid)
+    target_schema = generate_modern(0).schema
+    inputs = write_era_files(n_rows, work_dir, eras)
+    output_path = os.path.join(work_dir, "output.parquet")
+
+    results = {}
+    for era, input_path in inputs.items():
+        timings = {}
+        for _ in range(repeats):
+            # Les traces des étapes (PROFILE, plan compilé...) masqueraient le tableau final.
+            with contextlib.redirect_stdout(io.StringIO()):
+                for record in profile_transformation(input_path, output_path, zones_lazy, target_schema, zone_grid):
+                    timings.setdefault(record["stage"], []).append(record["wall_s"])
+
+                start = time.perf_counter()
+                write_partition(
+                    run_transformation(pl.scan_parquet(input_path), zones_lazy, target_schema, zone_grid),
+                    output_path,
+                )
+                timings.setdefault("end_to_end", []).append(time.perf_counter() - start)
+
+        results[era] = {stage: round(statistics.median(values), 4) for stage, values in timings.items()}
+        print(f"{era:<7} : {results[era]['end_to_end']:.2f} s de bout en bout pour {n_rows} lignes")
+
+    results["datetimes"] = run_datetime_benchmark(n_rows, repeats)
+    os.remove(output_path)
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "rows": n_rows,
+        "repeats": repeats,
+        "use_grid": use_grid,
+        "polars": pl.__version__,
+        "results": results,
+    }
+
+
+def compare_to_baseline(run: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """
+    Affiche chaque mesure face au baseline et renvoie les régressions
+    (étapes plus lentes que le baseline de plus de `tolerance`, hors étapes très courtes).
+    """
+    if (run["rows"], run["use_grid"]) != (baseline["rows"], baseline["use_grid"]):
+        print(
+            f"ATTENTION : baseline mesuré avec {baseline['rows']} lignes (grille={baseline['use_grid']}), "
+            f"ce run avec {run['rows']} lignes (grille={run['use_grid']})."
+        )
+
+    print(f"\n--- COMPARAISON AU BASELINE DU {baseline['date']} ---")
+    regressions = []
+    for era, stages in run["results"].items():
+        for stage, seconds in stages.items():
+            reference = baseline["results"].get(era, {}).get(stage)
+            if not reference:
+                print(f"{era:<7} {stage:<17} {seconds:>8.3f} s   (absent du baseline)")
+                continue
+            ratio = seconds / reference
+            flag = ""
+            if max(seconds, reference) < MIN_COMPARABLE_SECONDS:
+                flag = "(trop court pour comparer)"
+            elif ratio > 1 + tolerance:
+                flag = "PLUS LENT"
+                regressions.append({"era": era, "stage": stage, "seconds": seconds, "baseline": reference, "ratio": ratio})
+            elif ratio < 1 - tolerance:
+                flag = "plus rapide"
+            print(f"{era:<7} {stage:<17} {seconds:>8.3f} s   baseline {reference:>8.3f} s   x{ratio:.2f} {flag}")
+    print(f"{len(regressions)} régression(s) au-delà de {tolerance:.0%}.")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la transformation sur des données synthétiques par époque.")
+    parser.add_argument("--rows", type=int, default=NUMBER_OF_ROWS)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--eras", nargs="+", choices=ERAS, default=ERAS)
+    parser.add_argument("--no-grid", action="store_true", help="LocationID par sjoin au lieu de la grille")
+    parser.add_argument("--shapefile", default=ZONES_SHAPEFILE)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="enregistre ce run comme nouveau baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    run = run_benchmark(args.rows, args.repeats, args.eras, args.shapefile, not args.no_grid)
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=4)
+        print(f"Baseline enregistré dans '{args.baseline}'.")
+    else:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(run, json.load(f), args.tolerance)
+        sys.exit(1 if regressions else 0)
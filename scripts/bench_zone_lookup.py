@@ -0,0 +1,99 @@
+import argparse
+import time
+
+import numpy as np
+import polars as pl
+import polars_st as st
+import geopandas as gpd
+
+from scripts.transformation import add_location_ids
+from scripts.zone_index import ZONES_SHAPEFILE, GRID_CELL_SIZE, build_zone_grid
+
+# Nombre de points synthétiques générés par défaut (pickup + dropoff par ligne).
+NUMBER_OF_POINTS = 10_000_000
+
+
+def generate_points(n_points: int, bounds, seed: int = 0) -> pl.DataFrame:
+    """
+    Génère des coordonnées pickup/dropoff synthétiques dans l'emprise des zones,
+    avec une petite part de 0/0 et de nulls comme dans les fichiers 2009-2010.
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+
+    columns = {}
+    for lon_col, lat_col in (("Start_Lon", "Start_Lat"), ("End_Lon", "End_Lat")):
+        lon = rng.uniform(minx, maxx, n_points)
+        lat = rng.uniform(miny, maxy, n_points)
+        zeros = rng.random(n_points) < 0.02
+        lon[zeros] = 0.0
+        lat[zeros] = 0.0
+        columns[lon_col] = lon
+        columns[lat_col] = lat
+
+    df = pl.DataFrame(columns)
+    nulls = pl.Series(rng.random(n_points) < 0.01)
+    return df.with_columns(
+        pl.when(~nulls).then(pl.col("Start_Lon")).alias("Start_Lon"),
+        pl.when(~nulls).then(pl.col("End_Lat")).alias("End_Lat"),
+    )
+
+
+def run_benchmark(n_points: int, cell_size: float, shapefile_path: str = ZONES_SHAPEFILE):
+    """
+    Compare le sjoin et la grille précalculée sur le même jeu de points.
+    Lève AssertionError si les deux chemins ne donnent pas exactement les mêmes LocationID.
+    """
+    zones_gdf = gpd.read_file(shapefile_path).to_crs("EPSG:4326")
+    zones_lazy = st.from_geopandas(zones_gdf).select(["geometry", "LocationID"]).lazy()
+
+    start = time.perf_counter()
+    zone_grid = build_zone_grid(zones_gdf.geometry.to_numpy(), zones_gdf["LocationID"].to_numpy(), cell_size)
+    build_seconds = time.perf_counter() - start
+
+    points = generate_points(n_points, zones_gdf.total_bounds).with_row_index("row_id")
+    print(f"\n{n_points} lignes synthétiques générées ({2 * n_points} points).")
+
+    start = time.perf_counter()
+    by_sjoin = add_location_ids(points.lazy(), zones_lazy).sort("row_id").collect()
+    sjoin_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    by_grid = add_location_ids(points.lazy(), zones_lazy, zone_grid).collect()
+    grid_seconds = time.perf_counter() - start
+
+    mismatches = 0
+    for col in ("PULocationID", "DOLocationID"):
+        mismatches += (by_sjoin[col].cast(pl.Int32).ne_missing(by_grid[col])).sum()
+
+    print("\n--- RÉSULTATS ---")
+    print(f"Construction de la grille : {build_seconds:.2f} s")
+    print(f"Sjoin                     : {sjoin_seconds:.2f} s")
+    print(f"Grille précalculée        : {grid_seconds:.2f} s (x{sjoin_seconds / grid_seconds:.1f})")
+    if by_sjoin.height != by_grid.height:
+        print(f"ATTENTION : le sjoin a renvoyé {by_sjoin.height} lignes au lieu de {by_grid.height}.")
+    print(f"Différences de LocationID : {mismatches}")
+
+    if by_sjoin.height != by_grid.height or mismatches:
+        raise AssertionError(
+            f"La grille et le sjoin divergent : {mismatches} LocationID différent(s), "
+            f"{by_sjoin.height} ligne(s) contre {by_grid.height}."
+        )
+
+    return {
+        "points": n_points,
+        "build_seconds": build_seconds,
+        "sjoin_seconds": sjoin_seconds,
+        "grid_seconds": grid_seconds,
+        "mismatches": int(mismatches),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sjoin vs grille de zones précalculée.")
+    parser.add_argument("--points", type=int, default=NUMBER_OF_POINTS)
+    parser.add_argument("--cell-size", type=float, default=GRID_CELL_SIZE)
+    parser.add_argument("--shapefile", default=ZONES_SHAPEFILE)
+    args = parser.parse_args()
+
+    run_benchmark(args.points, args.cell_size, args.shapefile)
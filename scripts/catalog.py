@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import time
+import argparse
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from scripts.downloader import DEFAULT_TIMEOUT, make_session
+from scripts.download_log import conditional_headers
+
+
+TLC_DATA_PAGE_URL = "https://www.nyc.gov/site/tlc/about/tlc-trip-record-data.page"
+
+# Index des fichiers publiés (type x année x mois), mis en cache localement : tant qu'il
+# a moins de CATALOG_TTL_SECONDS, aucune requête réseau ; ensuite la page n'est
+# retéléchargée que si elle a changé (GET conditionnel, 304 sinon).
+CATALOG_PATH = "data/cache/tlc_catalog.json"
+CATALOG_TTL_SECONDS = 24 * 3600
+
+# ex. .../yellow_tripdata_2024-01.parquet -> ("yellow", "2024", "01")
+TRIPDATA_LINK_PATTERN = re.compile(r"(\w+)_tripdata_(\d{4})-(\d{2})\.parquet$")
+
+
+def parse_catalog(html: str, base_url: str = TLC_DATA_PAGE_URL) -> list:
+    """
+    Fichiers de données d'une page TLC : [{"type", "year", "month", "url"}], triés, une
+    entrée par (type, année, mois). Seuls les liens <type>_tripdata_AAAA-MM.parquet sont
+    retenus ; si un même fichier a plusieurs liens, le premier de la page est gardé
+    (deux URLs pour un fichier donneraient deux téléchargements vers le même chemin local).
+    """
+    files = {}
+    for link_tag in BeautifulSoup(html, "lxml").find_all("a", href=True):
+        # Certains href de la page finissent par des espaces.
+        url = urljoin(base_url, link_tag["href"].strip())
+        match = TRIPDATA_LINK_PATTERN.search(url)
+        if match:
+            trip_type, year, month = match.groups()
+            key = (trip_type, int(year), int(month))
+            files.setdefault(key, {"type": trip_type, "year": int(year), "month": int(month), "url": url})
+    return [files[key] for key in sorted(files)]
+
+
+def read_catalog(path: str = CATALOG_PATH) -> dict:
+    """Catalogue en cache (None s'il n'existe pas ou est illisible)."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_catalog(catalog: dict, path: str = CATALOG_PATH):
+    """Écrit le catalogue (nom temporaire puis renommage)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(catalog, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def refresh_catalog(cached: dict = None, url: str = TLC_DATA_PAGE_URL, session=None, timeout=DEFAULT_TIMEOUT) -> dict:
+    """
+    Télécharge et analyse la page. Si `cached` vient de la même page, la requête est
+    conditionnelle (ETag / Last-Modified) : sur un 304, ses fichiers sont repris tels quels.
+    """
+    session = session or make_session(pool_size=1)
+    cached = cached if cached is not None and cached.get("url") == url else None
+    print(f"Connexion à la page : {url}...")
+    response = session.get(url, headers=conditional_headers(cached), timeout=timeout)
+    if response.status_code == 304:
+        print("Page inchangée depuis la dernière analyse.")
+        return {**cached, "fetched_at": time.time()}
+    response.raise_for_status()
+
+    files = parse_catalog(response.text, url)
+    if not files:
+        print("AVERTISSEMENT : Aucun lien Parquet n'a été trouvé sur la page.")
+    return {
+        "url": url,
+        "fetched_at": time.time(),
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "files": files,
+    }
+
+
+def load_catalog(
+    url: str = TLC_DATA_PAGE_URL,
+    path: str = CATALOG_PATH,
+    ttl: float = CATALOG_TTL_SECONDS,
+    force_refresh: bool = False,
+    session=None,
+) -> dict:
+    """
+    Catalogue des fichiers publiés, depuis le cache s'il est encore frais (aucun accès
+    réseau), sinon rafraîchi puis réécrit. Si la page est injoignable, le cache périmé
+    est utilisé ; sans cache, l'erreur est levée.
+    """
+    cached = read_catalog(path)
+    fresh = cached is not None and cached.get("url") == url and time.time() - cached.get("fetched_at", 0) < ttl
+    if fresh and not force_refresh:
+        return cached
+
+    try:
+        catalog = refresh_catalog(cached, url, session)
+    except Exception as e:
+        if cached is None or cached.get("url") != url:
+            raise
+        print(f"ERREUR : Impossible de rafraîchir le catalogue ({e}), utilisation du cache du {time.ctime(cached['fetched_at'])}.")
+        return cached
+    write_catalog(catalog, path)
+    return catalog
+
+
+def select_files(catalog: dict, types: list = None, start: tuple = None, end: tuple = None) -> list:
+    """
+    Fichiers du catalogue des types demandés (None = tous), dans [start, end]
+    ((année, mois) inclus), ex. select_files(catalog, ["yellow"], (2024, 1), (2024, 6)).
+    """
+    return [
+        entry for entry in catalog["files"]
+        if (types is None or entry["type"] in types)
+        and (start is None or (entry["year"], entry["month"]) >= tuple(start))
+        and (end is None or (entry["year"], entry["month"]) <= tuple(end))
+    ]
+
+
+def select_links(types: list = None, start: tuple = None, end: tuple = None, **catalog_options) -> list:
+    """URLs des fichiers sélectionnés, depuis le catalogue (voir load_catalog pour les options)."""
+    return [entry["url"] for entry in select_files(load_catalog(**catalog_options), types, start, end)]
+
+
+def _year_month(value: str) -> tuple:
+    year, month = value.split("-")
+    return int(year), int(month)
+
+
+if __name__ == "__main__":
+    # python -m scripts.catalog --type yellow --start 2024-01 --end 2024-06
+    # --html <page.html> analyse une page enregistrée, sans réseau ni cache.
+    parser = argparse.ArgumentParser(description="Catalogue des fichiers TLC publiés")
+    parser.add_argument("--type", action="append", dest="types", help="type de fichier (répétable)")
+    parser.add_argument("--start", type=_year_month, help="premier mois, AAAA-MM")
+    parser.add_argument("--end", type=_year_month, help="dernier mois, AAAA-MM")
+    parser.add_argument("--html", help="page TLC enregistrée à analyser")
+    parser.add_argument("--refresh", action="store_true", help="ignore la durée de validité du cache")
+    args = parser.parse_args()
+
+    if args.html:
+        with open(args.html, encoding="utf-8") as f:
+            catalog = {"files": parse_catalog(f.read())}
+    else:
+        catalog = load_catalog(force_refresh=args.refresh)
+
+    selected = select_files(catalog, args.types, args.start, args.end)
+    for entry in selected:
+        print(entry["url"])
+    print(f"\n{len(selected)} fichier(s) sur {len(catalog['files'])} au catalogue.")
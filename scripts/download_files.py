@@ -3,88 +3,50 @@ import random
 import requests
 from urllib.parse import urlparse
 from scripts.find_parquet_links import find_parquet_links,TLC_DATA_PAGE_URL
+from scripts.downloader import download_many, local_path_for
 import os
 import shutil
 
 
-found_links = find_parquet_links(TLC_DATA_PAGE_URL)
-    
-
 DOWNLOAD_DIR = "data/random_samples"
 
 # Le nombre de fichiers que nous voulons télécharger au hasard.
 NUMBER_OF_FILES_TO_DOWNLOAD = 3
 
-def download_files(url_list: list, destination_folder: str):  #!!!!downloads ALL parquet!!!
+def download_files(url_list: list, destination_folder: str, show_metrics: bool = False):  #!!!!downloads ALL parquet!!!
     """
     Télécharge une liste de fichiers depuis leurs URLs vers un dossier de destination.
     
     :param url_list: La liste des URLs des fichiers à télécharger.
     :param destination_folder: Le dossier où sauvegarder les fichiers.
+    :param show_metrics: affiche le débit (Mo/s) de chaque fichier.
     """
     print(f"\n--- Début du téléchargement de {len(url_list)} fichier(s) ---")
     
     # S'assurer que le dossier de destination existe.
     os.makedirs(destination_folder, exist_ok=True)
     
-    for url in url_list:
-        try:
-            # Extrait le nom du fichier depuis l'URL (ex: yellow_tripdata_2024-01.parquet)
-            file_name = os.path.basename(urlparse(url).path)
-            sub_folder = destination_folder + '\\'+ file_name.split('_')[0] + '\\' + file_name.split('_')[-1].split('-')[0]
-            os.makedirs(sub_folder, exist_ok=True)
-            local_path = os.path.join(sub_folder, file_name)
-            
-            print(f"Téléchargement de '{file_name}'...")
-            
-            response = requests.get(url, stream=True)
-            response.raise_for_status() # Lève une erreur si le téléchargement échoue
-            
-            with open(local_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-                    
-            print(f" -> Fichier sauvegardé dans : {local_path}")
-            
-        except requests.exceptions.RequestException as e:
-            print(f"   ERREUR lors du téléchargement de {url} : {e}")
-
-
-
-
-def download_files_sample(all_links: list, num_files: int, destination_folder: str):
+    # Ex: <destination>/yellow/2024/yellow_tripdata_2024-01.parquet
+    jobs = [(url, local_path_for(url, destination_folder)) for url in url_list]
+    return download_many(jobs, show_metrics=show_metrics)
+
+
+
+
+def download_files_sample(all_links: list, num_files: int, destination_folder: str, show_metrics: bool = False):
     """
     en fonction de la liste des urls, telecharcge un sample de x PARQUET
+    (en streaming, par blocs : la mémoire ne dépend pas de la taille des fichiers)
     """
-    
-    
     if not all_links or len(all_links) < num_files:
         print(f"Pas assez de liens trouvés pour télécharger un échantillon de {num_files} fichier(s).")
         return
-
     print(f"\nSélection de {num_files} liens au hasard parmi {len(all_links)} trouvés.")
     links_to_download = random.sample(all_links, k=num_files)
-    
     os.makedirs(destination_folder, exist_ok=True)
-    
     print("--- Début du téléchargement ---")
-    for url in links_to_download:
-        try:
-            file_name = os.path.basename(urlparse(url).path)
-            sub_folder = destination_folder + '\\'+ file_name.split('_')[0] + '\\' + file_name.split('_')[-1].split('-')[0]
-            os.makedirs(sub_folder, exist_ok=True)
-            local_path = os.path.join(sub_folder, file_name)
-            
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            with open(local_path, "wb") as f:
-                f.write(response.content)
-            
-            print(f"Téléchargé : {file_name}")
-            
-        except requests.exceptions.RequestException as e:
-            print(f"   ERREUR lors du téléchargement de {url} : {e}")
+    jobs = [(url, local_path_for(url, destination_folder)) for url in links_to_download]
+    return download_many(jobs, show_metrics=show_metrics)
 
 
 
@@ -4,111 +4,93 @@ import requests
 from urllib.parse import urlparse
 # Assurez-vous que le script find_parquet_links est accessible
 from scripts.find_parquet_links import find_parquet_links, TLC_DATA_PAGE_URL
+from scripts.downloader import (
+    download_many, get_remote_metadata_many, local_path_for, make_session,
+    DEFAULT_DOWNLOAD_WORKERS, DEFAULT_CHUNK_SIZE,
+)
+from scripts.download_log import (
+    open_log, get_entry, record_download, conditional_headers, is_unchanged, DOWNLOAD_LOG_DB,
+)
 import shutil
-import json
-from datetime import datetime
 
 # --- CONFIGURATION ---
 DOWNLOAD_DIR = "data/random_samples"
 NUMBER_OF_FILES_TO_DOWNLOAD = 3
-LOG_FILE = "download_log.json" # Fichier pour tracer les téléchargements
-
-# --- NOUVELLES FONCTIONS : GESTION DU LOG ET DE LA TAILLE ---
-
-def load_log():
-    """Charge le contenu du fichier log. S'il n'existe pas, retourne un dictionnaire vide."""
-    if not os.path.exists(LOG_FILE):
-        return {}
-    try:
-        with open(LOG_FILE, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {}
-
-def update_log(filename, size, log_data):
-    """Met à jour le log avec les informations d'un nouveau fichier téléchargé."""
-    log_data[filename] = {
-        "size": size,
-        "download_date": datetime.now().isoformat()
-    }
-    with open(LOG_FILE, 'w') as f:
-        json.dump(log_data, f, indent=4)
-    print(f"INFO: Log mis à jour pour '{filename}'.")
-
-def get_remote_file_size(url):
-    """Récupère la taille d'un fichier distant en octets sans le télécharger."""
-    try:
-        response = requests.head(url, allow_redirects=True, timeout=10)
-        response.raise_for_status()
-        size = int(response.headers.get('content-length', 0))
-        return size
-    except requests.exceptions.RequestException as e:
-        print(f"   ERREUR: Impossible de récupérer la taille pour {url}. Erreur: {e}")
-        return None
+LOG_FILE = "download_log.json" # Ancien journal JSON, migré dans la base SQLite ci-dessous
+LOG_DB = DOWNLOAD_LOG_DB # Fichier pour tracer les téléchargements (taille, ETag, Last-Modified)
 
 # --- VOS FONCTIONS, MODIFIÉES ---
 
-def download_files(url_list: list, destination_folder: str):
+def download_files(
+    url_list: list,
+    destination_folder: str,
+    workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
     """
     Télécharge une liste de fichiers après avoir vérifié s'ils existent déjà
-    et si leur taille a changé.
+    et s'ils ont changé (ETag / Last-Modified, sinon taille). Les HEAD et les
+    téléchargements sont lancés en parallèle (voir scripts.downloader) ; les GET
+    sont conditionnels, le serveur répond 304 si le fichier n'a pas changé.
     """
     print(f"\n--- Début du processus de téléchargement pour {len(url_list)} fichier(s) ---")
     
-    # Charge le log existant au début de l'opération.
-    download_log = load_log()
+    # Ouvre le journal au début de l'opération (migration du JSON si besoin).
+    download_log = open_log(LOG_DB, LOG_FILE)
     os.makedirs(destination_folder, exist_ok=True)
-    
-    for url in url_list:
-        file_name = os.path.basename(urlparse(url).path)
-        print(f"\n--- Traitement du fichier: {file_name} ---")
 
-        # 1. Vérifier la taille du fichier sur le serveur.
-        remote_size = get_remote_file_size(url)
-        if remote_size is None:
-            continue # Passe au fichier suivant si on ne peut pas obtenir la taille.
+    session = make_session(workers)
+
+    def record(report):
+        # 4. Journal mis à jour dès qu'un fichier est téléchargé : une interruption du lot
+        #    ne fait pas re-télécharger les fichiers déjà terminés.
+        if report["status"] == "OK":
+            head = remote[report["url"]] or {}
+            record_download(
+                download_log,
+                os.path.basename(report["path"]),
+                report["url"],
+                report["size"],
+                report["etag"] or head.get("etag"),
+                report["last_modified"] or head.get("last_modified"),
+            )
 
-        # 2. Vérifier si le fichier est dans le log et si la taille correspond.
-        if file_name in download_log:
-            logged_size = download_log[file_name].get("size")
-            if remote_size == logged_size:
-                print(f"IGNORÉ: Le fichier '{file_name}' existe déjà et sa taille est identique.")
+    try:
+        # 1. Métadonnées des fichiers sur le serveur (HEAD en parallèle).
+        remote = get_remote_metadata_many(url_list, workers=workers, session=session)
+
+        jobs = []
+        for url in url_list:
+            file_name = os.path.basename(urlparse(url).path)
+            entry = get_entry(download_log, file_name)
+
+            # 2. Comparer avec le journal.
+            if is_unchanged(entry, remote[url]):
+                print(f"IGNORÉ: Le fichier '{file_name}' existe déjà et n'a pas changé.")
                 continue
+            if entry is None:
+                print(f"NOUVEAU: Le fichier '{file_name}' va être téléchargé.")
+            elif remote[url] is None:
+                print(f"VÉRIFICATION: HEAD impossible pour '{file_name}', GET conditionnel.")
             else:
-                print(f"MISE À JOUR: La taille de '{file_name}' a changé. Re-téléchargement...")
-        else:
-            print(f"NOUVEAU: Le fichier '{file_name}' va être téléchargé.")
+                print(f"MISE À JOUR: '{file_name}' a changé. Re-téléchargement...")
 
-        # 3. Si la vérification passe, procéder au téléchargement.
-        try:
-            # Votre logique de création de sous-dossiers (améliorée avec os.path.join)
-            type_folder = file_name.split('_')[0]
-            year_folder = file_name.split('_')[-1].split('-')[0]
-            sub_folder = os.path.join(destination_folder, type_folder, year_folder)
-            os.makedirs(sub_folder, exist_ok=True)
-            local_path = os.path.join(sub_folder, file_name)
-            
-            print(f"Téléchargement de '{file_name}'...")
-            
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            with open(local_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            print(f" -> Fichier sauvegardé dans : {local_path}")
-            # 4. Mettre à jour le log après un téléchargement réussi.
-            update_log(file_name, remote_size, download_log)
-            
-        except requests.exceptions.RequestException as e:
-            print(f"   ERREUR lors du téléchargement de {url} : {e}")
+            jobs.append((url, local_path_for(url, destination_folder), conditional_headers(entry)))
+
+        # 3. Téléchargement des fichiers retenus (en parallèle, via des fichiers .part).
+        print(f"\nTéléchargement de {len(jobs)} fichier(s) avec {workers} connexion(s)...")
+        reports = download_many(jobs, workers=workers, chunk_size=chunk_size, session=session, on_done=record)
+    finally:
+        session.close()
+        download_log.close()
+    return reports
 
 # Le reste de vos fonctions (download_files_sample, empty_folder) reste inchangé.
 # ... (vous pouvez les garder ici si vous en avez besoin) ...
-def download_files_sample(all_links: list, num_files: int, destination_folder: str):
+def download_files_sample(all_links: list, num_files: int, destination_folder: str, show_metrics: bool = False):
     """
     en fonction de la liste des urls, telecharcge un sample de x PARQUET
+    (en streaming, par blocs : la mémoire ne dépend pas de la taille des fichiers)
     """
     if not all_links or len(all_links) < num_files:
         print(f"Pas assez de liens trouvés pour télécharger un échantillon de {num_files} fichier(s).")
@@ -117,19 +99,8 @@ def download_files_sample(all_links: list, num_files: int, destination_folder: s
     links_to_download = random.sample(all_links, k=num_files)
     os.makedirs(destination_folder, exist_ok=True)
     print("--- Début du téléchargement ---")
-    for url in links_to_download:
-        try:
-            file_name = os.path.basename(urlparse(url).path)
-            sub_folder = os.path.join(destination_folder, file_name.split('_')[0], file_name.split('_')[-1].split('-')[0])
-            os.makedirs(sub_folder, exist_ok=True)
-            local_path = os.path.join(sub_folder, file_name)
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            with open(local_path, "wb") as f:
-                f.write(response.content) # Attention, .content peut consommer bcp de mémoire
-            print(f"Téléchargé : {file_name}")
-        except requests.exceptions.RequestException as e:
-            print(f"   ERREUR lors du téléchargement de {url} : {e}")
+    jobs = [(url, local_path_for(url, destination_folder)) for url in links_to_download]
+    return download_many(jobs, show_metrics=show_metrics)
 
 
 def empty_folder(folder_path: str):
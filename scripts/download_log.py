@@ -0,0 +1,106 @@
+import os
+import json
+import sqlite3
+from datetime import datetime
+
+
+# Journal des téléchargements : une ligne par fichier, mise à jour en place (UPSERT).
+DOWNLOAD_LOG_DB = "download_log.sqlite"
+
+# Ancien journal JSON, importé une seule fois à la création de la base.
+LEGACY_LOG_FILE = "download_log.json"
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS downloads (
+    file_name     TEXT PRIMARY KEY,
+    url           TEXT,
+    size          INTEGER,
+    etag          TEXT,
+    last_modified TEXT,
+    download_date TEXT
+)
+"""
+
+
+def open_log(db_path: str = DOWNLOAD_LOG_DB, legacy_json: str = LEGACY_LOG_FILE) -> sqlite3.Connection:
+    """
+    Ouvre (ou crée) le journal SQLite. À la création, les entrées de l'ancien
+    download_log.json sont reprises (taille seulement : pas d'ETag connu pour elles).
+    """
+    is_new = not os.path.exists(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute(_CREATE_TABLE)
+
+    if is_new and legacy_json and os.path.exists(legacy_json):
+        try:
+            with open(legacy_json, 'r') as f:
+                legacy = json.load(f)
+        except json.JSONDecodeError:
+            legacy = {}
+        conn.executemany(
+            "INSERT OR IGNORE INTO downloads (file_name, size, download_date) VALUES (?, ?, ?)",
+            [(name, entry.get("size"), entry.get("download_date")) for name, entry in legacy.items()],
+        )
+        print(f"INFO: {len(legacy)} entrée(s) reprise(s) depuis '{legacy_json}'.")
+
+    conn.commit()
+    return conn
+
+
+def get_entry(conn: sqlite3.Connection, file_name: str) -> dict:
+    """Entrée du journal pour un fichier, ou None s'il n'a jamais été téléchargé."""
+    row = conn.execute("SELECT * FROM downloads WHERE file_name = ?", (file_name,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def record_download(
+    conn: sqlite3.Connection,
+    file_name: str,
+    url: str,
+    size: int,
+    etag: str = None,
+    last_modified: str = None,
+):
+    """Enregistre (ou met à jour) un téléchargement réussi : une seule ligne écrite, quelle que soit la taille du journal."""
+    conn.execute(
+        """
+        INSERT INTO downloads (file_name, url, size, etag, last_modified, download_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(file_name) DO UPDATE SET
+            url = excluded.url,
+            size = excluded.size,
+            etag = excluded.etag,
+            last_modified = excluded.last_modified,
+            download_date = excluded.download_date
+        """,
+        (file_name, url, size, etag, last_modified, datetime.now().isoformat()),
+    )
+    conn.commit()
+    print(f"INFO: Log mis à jour pour '{file_name}'.")
+
+
+def conditional_headers(entry: dict) -> dict:
+    """En-têtes If-None-Match / If-Modified-Since pour un GET conditionnel (304 si inchangé)."""
+    if entry is None:
+        return {}
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def is_unchanged(entry: dict, remote: dict) -> bool:
+    """
+    Compare l'entrée du journal aux métadonnées d'un HEAD : ETag d'abord, puis
+    Last-Modified, et la taille seulement si le serveur ne donne ni l'un ni l'autre.
+    """
+    if entry is None or remote is None:
+        return False
+    if entry.get("etag") and remote.get("etag"):
+        return entry["etag"] == remote["etag"]
+    if entry.get("last_modified") and remote.get("last_modified"):
+        return entry["last_modified"] == remote["last_modified"] and entry.get("size") == remote.get("size")
+    return entry.get("size") is not None and entry.get("size") == remote.get("size")
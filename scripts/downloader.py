@@ -0,0 +1,285 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Taille des blocs lus sur le réseau (1 Mo au lieu de 8 Ko : beaucoup moins d'appels write()).
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Nombre de téléchargements simultanés.
+DEFAULT_DOWNLOAD_WORKERS = 4
+
+# (connexion, lecture) en secondes.
+DEFAULT_TIMEOUT = (10, 60)
+
+PART_SUFFIX = ".part"
+# À côté du .part : ETag / Last-Modified de la version en cours de téléchargement (If-Range).
+PART_VALIDATOR_SUFFIX = ".part.json"
+
+
+def make_session(pool_size: int = DEFAULT_DOWNLOAD_WORKERS) -> requests.Session:
+    """Session HTTP partagée : connexions réutilisées (keep-alive) et quelques retries sur les erreurs serveur."""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=(500, 502, 503, 504), allowed_methods=("HEAD", "GET"))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def local_path_for(url: str, destination_folder: str) -> str:
+    """Chemin local d'un fichier : <destination>/<type>/<année>/<nom du fichier>."""
+    file_name = os.path.basename(urlparse(url).path)
+    type_folder = file_name.split('_')[0]
+    year_folder = file_name.split('_')[-1].split('-')[0]
+    return os.path.join(destination_folder, type_folder, year_folder, file_name)
+
+
+def get_remote_metadata(session: requests.Session, url: str, timeout=DEFAULT_TIMEOUT) -> dict:
+    """HEAD d'un fichier distant : taille, ETag et Last-Modified (None si la requête échoue)."""
+    try:
+        response = session.head(url, allow_redirects=True, timeout=timeout)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"   ERREUR: Impossible de récupérer les métadonnées pour {url}. Erreur: {e}")
+        return None
+    length = response.headers.get("content-length")
+    return {
+        "size": int(length) if length is not None else None,
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+    }
+
+
+def get_remote_metadata_many(
+    urls: list,
+    workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    session: requests.Session = None,
+) -> dict:
+    """HEAD de plusieurs fichiers en parallèle : {url: métadonnées ou None}."""
+    if not urls:
+        return {}
+    workers = max(1, min(workers, len(urls)))
+    own_session = session is None
+    if own_session:
+        session = make_session(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(urls, executor.map(lambda url: get_remote_metadata(session, url), urls)))
+    finally:
+        if own_session:
+            session.close()
+
+
+def _read_part_validator(local_path: str) -> str:
+    """
+    Valeur If-Range du .part : l'ETag fort de sa version, sinon son Last-Modified
+    (un ETag faible W/"..." n'est pas accepté dans If-Range). None si rien n'est enregistré.
+    """
+    try:
+        with open(local_path + PART_VALIDATOR_SUFFIX) as f:
+            validator = json.load(f)
+    except (OSError, ValueError):
+        return None
+    etag = validator.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validator.get("last_modified")
+
+
+def _write_part_validator(local_path: str, etag: str, last_modified: str):
+    tmp_path = f"{local_path}{PART_VALIDATOR_SUFFIX}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"etag": etag, "last_modified": last_modified}, f)
+    os.replace(tmp_path, local_path + PART_VALIDATOR_SUFFIX)
+
+
+def _remove_part_validator(local_path: str):
+    if os.path.exists(local_path + PART_VALIDATOR_SUFFIX):
+        os.remove(local_path + PART_VALIDATOR_SUFFIX)
+
+
+def download_file(
+    session: requests.Session,
+    url: str,
+    local_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timeout=DEFAULT_TIMEOUT,
+    conditional: dict = None,
+) -> dict:
+    """
+    Télécharge un fichier dans `<local_path>.part`, puis le renomme en `local_path`.
+
+    Si un `.part` existe déjà (transfert interrompu), on demande seulement la suite avec
+    un en-tête Range, et If-Range avec l'ETag (ou le Last-Modified) de la version du `.part`.
+    Si le fichier a changé entre-temps, ou si le serveur ignore le Range, il renvoie 200 et
+    on repart de zéro : le `.part` n'est jamais complété avec les octets d'une autre version.
+    Un `.part` sans ETag ni Last-Modified enregistré est recommencé.
+    Le fichier final n'apparaît qu'une fois la taille vérifiée, il n'est donc jamais tronqué.
+    Le corps est écrit bloc par bloc : la mémoire utilisée reste de l'ordre de `chunk_size`.
+    Lève une exception en cas d'erreur ; le `.part` est gardé pour la reprise.
+
+    `conditional` (If-None-Match / If-Modified-Since) rend le GET conditionnel : si le
+    serveur répond 304, rien n'est téléchargé et le statut du rapport est "INCHANGÉ".
+    Il n'est pas envoyé lors d'une reprise, qui concerne forcément un fichier à récupérer.
+    """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    part_path = local_path + PART_SUFFIX
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if_range = _read_part_validator(local_path) if offset else None
+    if offset and if_range is None:
+        print(f"   Version du .part inconnue pour '{os.path.basename(local_path)}', nouveau téléchargement complet.")
+        offset = 0
+    if offset:
+        headers = {"Range": f"bytes={offset}-", "If-Range": if_range}
+    else:
+        headers = dict(conditional or {})
+
+    with session.get(url, stream=True, headers=headers, timeout=timeout) as response:
+        content_range = response.headers.get("content-range") or ""
+        if response.status_code == 416 or (
+            response.status_code == 206 and not content_range.startswith(f"bytes {offset}-")
+        ):
+            # Le .part ne correspond plus au fichier distant (fichier republié) : on recommence.
+            print(f"   Reprise impossible pour '{os.path.basename(local_path)}', nouveau téléchargement complet.")
+            os.remove(part_path)
+            _remove_part_validator(local_path)
+            return download_file(session, url, local_path, chunk_size, timeout, conditional)
+        if response.status_code == 304:
+            return {
+                "url": url,
+                "path": local_path,
+                "status": "INCHANGÉ",
+                "size": None,
+                "bytes": 0,
+                "seconds": time.perf_counter() - start,
+                "mb_per_s": None,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "error": None,
+            }
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            mode = "ab"
+            print(f"   Reprise de '{os.path.basename(local_path)}' à l'octet {offset}.")
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if response.status_code != 206:
+            mode = "wb"
+            offset = 0
+            # Version du .part, pour une éventuelle reprise (If-Range).
+            _write_part_validator(local_path, etag, last_modified)
+        length = response.headers.get("content-length")
+        expected_size = offset + int(length) if length is not None else None
+
+        received = 0
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                received += len(chunk)
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        raise IOError(f"Transfert incomplet : {size} octet(s) reçus sur {expected_size}")
+
+    os.replace(part_path, local_path)
+    _remove_part_validator(local_path)
+    seconds = time.perf_counter() - start
+    return {
+        "url": url,
+        "path": local_path,
+        "status": "OK",
+        "size": size,
+        "bytes": received,
+        "seconds": seconds,
+        "mb_per_s": received / 1e6 / seconds if seconds > 0 else None,
+        "etag": etag,
+        "last_modified": last_modified,
+        "error": None,
+    }
+
+
+def download_many(
+    jobs: list,
+    workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    session: requests.Session = None,
+    show_metrics: bool = False,
+    on_done=None,
+) -> list:
+    """
+    Télécharge plusieurs fichiers en parallèle (pool de threads, une session partagée).
+
+    :param jobs: liste de tuples (url, chemin local) ou (url, chemin local, en-têtes conditionnels).
+    :param show_metrics: affiche le débit (Mo/s) de chaque fichier et un bilan.
+    :param on_done: fonction appelée avec le rapport de chaque fichier dès qu'il est terminé,
+                    dans le thread appelant (ex. mise à jour du journal des téléchargements).
+    :return: un rapport par fichier (statut, taille, secondes, Mo/s, erreur).
+    """
+    if not jobs:
+        return []
+
+    workers = max(1, min(workers, len(jobs)))
+    own_session = session is None
+    if own_session:
+        session = make_session(workers)
+
+    reports = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(download_file, session, job[0], job[1], chunk_size, conditional=job[2] if len(job) > 2 else None): job[:2]
+                for job in jobs
+            }
+            for future in as_completed(futures):
+                url, local_path = futures[future]
+                try:
+                    report = future.result()
+                    if report["status"] == "INCHANGÉ":
+                        print(f"IGNORÉ: '{os.path.basename(local_path)}' n'a pas changé sur le serveur (304).")
+                    else:
+                        print(f" -> Fichier sauvegardé dans : {local_path}")
+                    if show_metrics and report["status"] == "OK":
+                        print(f"    {report['bytes'] / 1e6:.1f} Mo en {report['seconds']:.1f} s ({report['mb_per_s']:.1f} Mo/s)")
+                except (requests.exceptions.RequestException, OSError) as e:
+                    report = {
+                        "url": url,
+                        "path": local_path,
+                        "status": "ERREUR",
+                        "size": None,
+                        "bytes": None,
+                        "seconds": None,
+                        "mb_per_s": None,
+                        "etag": None,
+                        "last_modified": None,
+                        "error": str(e),
+                    }
+                    print(f"   ERREUR lors du téléchargement de {url} : {e}")
+                reports.append(report)
+                if on_done is not None:
+                    on_done(report)
+    finally:
+        if own_session:
+            session.close()
+
+    if show_metrics:
+        print_download_metrics(reports)
+    return reports
+
+
+def print_download_metrics(reports: list):
+    """Affiche le volume total téléchargé et le débit moyen par fichier."""
+    ok = [r for r in reports if r["status"] == "OK"]
+    total_mb = sum(r["bytes"] for r in ok) / 1e6
+    rates = [r["mb_per_s"] for r in ok if r["mb_per_s"] is not None]
+    mean_rate = sum(rates) / len(rates) if rates else 0.0
+    print(f"{len(ok)}/{len(reports)} fichier(s) téléchargé(s), {total_mb:.1f} Mo, {mean_rate:.1f} Mo/s en moyenne par fichier.")
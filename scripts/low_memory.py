@@ -0,0 +1,239 @@
+import os
+import glob
+import shutil
+import threading
+import resource
+from contextlib import contextmanager
+
+import polars as pl
+
+from scripts.output_writer import DEFAULT_SORT_COLUMN, write_partition
+
+
+# Mode basse mémoire : un gros fichier est transformé par tranches de lignes, chaque
+# tranche est écrite dans un fichier "part", puis les parts sont réunies en streaming.
+DEFAULT_BATCH_ROWS = 2_000_000
+# En dessous, on renonce : le budget mémoire est trop petit pour ce fichier.
+MIN_BATCH_ROWS = 50_000
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss_mb() -> float:
+    """Mémoire résidente actuelle du process, en Mo (/proc sous Linux, sinon le pic connu)."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def track_peak_rss(interval: float = RSS_SAMPLE_INTERVAL):
+    """
+    Mesure le pic de mémoire résidente pendant le bloc (échantillonnage dans un thread).
+    Le dictionnaire renvoyé contient "peak_mb" à la sortie du bloc.
+    """
+    stats = {"peak_mb": current_rss_mb()}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            stats["peak_mb"] = max(stats["peak_mb"], current_rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield stats
+    finally:
+        stop.set()
+        sampler.join()
+        stats["peak_mb"] = max(stats["peak_mb"], current_rss_mb())
+
+
+def transform_in_batches(
+    input_path: str,
+    output_path: str,
+    transform,
+    writer_options: dict = None,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    memory_budget_mb: float = None,
+    checkpoint=None,
+) -> dict:
+    """
+    Transforme `input_path` par tranches de `batch_rows` lignes et écrit `output_path`.
+
+    :param transform: fonction LazyFrame -> LazyFrame appliquée à chaque tranche
+                      (ex. run_transformation avec ses zones et son schéma).
+    :param memory_budget_mb: pic de mémoire résidente à ne pas dépasser. Une tranche qui
+                      le dépasse est refaite avec deux fois moins de lignes ; en dessous de
+                      MIN_BATCH_ROWS, MemoryError est levée.
+    :param checkpoint: fonction appelée avant chaque tranche, qui renvoie la fonction
+                      remettant en l'état les compteurs alimentés pendant l'exécution
+                      (qualité, valeurs inconnues...) : elle est appelée quand la tranche
+                      est refaite, pour que ses lignes ne soient pas comptées deux fois.
+
+    Les étapes qui ne peuvent pas s'exécuter en streaming (le sjoin des zones, le tri)
+    ne voient qu'une tranche à la fois. Les parts, triées chacune, sont ensuite fusionnées
+    en streaming (voir merge_sorted_parts) : la sortie est triée comme en mode normal.
+    """
+    writer_options = dict(writer_options or {})
+    source = pl.scan_parquet(input_path)
+    total_rows = source.select(pl.len()).collect(engine="streaming").item()
+
+    if memory_budget_mb is not None and current_rss_mb() > memory_budget_mb:
+        raise MemoryError(
+            f"Budget mémoire de {memory_budget_mb:.0f} Mo déjà dépassé avant la transformation "
+            f"({current_rss_mb():.0f} Mo utilisés)"
+        )
+
+    parts_dir = f"{output_path}.parts"
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+
+    peak_mb = current_rss_mb()
+    offset = 0
+    part_index = 0
+    retries = 0
+    try:
+        while offset < total_rows:
+            part_path = os.path.join(parts_dir, f"part-{part_index:05d}.parquet")
+            restore = checkpoint() if checkpoint is not None else None
+            with track_peak_rss() as rss:
+                write_partition(transform(source.slice(offset, batch_rows)), part_path, **writer_options)
+            peak_mb = max(peak_mb, rss["peak_mb"])
+
+            if memory_budget_mb is not None and rss["peak_mb"] > memory_budget_mb:
+                os.remove(part_path)
+                if restore is not None:
+                    restore()
+                if batch_rows // 2 < MIN_BATCH_ROWS:
+                    raise MemoryError(
+                        f"{input_path} : {rss['peak_mb']:.0f} Mo pour {batch_rows} lignes, "
+                        f"au-delà du budget de {memory_budget_mb:.0f} Mo"
+                    )
+                batch_rows //= 2
+                retries += 1
+                print(f"  - Pic de {rss['peak_mb']:.0f} Mo > budget de {memory_budget_mb:.0f} Mo : tranches de {batch_rows} lignes.")
+                continue
+
+            offset += batch_rows
+            part_index += 1
+            print(f"  - {input_path} : {min(offset, total_rows)}/{total_rows} lignes (pic {rss['peak_mb']:.0f} Mo)")
+
+        # Réunion des parts triées en un seul fichier trié, en streaming.
+        parts = sorted(glob.glob(os.path.join(parts_dir, "part-*.parquet")))
+        if parts:
+            # La fusion garde en mémoire autant de lignes qu'une tranche (déjà passée sous le budget).
+            merge = merge_sorted_parts(parts, output_path, writer_options, memory_budget_mb, batch_rows)
+            peak_mb = max(peak_mb, merge["peak_mb"])
+        else:
+            write_partition(transform(source.clear()), output_path, **writer_options)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    return {"rows": total_rows, "batches": part_index, "batch_rows": batch_rows, "retries": retries, "peak_mb": peak_mb}
+
+
+def _part_chunks(path: str, chunk_rows: int):
+    """Lit un fichier parquet par tranches de `chunk_rows` lignes (seuls les row groups utiles sont lus)."""
+    part = pl.scan_parquet(path)
+    total_rows = part.select(pl.len()).collect().item()
+    for offset in range(0, total_rows, chunk_rows):
+        yield part.slice(offset, chunk_rows).collect()
+
+
+def _write_sorted_runs(parts: list, runs_dir: str, sort_by: str, buffer_rows: int) -> list:
+    """
+    Fusion k-voies des parts (triées par `sort_by`, nulls à la fin) en fichiers "run" :
+    lus dans l'ordre, les runs forment la sortie triée. Chaque part est lue par tranches
+    d'environ buffer_rows / nombre de parts lignes : au plus ~buffer_rows lignes en mémoire.
+
+    À chaque tour, toutes les lignes dont la clé ne dépasse pas la plus petite des
+    dernières clés en mémoire sont écrites (aucune ligne encore non lue ne peut les précéder).
+    Les lignes sans clé sont écrites à part, après toutes les autres.
+    """
+    chunk_rows = max(1, buffer_rows // len(parts))
+    key = pl.col(sort_by)
+    runs, null_runs = [], []
+
+    def write_run(frame: pl.DataFrame, target: list):
+        path = os.path.join(runs_dir, f"run-{len(runs) + len(null_runs):06d}.parquet")
+        frame.write_parquet(path, statistics=False)
+        target.append(path)
+
+    def next_chunk(chunks):
+        # Tranche suivante non vide (lignes avec clé) ; None quand la part est épuisée.
+        for chunk in chunks:
+            nulls = chunk.filter(key.is_null())
+            if nulls.height:
+                write_run(nulls, null_runs)
+            chunk = chunk.filter(key.is_not_null())
+            if chunk.height:
+                return chunk
+        return None
+
+    readers = [_part_chunks(part, chunk_rows) for part in parts]
+    buffers = [next_chunk(chunks) for chunks in readers]
+    active = [i for i, buffer in enumerate(buffers) if buffer is not None]
+    while active:
+        threshold = min(buffers[i].get_column(sort_by)[-1] for i in active)
+        ready = []
+        for i in active:
+            split = buffers[i].get_column(sort_by).search_sorted(threshold, side="right")
+            ready.append(buffers[i].head(split))
+            buffers[i] = buffers[i].slice(split)
+            if buffers[i].height == 0:
+                buffers[i] = next_chunk(readers[i])
+        write_run(pl.concat(ready).sort(sort_by), runs)
+        active = [i for i in active if buffers[i] is not None]
+    return runs + null_runs
+
+
+def merge_sorted_parts(
+    parts: list,
+    output_path: str,
+    writer_options: dict = None,
+    memory_budget_mb: float = None,
+    buffer_rows: int = DEFAULT_BATCH_ROWS,
+) -> dict:
+    """
+    Fusionne des parts triées (même `sort_by` que `writer_options`) en un fichier trié,
+    avec environ `buffer_rows` lignes en mémoire quel que soit le nombre total de lignes
+    (voir _write_sorted_runs ; les runs sont ensuite réunis en streaming, sans nouveau tri).
+
+    Une fusion qui dépasse `memory_budget_mb` est refaite avec deux fois moins de lignes
+    en mémoire ; en dessous de MIN_BATCH_ROWS, MemoryError est levée.
+    """
+    writer_options = dict(writer_options or {})
+    sort_by = writer_options.get("sort_by", DEFAULT_SORT_COLUMN)
+    # Les parts sont déjà triées : pas de nouveau tri (qui chargerait tout le fichier).
+    merge_options = {**writer_options, "sort_by": None}
+    is_sorted = sort_by is not None and sort_by in pl.scan_parquet(parts[0]).collect_schema()
+    runs_dir = f"{output_path}.runs"
+
+    peak_mb = current_rss_mb()
+    retries = 0
+    while True:
+        shutil.rmtree(runs_dir, ignore_errors=True)
+        os.makedirs(runs_dir)
+        try:
+            with track_peak_rss() as rss:
+                runs = _write_sorted_runs(parts, runs_dir, sort_by, buffer_rows) if is_sorted else parts
+                write_partition(pl.scan_parquet(runs), output_path, **merge_options)
+        finally:
+            shutil.rmtree(runs_dir, ignore_errors=True)
+        peak_mb = max(peak_mb, rss["peak_mb"])
+
+        if memory_budget_mb is None or rss["peak_mb"] <= memory_budget_mb:
+            return {"parts": len(parts), "buffer_rows": buffer_rows, "retries": retries, "peak_mb": peak_mb}
+
+        os.remove(output_path)
+        if buffer_rows // 2 < MIN_BATCH_ROWS:
+            raise MemoryError(
+                f"{output_path} : {rss['peak_mb']:.0f} Mo pour fusionner {len(parts)} parts, "
+                f"au-delà du budget de {memory_budget_mb:.0f} Mo"
+            )
+        buffer_rows //= 2
+        retries += 1
+        print(f"  - Fusion : pic de {rss['peak_mb']:.0f} Mo > budget de {memory_budget_mb:.0f} Mo : {buffer_rows} lignes en mémoire.")
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+from scripts.transformation import schema_fingerprint
+
+
+# Manifeste des partitions produites : une ligne par fichier de sortie.
+MANIFEST_DB = "data/manifest.sqlite"
+
+# Modules dont le code détermine le contenu des sorties : les modifier invalide tout le manifeste.
+# (scripts.profiling ne fait que mesurer les étapes : il n'y figure pas.)
+TRANSFORM_MODULES = [
+    "parallel_transform.py",
+    "transformation.py",
+    "zone_index.py",
+    "zone_cache.py",
+    "quality.py",
+    "output_writer.py",
+    "low_memory.py",
+    "rollups.py",
+    "od_matrix.py",
+]
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS partitions (
+    output_path       TEXT PRIMARY KEY,
+    input_path        TEXT,
+    input_size        INTEGER,
+    input_mtime       REAL,
+    input_sha256      TEXT,
+    schema_fingerprint TEXT,
+    transform_version TEXT,
+    rows              INTEGER,
+    processed_at      TEXT
+)
+"""
+
+
+def open_manifest(db_path: str = MANIFEST_DB) -> sqlite3.Connection:
+    """Ouvre (ou crée) le manifeste. Le timeout laisse attendre les autres tâches qui écrivent en même temps."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.execute(_CREATE_TABLE)
+    conn.commit()
+    return conn
+
+
+@lru_cache(maxsize=None)
+def _modules_digest() -> str:
+    digest = hashlib.sha256()
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in TRANSFORM_MODULES:
+        with open(os.path.join(scripts_dir, module), "rb") as f:
+            digest.update(module.encode())
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def transform_version(options: dict = None) -> str:
+    """
+    Version de la logique de transformation : empreinte du code des modules concernés et
+    des réglages qui changent les sorties (`options` : réglages d'écriture, quarantaine,
+    agrégats activés...). Changer l'un ou l'autre fait retraiter toutes les partitions.
+    """
+    digest = hashlib.sha256(_modules_digest().encode())
+    digest.update(json.dumps(options or {}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def file_sha256(path: str) -> str:
+    """sha256 d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def needs_processing(
+    conn: sqlite3.Connection,
+    input_path: str,
+    output_path: str,
+    schema_fp: str,
+    version: str = None,
+) -> str:
+    """
+    Renvoie la raison de (re)traiter une partition, ou None si elle est à jour.
+
+    Taille et date de modification identiques suffisent à considérer l'entrée inchangée ;
+    sinon on compare le sha256 (un fichier simplement recopié n'est pas retraité).
+    `version` : voir transform_version (par défaut, sans réglages).
+    """
+    row = conn.execute("SELECT * FROM partitions WHERE output_path = ?", (output_path,)).fetchone()
+    if row is None:
+        return "nouvelle partition"
+    if not os.path.exists(output_path):
+        return "sortie absente"
+    if row["schema_fingerprint"] != schema_fp:
+        return "schéma cible modifié"
+    if row["transform_version"] != (version or transform_version()):
+        return "code ou réglages de transformation modifiés"
+
+    stat = os.stat(input_path)
+    if stat.st_size == row["input_size"] and stat.st_mtime == row["input_mtime"]:
+        return None
+    if file_sha256(input_path) != row["input_sha256"]:
+        return "fichier d'entrée modifié"
+
+    # Même contenu, autre date : on met juste à jour la date pour éviter de rehacher la prochaine fois.
+    conn.execute(
+        "UPDATE partitions SET input_size = ?, input_mtime = ? WHERE output_path = ?",
+        (stat.st_size, stat.st_mtime, output_path),
+    )
+    conn.commit()
+    return None
+
+
+def record_partition(
+    conn: sqlite3.Connection,
+    input_path: str,
+    output_path: str,
+    schema_fp: str,
+    rows: int,
+    version: str = None,
+):
+    """Enregistre une partition produite avec succès (`version` : voir transform_version)."""
+    stat = os.stat(input_path)
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO partitions
+            (output_path, input_path, input_size, input_mtime, input_sha256,
+             schema_fingerprint, transform_version, rows, processed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            output_path, input_path, stat.st_size, stat.st_mtime, file_sha256(input_path),
+            schema_fp, version or transform_version(), rows, datetime.now().isoformat(),
+        ),
+    )
+    conn.commit()
+
+
+def filter_jobs(jobs: list, target_schema, db_path: str = MANIFEST_DB, options: dict = None) -> list:
+    """
+    Ne garde que les (entrée, sortie) nouvelles ou modifiées depuis leur dernier traitement.
+    `options` : réglages qui changent les sorties, les mêmes que pour record_reports.
+    """
+    schema_fp = schema_fingerprint(target_schema)
+    version = transform_version(options)
+    conn = open_manifest(db_path)
+    try:
+        selected = []
+        for input_path, output_path in jobs:
+            reason = needs_processing(conn, input_path, output_path, schema_fp, version)
+            if reason is None:
+                print(f"À JOUR : {input_path}")
+            else:
+                print(f"À TRAITER ({reason}) : {input_path}")
+                selected.append((input_path, output_path))
+    finally:
+        conn.close()
+    print(f"{len(selected)}/{len(jobs)} partition(s) à traiter.")
+    return selected
+
+
+def record_reports(reports: list, target_schema, db_path: str = MANIFEST_DB, options: dict = None):
+    """Enregistre dans le manifeste les fichiers transformés avec succès (rapports de transform_file)."""
+    schema_fp = schema_fingerprint(target_schema)
+    version = transform_version(options)
+    conn = open_manifest(db_path)
+    try:
+        for report in reports:
+            if report["status"] == "OK":
+                record_partition(conn, report["file"], report["output"], schema_fp, report["rows"], version)
+    finally:
+        conn.close()
@@ -0,0 +1,164 @@
+import os
+import glob
+
+import numpy as np
+import polars as pl
+
+from scripts.output_writer import partition_from_filename
+
+
+# Matrices origine-destination : une case par zone de départ x zone d'arrivée x heure de
+# la semaine (lundi 0h = 0 ... dimanche 23h = 167). LocationID 1..265 -> index 0..264.
+N_ZONES = 265
+HOURS_PER_WEEK = 168
+OD_SHAPE = (N_ZONES, N_ZONES, HOURS_PER_WEEK)
+
+# Un dossier par mois : <OD_ROOT>/year=AAAA/month=MM/<tableau>.npy (memory-mappable).
+OD_ROOT = "data/od_matrix"
+OD_ARRAYS = {
+    "count": np.uint32,
+    "median_minutes": np.float32,
+    "median_fare": np.float32,
+}
+# Origines traitées à la fois lors d'une fusion (limite la mémoire avec beaucoup de mois).
+MERGE_CHUNK_ZONES = 16
+
+
+def _empty(name: str) -> np.ndarray:
+    """Tableau vide : 0 course, médiane inconnue (NaN)."""
+    if name == "count":
+        return np.zeros(OD_SHAPE, dtype=OD_ARRAYS[name])
+    return np.full(OD_SHAPE, np.nan, dtype=OD_ARRAYS[name])
+
+
+def hour_of_week_expr(col: str = "tpep_pickup_datetime") -> pl.Expr:
+    """Heure de la semaine de 0 (lundi 0h) à 167 (dimanche 23h)."""
+    weekday = pl.col(col).dt.weekday().cast(pl.Int16)
+    return (weekday - 1) * 24 + pl.col(col).dt.hour().cast(pl.Int16)
+
+
+def compute_od(trips: pl.LazyFrame) -> dict:
+    """
+    Matrices denses d'un ensemble de courses transformées : nombre de courses, médiane de la
+    durée (minutes) et du tarif par case. Les cases vides ont une médiane NaN ; les courses
+    sans LocationID valide sont ignorées.
+    """
+    cells = (
+        trips.select(
+            pu=pl.col("PULocationID").cast(pl.Int32) - 1,
+            do=pl.col("DOLocationID").cast(pl.Int32) - 1,
+            how=hour_of_week_expr(),
+            minutes=(pl.col("tpep_dropoff_datetime") - pl.col("tpep_pickup_datetime")).dt.total_seconds() / 60,
+            fare=pl.col("fare_amount"),
+        )
+        .filter(
+            pl.col("pu").is_between(0, N_ZONES - 1),
+            pl.col("do").is_between(0, N_ZONES - 1),
+            pl.col("how").is_not_null(),
+        )
+        .group_by("pu", "do", "how")
+        .agg(
+            pl.len().alias("count"),
+            pl.col("minutes").median().alias("median_minutes"),
+            pl.col("fare").median().alias("median_fare"),
+        )
+        .collect(engine="streaming")
+    )
+
+    index = (cells["pu"].to_numpy(), cells["do"].to_numpy(), cells["how"].to_numpy())
+    od = {}
+    for name in OD_ARRAYS:
+        od[name] = _empty(name)
+        od[name][index] = cells[name].to_numpy()
+    return od
+
+
+def save_od(od: dict, directory: str):
+    """Écrit chaque tableau en .npy (nom temporaire puis renommage)."""
+    os.makedirs(directory, exist_ok=True)
+    for name in OD_ARRAYS:
+        tmp_path = os.path.join(directory, f"{os.getpid()}.tmp.{name}.npy")
+        np.save(tmp_path, od[name])
+        os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+
+
+def load_od(directory: str, mmap: bool = True) -> dict:
+    """Ouvre les tableaux d'un mois, en memory-map par défaut (rien n'est lu avant usage)."""
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in OD_ARRAYS}
+
+
+def od_path_for(od_root: str, input_path: str) -> str:
+    """Dossier des matrices du mois d'un fichier TLC."""
+    partition = partition_from_filename(input_path)
+    return os.path.join(od_root, f"year={partition['year']}", f"month={partition['month']:02d}")
+
+
+def write_od(trips_path: str, directory: str) -> int:
+    """Calcule les matrices d'un fichier de courses transformé et remplace celles du mois."""
+    od = compute_od(pl.scan_parquet(trips_path))
+    save_od(od, directory)
+    return int(np.count_nonzero(od["count"]))
+
+
+def od_months(od_root: str = OD_ROOT, start: tuple = None, end: tuple = None) -> list:
+    """Dossiers des mois disponibles, dans [start, end] ((année, mois) inclus)."""
+    months = []
+    for directory in sorted(glob.glob(os.path.join(od_root, "year=*", "month=*"))):
+        year = int(os.path.basename(os.path.dirname(directory)).split("=")[1])
+        month = int(os.path.basename(directory).split("=")[1])
+        if (start is None or (year, month) >= tuple(start)) and (end is None or (year, month) <= tuple(end)):
+            months.append(directory)
+    return months
+
+
+def merge_od(matrices: list) -> dict:
+    """
+    Fusionne plusieurs mois : les comptes s'additionnent, les médianes sont combinées en
+    moyenne pondérée par le nombre de courses de chaque mois (approximation : la médiane
+    exacte demanderait les courses elles-mêmes). Traité par blocs de zones d'origine,
+    les tableaux memory-mappés ne sont jamais chargés en entier.
+    """
+    merged = {name: _empty(name) for name in OD_ARRAYS}
+    medians = [name for name in OD_ARRAYS if name != "count"]
+
+    for first in range(0, N_ZONES, MERGE_CHUNK_ZONES):
+        block = slice(first, first + MERGE_CHUNK_ZONES)
+        count = np.zeros(merged["count"][block].shape, dtype=np.uint64)
+        weighted = {name: np.zeros(count.shape, dtype=np.float64) for name in medians}
+        weights = {name: np.zeros(count.shape, dtype=np.float64) for name in medians}
+
+        for od in matrices:
+            month_count = np.asarray(od["count"][block])
+            count += month_count
+            for name in medians:
+                values = np.asarray(od[name][block], dtype=np.float64)
+                known = ~np.isnan(values) & (month_count > 0)
+                weighted[name][known] += values[known] * month_count[known]
+                weights[name][known] += month_count[known]
+
+        merged["count"][block] = count
+        for name in medians:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                merged[name][block] = np.where(weights[name] > 0, weighted[name] / weights[name], np.nan)
+
+    return merged
+
+
+def load_period(od_root: str = OD_ROOT, start: tuple = None, end: tuple = None) -> dict:
+    """Matrices fusionnées d'une période, ex. load_period(start=(2024, 1), end=(2024, 12))."""
+    months = od_months(od_root, start, end)
+    if not months:
+        raise FileNotFoundError(f"Aucune matrice OD dans '{od_root}' pour la période {start} - {end}")
+    return merge_od([load_od(directory) for directory in months])
+
+
+def select_od(od: dict, pu_ids=None, do_ids=None, hours=None) -> dict:
+    """
+    Sous-matrices pour des LocationID de départ / d'arrivée et des heures de la semaine
+    (None = tout). Renvoie des tableaux (len(pu), len(do), len(hours)).
+    """
+    pu = np.arange(N_ZONES) if pu_ids is None else np.asarray(pu_ids) - 1
+    do = np.arange(N_ZONES) if do_ids is None else np.asarray(do_ids) - 1
+    hw = np.arange(HOURS_PER_WEEK) if hours is None else np.asarray(hours)
+    index = np.ix_(pu, do, hw)
+    return {name: np.asarray(array[index]) for name, array in od.items()}
@@ -0,0 +1,114 @@
+import os
+import re
+
+import polars as pl
+
+
+# Réglages par défaut des fichiers de sortie.
+DEFAULT_COMPRESSION = "zstd"
+DEFAULT_COMPRESSION_LEVEL = 3
+# Lignes par row group : assez petit pour que les stats min/max par row group filtrent bien
+# une plage de dates, assez grand pour garder une bonne compression.
+DEFAULT_ROW_GROUP_SIZE = 250_000
+DEFAULT_SORT_COLUMN = "tpep_pickup_datetime"
+
+# ex. yellow_tripdata_2024-01.parquet -> ("yellow", "2024", "01")
+TRIPDATA_FILE_PATTERN = re.compile(r"(\w+)_tripdata_(\d{4})-(\d{2})")
+
+
+def partition_from_filename(path: str) -> dict:
+    """Type, année et mois d'un fichier TLC d'après son nom."""
+    match = TRIPDATA_FILE_PATTERN.search(os.path.basename(path))
+    if match is None:
+        raise ValueError(f"Nom de fichier inattendu (attendu <type>_tripdata_AAAA-MM) : '{path}'")
+    trip_type, year, month = match.groups()
+    return {"type": trip_type, "year": int(year), "month": int(month)}
+
+
+def partition_path(output_root: str, input_path: str) -> str:
+    """
+    Chemin de sortie dans le dataset partitionné :
+    <output_root>/year=AAAA/month=MM/<nom du fichier d'entrée>.
+    """
+    partition = partition_from_filename(input_path)
+    return os.path.join(
+        output_root,
+        f"year={partition['year']}",
+        f"month={partition['month']:02d}",
+        os.path.basename(input_path),
+    )
+
+
+def write_partition(
+    lazy_df: pl.LazyFrame,
+    output_path: str,
+    compression: str = DEFAULT_COMPRESSION,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    statistics: bool = True,
+    sort_by: str = DEFAULT_SORT_COLUMN,
+):
+    """
+    Écrit une partition triée par `sort_by` : chaque row group couvre alors une plage
+    de dates étroite, et ses statistiques min/max permettent de l'ignorer à la lecture.
+    Le fichier est écrit sous un nom temporaire puis renommé.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if sort_by is not None and sort_by in lazy_df.collect_schema():
+        lazy_df = lazy_df.sort(sort_by, nulls_last=True)
+
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    lazy_df.sink_parquet(
+        tmp_path,
+        compression=compression,
+        compression_level=compression_level,
+        row_group_size=row_group_size,
+        statistics=statistics,
+    )
+    os.replace(tmp_path, output_path)
+
+
+def write_partitions(
+    outputs: dict,
+    compression: str = DEFAULT_COMPRESSION,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    statistics: bool = True,
+    sort_by: str = DEFAULT_SORT_COLUMN,
+):
+    """
+    Écrit plusieurs partitions ({chemin: LazyFrame}) en une seule exécution : la partie de
+    plan qu'elles partagent (mise en cache avec .cache()) n'est calculée qu'une fois.
+    Mêmes réglages et même écriture atomique que write_partition ; une seule sortie est
+    écrite par write_partition.
+
+    Le moteur streaming exécute les sorties ensemble. Une fonction Python du plan
+    (map_batches) ne doit alors utiliser que des opérations Series natives : une requête
+    Polars lancée depuis la fonction attendrait un thread du pool et bloquerait avec
+    POLARS_MAX_THREADS=1.
+    """
+    if len(outputs) == 1:
+        (output_path, lazy_df), = outputs.items()
+        write_partition(lazy_df, output_path, compression, compression_level, row_group_size, statistics, sort_by)
+        return
+
+    sinks = []
+    tmp_paths = {}
+    for output_path, lazy_df in outputs.items():
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if sort_by is not None and sort_by in lazy_df.collect_schema():
+            lazy_df = lazy_df.sort(sort_by, nulls_last=True)
+
+        tmp_paths[output_path] = f"{output_path}.{os.getpid()}.tmp"
+        sinks.append(lazy_df.sink_parquet(
+            tmp_paths[output_path],
+            compression=compression,
+            compression_level=compression_level,
+            row_group_size=row_group_size,
+            statistics=statistics,
+            lazy=True,
+        ))
+
+    pl.collect_all(sinks, engine="streaming")
+    for output_path, tmp_path in tmp_paths.items():
+        os.replace(tmp_path, output_path)
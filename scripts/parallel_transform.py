@@ -0,0 +1,350 @@
+import os
+import time
+import traceback
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import polars as pl
+
+from scripts.low_memory import transform_in_batches
+from scripts.output_writer import partition_path, write_partition, write_partitions
+from scripts.profiling import dump_query_plan, profile_stage, write_profile_report
+from scripts.od_matrix import od_path_for, write_od
+from scripts.quality import (
+    pop_quality_counts, restore_quality_counts, snapshot_quality_counts, split_on_quality, write_quality_report,
+)
+from scripts.rollups import rollup_path_for, write_rollup
+from scripts.transformation import (
+    COORDINATE_COLUMNS, RENAME_MAP, run_transformation, pop_unknown_values, restore_unknown_values,
+    snapshot_unknown_values,
+)
+from scripts.zone_index import ZONES_SHAPEFILE, load_zones, out_of_extent_counts
+
+
+# Nombre de fichiers transformés en même temps par défaut.
+DEFAULT_WORKERS = 4
+
+# Zones chargées une seule fois par process worker (voir _init_worker).
+_WORKER_STATE = {}
+
+
+@contextmanager
+def _polars_thread_budget(threads: int):
+    """
+    POLARS_MAX_THREADS n'est lu qu'à l'import de polars : on le fixe dans l'environnement
+    du parent le temps de lancer les workers, qui en héritent au démarrage.
+    """
+    previous = os.environ.get("POLARS_MAX_THREADS")
+    os.environ["POLARS_MAX_THREADS"] = str(threads)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["POLARS_MAX_THREADS"]
+        else:
+            os.environ["POLARS_MAX_THREADS"] = previous
+
+
+def _init_worker(
+    shapefile_path: str,
+    use_grid: bool,
+    quantize_precision: int,
+    writer_options: dict,
+    low_memory: dict,
+    profile_dir: str,
+    rollup_root: str,
+    od_root: str,
+    quality_dir: str,
+    quarantine_root: str,
+):
+    """Initialisation d'un worker : lecture des zones (et de la grille) une seule fois."""
+    zones_lazy, zone_grid = load_zones(shapefile_path, with_grid=use_grid)
+    _WORKER_STATE.update({
+        "zones_lazy": zones_lazy,
+        "zone_grid": zone_grid,
+        "quantize_precision": quantize_precision,
+        "writer_options": writer_options,
+        "low_memory": low_memory,
+        "profile_dir": profile_dir,
+        "rollup_root": rollup_root,
+        "od_root": od_root,
+        "quality_dir": quality_dir,
+        "quarantine_root": quarantine_root,
+    })
+
+
+def transform_file(
+    input_path: str,
+    output_path: str,
+    target_schema,
+    zones_lazy,
+    zone_grid: dict = None,
+    quantize_precision: int = None,
+    writer_options: dict = None,
+    low_memory: dict = None,
+    profile_dir: str = None,
+    rollup_root: str = None,
+    od_root: str = None,
+    quality_dir: str = None,
+    quarantine_root: str = None,
+) -> dict:
+    """
+    Transforme un fichier et renvoie son rapport (lignes, secondes). Lève en cas d'erreur.
+
+    `writer_options` est passé à scripts.output_writer.write_partition
+    (compression, compression_level, row_group_size, statistics, sort_by).
+
+    `low_memory` ({"batch_rows": ..., "memory_budget_mb": ...}) active le mode basse
+    mémoire : le fichier est traité par tranches (voir scripts.low_memory) ; aucun plan
+    n'est alors construit sur le fichier entier (ni écrit dans `profile_dir`).
+
+    Chaque étape est mesurée (voir scripts.profiling) et listée dans report["stages"].
+    Avec `quantize_precision`, report["zone_cache"] donne le taux de réussite du cache des zones.
+    Avec `profile_dir`, le plan optimisé par Polars y est aussi écrit (<fichier>.plan.txt).
+
+    Avec `rollup_root`, l'agrégat zone x heure x fournisseur x paiement du mois est
+    recalculé à partir de la sortie (voir scripts.rollups) ; avec `od_root`, les matrices
+    origine-destination du mois (voir scripts.od_matrix).
+
+    Avec `quality_dir` ou `quarantine_root`, les règles de scripts.quality sont évaluées
+    pendant la transformation (même lecture, même plan). Le rapport <fichier>.quality.json
+    est écrit dans `quality_dir` ; avec `quarantine_root`, les courses en échec sont écrites
+    dans ce dataset (même découpage year=/month=) au lieu de la sortie. La quarantaine
+    n'est pas appliquée en mode basse mémoire (les règles y sont seulement comptées).
+    """
+    start = time.perf_counter()
+    pop_unknown_values()
+    pop_quality_counts()
+    validate = quality_dir is not None or quarantine_root is not None
+    quarantine_path = partition_path(quarantine_root, input_path) if quarantine_root is not None else None
+    if low_memory is not None and quarantine_path is not None:
+        print(f"Mode basse mémoire : pas de quarantaine pour {input_path}, règles seulement comptées.")
+        quarantine_path = None
+    stages = []
+    file = os.path.basename(input_path)
+    # Taux de réussite du cache des zones (mode quantifié seulement, voir scripts.zone_cache).
+    zone_cache_stats = {}
+
+    def transform(lazy_df):
+        # Avec quarantaine, les règles sont comptées par split_on_quality (branche en échec).
+        return run_transformation(
+            lazy_df, zones_lazy, target_schema, zone_grid, quantize_precision,
+            validate=validate and quarantine_path is None, location_stats=zone_cache_stats,
+        )
+
+    def checkpoint():
+        # Tranche refaite en mode basse mémoire : ses compteurs sont retirés (voir transform_in_batches).
+        quality, unknown, zone_cache = snapshot_quality_counts(), snapshot_unknown_values(), dict(zone_cache_stats)
+
+        def restore():
+            restore_quality_counts(quality)
+            restore_unknown_values(unknown)
+            zone_cache_stats.clear()
+            zone_cache_stats.update(zone_cache)
+
+        return restore
+
+    with profile_stage(stages, "plan", file) as stage:
+        source = pl.scan_parquet(input_path)
+        stage["rows_in"] = source.select(pl.len()).collect().item()
+        has_coordinates = set(COORDINATE_COLUMNS).issubset(RENAME_MAP.get(col, col) for col in source.collect_schema())
+        # En mode basse mémoire, le plan est construit tranche par tranche (transform_in_batches) :
+        # pas de plan sur le fichier entier, dont la préparation lirait tout le fichier
+        # (clés du cache quantifié des zones, par exemple).
+        result = transform(source) if low_memory is None else None
+        if profile_dir is not None and result is not None:
+            dump_query_plan(result, os.path.join(profile_dir, f"{file}.plan.txt"))
+
+    # Lecture, LocationID, valeurs et écriture sont fusionnées par Polars dans cette étape
+    # (scripts.profiling.profile_transformation les mesure séparément).
+    with profile_stage(stages, "transform", file, stages[0]["rows_in"], os.path.getsize(input_path)) as stage:
+        if low_memory is not None:
+            transform_in_batches(input_path, output_path, transform, writer_options, checkpoint=checkpoint, **low_memory)
+        elif quarantine_path is not None:
+            valid, quarantined = split_on_quality(result)
+            write_partitions({output_path: valid, quarantine_path: quarantined}, **(writer_options or {}))
+        else:
+            write_partition(result, output_path, **(writer_options or {}))
+        stage["bytes_written"] = os.path.getsize(output_path)
+
+    with profile_stage(stages, "count", file) as stage:
+        rows = pl.scan_parquet(output_path).select(pl.len()).collect().item()
+        # Points écartés par le préfiltre d'emprise (indicateur de qualité des coordonnées).
+        out_of_extent = out_of_extent_counts(pl.scan_parquet(output_path)) if has_coordinates else {}
+        stage["rows_out"] = rows
+    stages[1]["rows_out"] = rows
+    if any(out_of_extent.values()):
+        print(f"Points hors de l'emprise des zones ({input_path}) : {out_of_extent}")
+
+    rollup_rows = None
+    if rollup_root is not None:
+        with profile_stage(stages, "rollup", file, rows, os.path.getsize(output_path)) as stage:
+            rollup_path = rollup_path_for(rollup_root, input_path)
+            rollup_rows = write_rollup(output_path, rollup_path)
+            stage["rows_out"] = rollup_rows
+            stage["bytes_written"] = os.path.getsize(rollup_path)
+
+    od_cells = None
+    if od_root is not None:
+        with profile_stage(stages, "od_matrix", file, rows, os.path.getsize(output_path)) as stage:
+            od_cells = write_od(output_path, od_path_for(od_root, input_path))
+            stage["rows_out"] = od_cells
+
+    quality = None
+    if validate:
+        quality = {"file": file, **pop_quality_counts(), "quarantine": quarantine_path}
+        if quarantine_path is not None:
+            # Seules les courses en quarantaine sont passées par le comptage.
+            quality["rows_checked"] = rows + quality["rows_failed"]
+        if quality["rows_failed"]:
+            print(f"Courses en échec des règles de qualité ({input_path}) : {quality['rows_failed']} {quality['rules']}")
+        if quality_dir is not None:
+            write_quality_report(quality, os.path.join(quality_dir, f"{file}.quality.json"))
+
+    # Valeurs brutes que values_map n'a pas su normaliser (indicateur de qualité des données).
+    unknown_values = pop_unknown_values()
+    for col, values in unknown_values.items():
+        print(f"Valeurs inconnues dans '{col}' ({input_path}) : {values}")
+
+    return {
+        "file": input_path,
+        "output": output_path,
+        "status": "OK",
+        "rows": rows,
+        "seconds": time.perf_counter() - start,
+        "unknown_values": unknown_values,
+        "out_of_extent": out_of_extent,
+        "rollup_rows": rollup_rows,
+        "od_cells": od_cells,
+        "zone_cache": zone_cache_stats or None,
+        "quality": quality,
+        "stages": stages,
+        "error": None,
+    }
+
+
+def _transform_file(input_path: str, output_path: str, target_schema) -> dict:
+    """Transforme un fichier dans un worker. Une erreur n'affecte que ce fichier."""
+    start = time.perf_counter()
+    try:
+        return transform_file(
+            input_path,
+            output_path,
+            target_schema,
+            _WORKER_STATE["zones_lazy"],
+            _WORKER_STATE["zone_grid"],
+            _WORKER_STATE["quantize_precision"],
+            _WORKER_STATE["writer_options"],
+            _WORKER_STATE["low_memory"],
+            _WORKER_STATE["profile_dir"],
+            _WORKER_STATE["rollup_root"],
+            _WORKER_STATE["od_root"],
+            _WORKER_STATE["quality_dir"],
+            _WORKER_STATE["quarantine_root"],
+        )
+    except Exception as e:
+        return {
+            "file": input_path,
+            "output": output_path,
+            "status": "ERREUR",
+            "rows": None,
+            "seconds": time.perf_counter() - start,
+            "error": f"{e}\n{traceback.format_exc()}",
+        }
+
+
+def run_files_parallel(
+    jobs: list,
+    target_schema,
+    workers: int = DEFAULT_WORKERS,
+    polars_threads: int = None,
+    shapefile_path: str = ZONES_SHAPEFILE,
+    use_grid: bool = True,
+    quantize_precision: int = None,
+    writer_options: dict = None,
+    low_memory: dict = None,
+    profile_dir: str = None,
+    rollup_root: str = None,
+    od_root: str = None,
+    quality_dir: str = None,
+    quarantine_root: str = None,
+) -> list:
+    """
+    Transforme plusieurs fichiers en parallèle dans un pool de process.
+
+    :param jobs: liste de tuples (fichier d'entrée, fichier de sortie).
+    :param workers: nombre de fichiers traités en même temps.
+    :param polars_threads: threads Polars par worker (par défaut : cœurs / workers).
+    :param writer_options: réglages des fichiers de sortie (voir scripts.output_writer).
+    :param low_memory: traitement par tranches sous un budget mémoire (voir scripts.low_memory).
+    :param profile_dir: dossier des plans Polars et du rapport de profilage
+                        (profile_report.json / .csv, une ligne par fichier et par étape).
+    :param rollup_root: racine des agrégats mensuels (voir scripts.rollups).
+    :param od_root: racine des matrices origine-destination mensuelles (voir scripts.od_matrix).
+    :param quality_dir: dossier des rapports qualité par fichier (voir scripts.quality).
+    :param quarantine_root: racine du dataset des courses en échec des règles de qualité.
+    :return: un résumé par fichier (statut, lignes écrites, secondes).
+    """
+    if not jobs:
+        print("Aucun fichier à transformer.")
+        return []
+
+    workers = max(1, min(workers, len(jobs)))
+    if polars_threads is None:
+        polars_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"\n--- Transformation de {len(jobs)} fichier(s) : {workers} worker(s) x {polars_threads} thread(s) Polars ---")
+
+    summary = []
+    # "spawn" : un fork d'un process où Polars tourne déjà peut bloquer sur ses verrous internes.
+    with _polars_thread_budget(polars_threads):
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shapefile_path, use_grid, quantize_precision, writer_options, low_memory, profile_dir, rollup_root, od_root, quality_dir, quarantine_root),
+        ) as executor:
+            futures = {
+                executor.submit(_transform_file, input_path, output_path, target_schema): (input_path, output_path)
+                for input_path, output_path in jobs
+            }
+            for future in as_completed(futures):
+                input_path, output_path = futures[future]
+                try:
+                    report = future.result()
+                except Exception as e:
+                    # Le worker lui-même est mort (mémoire, crash natif...).
+                    report = {
+                        "file": input_path,
+                        "output": output_path,
+                        "status": "ERREUR",
+                        "rows": None,
+                        "seconds": None,
+                        "error": repr(e),
+                    }
+                summary.append(report)
+                if report["status"] == "OK":
+                    print(f"OK     : {input_path} -> {report['rows']} lignes en {report['seconds']:.1f} s")
+                else:
+                    print(f"ERREUR : {input_path} : {report['error']}")
+
+    print_summary(summary)
+    if profile_dir is not None:
+        records = [stage for report in summary for stage in report.get("stages", [])]
+        write_profile_report(records, os.path.join(profile_dir, "profile_report.json"))
+        write_profile_report(records, os.path.join(profile_dir, "profile_report.csv"))
+    return summary
+
+
+def print_summary(summary: list):
+    """Affiche le bilan lignes / secondes par fichier."""
+    print("\n--- BILAN DE LA TRANSFORMATION ---")
+    for report in sorted(summary, key=lambda r: r["file"]):
+        rows = report["rows"] if report["rows"] is not None else "-"
+        seconds = f"{report['seconds']:.1f}" if report["seconds"] is not None else "-"
+        print(f"{report['status']:<7} {os.path.basename(report['file']):<40} {rows:>12} lignes {seconds:>8} s")
+
+    ok = [r for r in summary if r["status"] == "OK"]
+    failed = len(summary) - len(ok)
+    total_rows = sum(r["rows"] for r in ok)
+    print(f"{len(ok)} fichier(s) OK, {failed} en erreur, {total_rows} lignes écrites.")
@@ -0,0 +1,126 @@
+import os
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+import polars as pl
+
+from scripts.low_memory import track_peak_rss
+from scripts.output_writer import write_partition
+from scripts.transformation import add_location_ids, compile_plan, resolve_datetime_formats
+
+
+# Colonnes des rapports CSV (mêmes clés que les enregistrements de profile_stage).
+PROFILE_FIELDS = [
+    "file", "stage", "wall_s", "cpu_s", "rows_in", "rows_out",
+    "bytes_read", "bytes_written", "peak_rss_mb",
+]
+
+
+@contextmanager
+def profile_stage(records: list, stage: str, file: str = None, rows_in: int = None, bytes_read: int = None):
+    """
+    Mesure une étape : temps réel, temps CPU du process (tous les threads Polars compris)
+    et pic de mémoire résidente. Le dictionnaire renvoyé peut être complété dans le bloc
+    (rows_out, bytes_written...) ; il est ajouté à `records` et affiché en une ligne JSON.
+    """
+    record = {
+        "file": file,
+        "stage": stage,
+        "rows_in": rows_in,
+        "rows_out": None,
+        "bytes_read": bytes_read,
+        "bytes_written": None,
+    }
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    with track_peak_rss() as rss:
+        yield record
+    record["wall_s"] = round(time.perf_counter() - wall_start, 4)
+    record["cpu_s"] = round(time.process_time() - cpu_start, 4)
+    record["peak_rss_mb"] = round(rss["peak_mb"], 1)
+    records.append(record)
+    print("PROFILE " + json.dumps(record))
+
+
+def write_profile_report(records: list, path: str):
+    """Écrit les enregistrements en JSON ou en CSV selon l'extension de `path`."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=PROFILE_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, "w") as f:
+            json.dump(records, f, indent=4)
+    print(f"Rapport de profilage écrit dans '{path}' ({len(records)} étape(s)).")
+
+
+def dump_query_plan(lazy_df: pl.LazyFrame, path: str):
+    """Écrit le plan optimisé par Polars (explain) dans un fichier texte."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        f.write(lazy_df.explain(optimized=True))
+
+
+def profile_transformation(
+    input_path: str,
+    output_path: str,
+    zones_lazy,
+    target_schema,
+    zone_grid: dict = None,
+    quantize_precision: int = None,
+    writer_options: dict = None,
+    records: list = None,
+) -> list:
+    """
+    Exécute run_transformation étape par étape, en matérialisant chaque étape, pour savoir
+    où part le temps : lecture, LocationID (sjoin ou grille), valeurs + types (dont le
+    parsing des dates), écriture. Plus lent qu'un run normal (pas de fusion entre étapes) :
+    à utiliser pour le diagnostic, pas en production.
+    """
+    records = [] if records is None else records
+    file = os.path.basename(input_path)
+
+    with profile_stage(records, "read", file, bytes_read=os.path.getsize(input_path)) as stage:
+        data = pl.read_parquet(input_path)
+        stage["rows_out"] = data.height
+
+    with profile_stage(records, "plan", file, rows_in=data.height) as stage:
+        plan = compile_plan(data.schema, target_schema, resolve_datetime_formats(data.lazy()))
+        renamed = data.rename(plan["rename_map"])
+        stage["rows_out"] = renamed.height
+
+    with profile_stage(records, "location_ids", file, rows_in=renamed.height) as stage:
+        located = add_location_ids(renamed.lazy(), zones_lazy, zone_grid, quantize_precision).collect()
+        stage["rows_out"] = located.height
+
+    with profile_stage(records, "values_and_types", file, rows_in=located.height) as stage:
+        result = located.lazy().select(plan["exprs"]).collect()
+        stage["rows_out"] = result.height
+
+    with profile_stage(records, "write", file, rows_in=result.height) as stage:
+        write_partition(result.lazy(), output_path, **(writer_options or {}))
+        stage["rows_out"] = result.height
+        stage["bytes_written"] = os.path.getsize(output_path)
+
+    return records
+
+
+if __name__ == "__main__":
+    # python -m scripts.profiling <fichier d'entrée> <fichier de schéma cible> <rapport .json|.csv>
+    import sys
+    from scripts.zone_index import load_zones
+
+    input_file, schema_file, report_path = sys.argv[1:4]
+    zones_lazy, zone_grid = load_zones()
+    records = profile_transformation(
+        input_file,
+        os.path.join(os.path.dirname(report_path) or ".", "profile_output.parquet"),
+        zones_lazy,
+        pl.scan_parquet(schema_file).collect_schema(),
+        zone_grid,
+    )
+    write_profile_report(records, report_path)
@@ -0,0 +1,131 @@
+import os
+import json
+import threading
+
+import polars as pl
+
+
+# Règles de qualité, évaluées sur les colonnes du schéma cible : une course est en échec
+# dès qu'une règle est vraie (une valeur manquante ne fait échouer que les règles *_null).
+QUALITY_RULES = {
+    "negative_fare": pl.col("fare_amount") < 0,
+    "negative_total": pl.col("total_amount") < 0,
+    "dropoff_before_pickup": pl.col("tpep_dropoff_datetime") < pl.col("tpep_pickup_datetime"),
+    "zero_distance": pl.col("trip_distance") == 0,
+    "pu_location_null": pl.col("PULocationID").is_null(),
+    "do_location_null": pl.col("DOLocationID").is_null(),
+}
+
+# Colonne ajoutée au plan par add_quality_flag (True = au moins une règle en échec).
+QUALITY_FLAG_COLUMN = "_quality_failed"
+
+# Compteurs des règles depuis le dernier pop_quality_counts : {"rows_checked", "rows_failed", "rules"}.
+# Alimentés pendant l'exécution du plan, batch par batch (mêmes principes que
+# scripts.transformation.pop_unknown_values).
+_QUALITY_COUNTS = {}
+_QUALITY_LOCK = threading.Lock()
+
+
+def pop_quality_counts() -> dict:
+    """Renvoie les compteurs accumulés depuis le dernier appel et vide le registre."""
+    with _QUALITY_LOCK:
+        counts = {
+            "rows_checked": _QUALITY_COUNTS.get("rows_checked", 0),
+            "rows_failed": _QUALITY_COUNTS.get("rows_failed", 0),
+            "rules": dict(_QUALITY_COUNTS.get("rules", {})),
+        }
+        _QUALITY_COUNTS.clear()
+    return counts
+
+
+def snapshot_quality_counts() -> dict:
+    """Copie des compteurs en cours, à rendre à restore_quality_counts."""
+    with _QUALITY_LOCK:
+        return {**_QUALITY_COUNTS, "rules": dict(_QUALITY_COUNTS.get("rules", {}))}
+
+
+def restore_quality_counts(snapshot: dict):
+    """Remet les compteurs dans l'état de `snapshot` (ex. tranche refaite en mode basse mémoire)."""
+    with _QUALITY_LOCK:
+        _QUALITY_COUNTS.clear()
+        _QUALITY_COUNTS.update(snapshot, rules=dict(snapshot.get("rules", {})))
+
+
+def _applicable_rules(lazy_df: pl.LazyFrame) -> dict:
+    """Règles dont toutes les colonnes existent dans le LazyFrame (valeur manquante = règle respectée)."""
+    schema = lazy_df.collect_schema()
+    return {
+        name: expr.fill_null(False)
+        for name, expr in QUALITY_RULES.items()
+        if all(col in schema for col in expr.meta.root_names())
+    }
+
+
+def _tally(names: list):
+    """
+    Fonction de batch : compte les échecs de chaque règle et renvoie le drapeau par ligne.
+    Uniquement des opérations Series natives : une requête Polars lancée depuis la fonction
+    (DataFrame.select, sum sur un DataFrame...) attend un thread du pool que le plan occupe
+    déjà, et bloque avec un seul thread.
+    """
+    def apply(rules: pl.Series) -> pl.Series:
+        frame = rules.struct.unnest()
+        columns = {name: frame.get_column(name) for name in names}
+        failed = columns[names[0]]
+        for name in names[1:]:
+            failed = failed | columns[name]
+        with _QUALITY_LOCK:
+            _QUALITY_COUNTS["rows_checked"] = _QUALITY_COUNTS.get("rows_checked", 0) + len(failed)
+            _QUALITY_COUNTS["rows_failed"] = _QUALITY_COUNTS.get("rows_failed", 0) + int(failed.sum())
+            seen = _QUALITY_COUNTS.setdefault("rules", {name: 0 for name in names})
+            for name, column in columns.items():
+                seen[name] = seen.get(name, 0) + int(column.sum())
+        return failed
+
+    return apply
+
+
+def count_rule_failures(lazy_df: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Relève les compteurs des règles (pop_quality_counts) sur chaque ligne qui traverse le
+    plan, sans en retirer aucune : le contrôle est fait pendant l'écriture, pas de relecture.
+    Le filtre (toujours vrai) garde le contrôle dans le plan, que Polars élaguerait sinon.
+    """
+    rules = _applicable_rules(lazy_df)
+    if not rules:
+        return lazy_df
+    tap = pl.struct(**rules).map_batches(_tally(list(rules)), return_dtype=pl.Boolean, is_elementwise=True)
+    return lazy_df.filter(tap.is_not_null())
+
+
+def add_quality_flag(lazy_df: pl.LazyFrame) -> pl.LazyFrame:
+    """Ajoute QUALITY_FLAG_COLUMN : True si au moins une règle applicable est en échec."""
+    rules = _applicable_rules(lazy_df)
+    flag = pl.any_horizontal(list(rules.values())) if rules else pl.lit(False)
+    return lazy_df.with_columns(flag.alias(QUALITY_FLAG_COLUMN))
+
+
+def split_on_quality(lazy_df: pl.LazyFrame) -> tuple:
+    """
+    (courses valides, courses en quarantaine), sans QUALITY_FLAG_COLUMN. Le plan commun est
+    mis en cache : écrites ensemble (scripts.output_writer.write_partitions), les deux
+    sorties ne lisent et ne transforment les données qu'une fois.
+
+    Les compteurs ne sont relevés que sur la branche de quarantaine (toutes les courses en
+    échec y passent) : ils restent justes même si le moteur exécute le plan commun une fois
+    par sortie. rows_checked y vaut donc le nombre de courses en quarantaine.
+    """
+    flagged = add_quality_flag(lazy_df).cache()
+    failed = pl.col(QUALITY_FLAG_COLUMN)
+    valid = flagged.filter(~failed).drop(QUALITY_FLAG_COLUMN)
+    quarantined = count_rule_failures(flagged.filter(failed).drop(QUALITY_FLAG_COLUMN))
+    return valid, quarantined
+
+
+def write_quality_report(report: dict, path: str):
+    """Écrit le rapport qualité d'un fichier en JSON (nom temporaire puis renommage)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=4)
+    os.replace(tmp_path, path)
@@ -0,0 +1,139 @@
+import os
+import re
+import glob
+from datetime import date, datetime
+
+import polars as pl
+
+try:
+    # Facultatif : lecture des statistiques min/max des row groups pour écarter des fichiers
+    # entiers avant que Polars ne les ouvre.
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+# Racine du dataset partitionné écrit par le pipeline (voir scripts.output_writer.partition_path).
+DATASET_ROOT = "data/test_out/yellow"
+DATETIME_COLUMN = "tpep_pickup_datetime"
+
+PARTITION_PATTERN = re.compile(r"year=(\d{4})[\\/]month=(\d{1,2})[\\/]")
+
+
+def _as_datetime(value) -> datetime:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(value)
+
+
+def dataset_files(root: str = DATASET_ROOT) -> list:
+    """Fichiers du dataset : {"path", "year", "month"}, triés par mois."""
+    files = []
+    for path in glob.glob(os.path.join(root, "year=*", "month=*", "*.parquet")):
+        match = PARTITION_PATTERN.search(path)
+        if match:
+            files.append({"path": path, "year": int(match.group(1)), "month": int(match.group(2))})
+    return sorted(files, key=lambda f: (f["year"], f["month"], f["path"]))
+
+
+def _bounds_overlap(stat_min, stat_max, low, high) -> bool:
+    if low is not None and stat_max < low:
+        return False
+    if high is not None and stat_min > high:
+        return False
+    return True
+
+
+def _row_group_matches(row_group, columns: dict, ranges: dict, values: dict) -> bool:
+    """False seulement si les statistiques prouvent qu'aucune ligne du row group ne passe le filtre."""
+    for name, (low, high) in ranges.items():
+        stats = row_group.column(columns[name]).statistics
+        if stats is not None and stats.has_min_max and not _bounds_overlap(stats.min, stats.max, low, high):
+            return False
+    for name, allowed in values.items():
+        stats = row_group.column(columns[name]).statistics
+        if stats is not None and stats.has_min_max and not any(stats.min <= v <= stats.max for v in allowed):
+            return False
+    return True
+
+
+def matching_row_groups(path: str, ranges: dict, values: dict) -> int:
+    """
+    Nombre de row groups de `path` que les statistiques min/max n'excluent pas
+    (lecture du seul footer parquet, via pyarrow).
+
+    :param ranges: {colonne: (min, max)} bornes incluses, None = non bornée.
+    :param values: {colonne: valeurs acceptées}.
+    """
+    metadata = pq.ParquetFile(path).metadata
+    columns = {metadata.schema.column(i).name: i for i in range(metadata.num_columns)}
+    ranges = {name: bounds for name, bounds in ranges.items() if name in columns}
+    values = {name: allowed for name, allowed in values.items() if name in columns}
+    return sum(
+        _row_group_matches(metadata.row_group(i), columns, ranges, values)
+        for i in range(metadata.num_row_groups)
+    )
+
+
+def scan_trips(
+    columns: list = None,
+    start=None,
+    end=None,
+    pu_location_ids: list = None,
+    do_location_ids: list = None,
+    vendor_ids: list = None,
+    root: str = DATASET_ROOT,
+    use_statistics: bool = True,
+) -> pl.LazyFrame:
+    """
+    Le dataset des courses transformées en un seul LazyFrame, filtré et projeté.
+
+    :param start, end: intervalle [start, end[ sur tpep_pickup_datetime (date, datetime ou ISO).
+    :param pu_location_ids, do_location_ids, vendor_ids: valeurs acceptées (None = toutes).
+    :param use_statistics: écarte aussi les fichiers dont aucun row group ne peut
+                           correspondre (statistiques min/max, nécessite pyarrow).
+
+    Deux niveaux d'élagage : les fichiers exclus par leurs statistiques ne sont pas scannés,
+    et Polars n'ouvre dans les fichiers restants que les row groups et colonnes utiles
+    (filtre et projection poussés dans le scan). Les partitions year=/month= ne servent pas
+    à écarter des fichiers : elles suivent le nom du fichier TLC, qui contient aussi des
+    courses d'autres mois.
+    """
+    start, end = _as_datetime(start), _as_datetime(end)
+    files = [file["path"] for file in dataset_files(root)]
+    candidates = len(files)
+
+    values = {
+        name: list(allowed)
+        for name, allowed in (("PULocationID", pu_location_ids), ("DOLocationID", do_location_ids), ("VendorID", vendor_ids))
+        if allowed is not None
+    }
+    ranges = {DATETIME_COLUMN: (start, end)} if start is not None or end is not None else {}
+
+    if use_statistics and pq is not None and (ranges or values):
+        files = [path for path in files if matching_row_groups(path, ranges, values)]
+    print(f"Requête : {len(files)} fichier(s) retenu(s) sur {candidates}.")
+
+    if files:
+        trips = pl.scan_parquet(files)
+    else:
+        # Aucun fichier ne correspond : LazyFrame vide, mais avec le schéma du dataset.
+        all_files = dataset_files(root)
+        if not all_files:
+            raise FileNotFoundError(f"Aucun fichier parquet dans le dataset '{root}'")
+        trips = pl.scan_parquet(all_files[0]["path"]).clear()
+
+    predicates = []
+    if start is not None:
+        predicates.append(pl.col(DATETIME_COLUMN) >= start)
+    if end is not None:
+        predicates.append(pl.col(DATETIME_COLUMN) < end)
+    predicates.extend(pl.col(name).is_in(allowed) for name, allowed in values.items())
+
+    if predicates:
+        trips = trips.filter(*predicates)
+    if columns is not None:
+        trips = trips.select(columns)
+    return trips
@@ -0,0 +1,33 @@
+import glob
+from functools import lru_cache
+
+import polars as pl
+
+from scripts.zone_index import ZONES_SHAPEFILE, load_zones
+
+
+# Chargeurs paresseux pour les ressources lourdes du pipeline. Ils ne sont appelés
+# qu'au moment où une tâche s'exécute (jamais au parsing du DAG) et leur résultat est
+# gardé en mémoire pour la durée du process.
+
+
+def list_input_files(pattern: str) -> list:
+    """Liste (triée) des fichiers parquet à transformer. Non mise en cache : la liste change d'un run à l'autre."""
+    files = sorted(glob.glob(pattern, recursive=True))
+    print(f"{len(files)} fichier(s) trouvé(s) pour '{pattern}'.")
+    return files
+
+
+@lru_cache(maxsize=None)
+def get_target_schema(pattern: str) -> pl.Schema:
+    """Schéma cible : celui du premier fichier correspondant au motif (ex. les fichiers 2025)."""
+    files = sorted(glob.glob(pattern, recursive=True))
+    if not files:
+        raise FileNotFoundError(f"Aucun fichier pour définir le schéma cible : '{pattern}'")
+    return pl.scan_parquet(files[0]).collect_schema()
+
+
+@lru_cache(maxsize=None)
+def get_zones(shapefile_path: str = ZONES_SHAPEFILE, with_grid: bool = True):
+    """Zones (LazyFrame pour le sjoin) et grille de lookup, chargées une seule fois par process."""
+    return load_zones(shapefile_path, with_grid=with_grid)
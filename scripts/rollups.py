@@ -0,0 +1,135 @@
+import os
+
+import polars as pl
+
+from scripts.output_writer import partition_path, write_partition
+
+
+# Tables d'agrégats écrites à côté du dataset des courses, une partition par mois :
+# <ROLLUP_ROOT>/year=AAAA/month=MM/<fichier>.parquet, réécrite quand le mois est retraité.
+ROLLUP_ROOT = "data/rollups/zone_hour"
+
+# Une ligne par zone de départ x zone d'arrivée x heure de la journée x fournisseur x paiement.
+ROLLUP_KEYS = ["PULocationID", "DOLocationID", "pickup_hour", "VendorID", "payment_type"]
+SUM_COLUMNS = ["passenger_count", "trip_distance", "fare_amount", "tip_amount", "total_amount"]
+
+# Histogrammes à bornes fixes (esquisses de quantiles additionnables d'un mois à l'autre).
+# Pour n bornes, n + 1 cases : [< b0], [b0, b1[, ..., [>= b(n-1)].
+HISTOGRAM_EDGES = {
+    "total_amount": [0, 5, 10, 15, 20, 25, 30, 40, 50, 60, 80, 100, 150, 200],
+    "trip_distance": [0, 0.5, 1, 1.5, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50],
+    "trip_minutes": [0, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120],
+}
+
+
+def _trip_minutes() -> pl.Expr:
+    return (pl.col("tpep_dropoff_datetime") - pl.col("tpep_pickup_datetime")).dt.total_seconds() / 60
+
+
+def _bin_index(measure: pl.Expr, name: str) -> pl.Expr:
+    """Case de HISTOGRAM_EDGES[name] de chaque valeur (null si la valeur manque)."""
+    edges = pl.Series(HISTOGRAM_EDGES[name], dtype=pl.Float64)
+    measure = measure.cast(pl.Float64).fill_nan(None)
+    return pl.when(measure.is_not_null()).then(pl.lit(edges).search_sorted(measure, side="right"))
+
+
+def _histogram(name: str) -> pl.Expr:
+    """Nombre de courses par case, en un tableau UInt32 (agrégation de la colonne _bin_<name>)."""
+    bins = pl.col(f"_bin_{name}")
+    return pl.concat_arr(
+        [(bins == i).sum().cast(pl.UInt32) for i in range(len(HISTOGRAM_EDGES[name]) + 1)]
+    ).alias(f"{name}_hist")
+
+
+def build_rollup(trips: pl.LazyFrame) -> pl.LazyFrame:
+    """Agrège des courses transformées (schéma cible) sur ROLLUP_KEYS."""
+    measures = {
+        "total_amount": pl.col("total_amount"),
+        "trip_distance": pl.col("trip_distance"),
+        "trip_minutes": _trip_minutes(),
+    }
+    # Les cases sont calculées ligne à ligne avant le group_by : dans l'agrégation, il ne
+    # reste que des comparaisons et des sommes.
+    return (
+        trips.with_columns(
+            pl.col("tpep_pickup_datetime").dt.hour().cast(pl.Int8).alias("pickup_hour"),
+            _trip_minutes().alias("trip_minutes"),
+            *[_bin_index(expr, name).alias(f"_bin_{name}") for name, expr in measures.items()],
+        )
+        .group_by(ROLLUP_KEYS)
+        .agg(
+            pl.len().cast(pl.UInt32).alias("trips"),
+            *[pl.col(col).sum().alias(f"{col}_sum") for col in SUM_COLUMNS],
+            pl.col("trip_minutes").sum().alias("trip_minutes_sum"),
+            *[_histogram(name) for name in measures],
+        )
+    )
+
+
+def write_rollup(trips_path: str, rollup_path: str) -> int:
+    """
+    Calcule l'agrégat d'un fichier de courses transformé et l'écrit (remplace la version
+    précédente du mois). Renvoie le nombre de lignes de l'agrégat.
+    """
+    rollup = build_rollup(pl.scan_parquet(trips_path)).collect(engine="streaming")
+    write_partition(rollup.lazy(), rollup_path, sort_by="PULocationID")
+    return rollup.height
+
+
+def rollup_path_for(rollup_root: str, input_path: str) -> str:
+    """Chemin de la partition d'agrégats d'un fichier mensuel (même découpage que les courses)."""
+    return partition_path(rollup_root, input_path)
+
+
+def scan_rollups(rollup_root: str = ROLLUP_ROOT) -> pl.LazyFrame:
+    """Toutes les partitions d'agrégats, avec les colonnes year / month des dossiers."""
+    return pl.scan_parquet(os.path.join(rollup_root, "**", "*.parquet"), hive_partitioning=True)
+
+
+def merge_rollups(rollups: pl.LazyFrame, keys: list) -> pl.LazyFrame:
+    """
+    Ré-agrège des agrégats sur `keys` (ex. plusieurs mois, ou sans le fournisseur) :
+    compteurs, sommes et histogrammes s'additionnent case par case.
+    """
+    sum_columns = ["trips", "trip_minutes_sum"] + [f"{col}_sum" for col in SUM_COLUMNS]
+    aggs = [pl.col(col).sum() for col in sum_columns]
+    for name, edges in HISTOGRAM_EDGES.items():
+        column = f"{name}_hist"
+        aggs.append(
+            pl.concat_arr([pl.col(column).arr.get(i).sum().cast(pl.UInt32) for i in range(len(edges) + 1)]).alias(column)
+        )
+    return rollups.group_by(keys).agg(aggs)
+
+
+def approx_quantile(counts, edges, q: float) -> float:
+    """
+    Quantile estimé depuis un histogramme (interpolation linéaire dans la case).
+    Les cases extrêmes renvoient la borne connue la plus proche.
+    """
+    counts = list(counts)
+    total = sum(counts)
+    if total == 0:
+        return None
+    target = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if count and cumulative + count >= target:
+            if i == 0:
+                return float(edges[0])
+            if i == len(edges):
+                return float(edges[-1])
+            low, high = edges[i - 1], edges[i]
+            return low + (high - low) * (target - cumulative) / count
+        cumulative += count
+    return float(edges[-1])
+
+
+def with_quantiles(rollups: pl.LazyFrame, name: str, quantiles=(0.5, 0.9)) -> pl.LazyFrame:
+    """Ajoute <name>_p50, <name>_p90... estimés depuis l'histogramme <name>_hist."""
+    edges = HISTOGRAM_EDGES[name]
+    return rollups.with_columns(
+        pl.col(f"{name}_hist")
+        .map_elements(lambda counts, q=q: approx_quantile(counts, edges, q), return_dtype=pl.Float64)
+        .alias(f"{name}_p{round(q * 100)}")
+        for q in quantiles
+    )
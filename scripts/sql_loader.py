@@ -0,0 +1,155 @@
+import os
+import glob
+import time
+from functools import lru_cache
+
+import polars as pl
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+
+# Nom de la variable du fichier .env qui contient l'URL SQLAlchemy de la base destination.
+CONNECTION_ENV_VAR = "CONNECTION_STRING_DESTINATION"
+
+DEFAULT_TABLE = "yellow_tripdata"
+# Lignes envoyées par executemany : une seule tranche de cette taille est en mémoire à la fois.
+DEFAULT_BATCH_SIZE = 100_000
+
+# Colonne ajoutée à la table : fichier d'origine de chaque ligne (rechargement idempotent).
+SOURCE_COLUMN = "source_file"
+
+# Types Polars -> types SQLAlchemy (traduits par le dialecte : BIGINT, FLOAT, DATETIME2...).
+SQL_TYPES = {
+    pl.Int8: sa.SmallInteger,
+    pl.Int16: sa.SmallInteger,
+    pl.Int32: sa.Integer,
+    pl.Int64: sa.BigInteger,
+    pl.Float32: sa.Float,
+    pl.Float64: sa.Float,
+    pl.Boolean: sa.Boolean,
+    pl.Date: sa.Date,
+}
+
+
+def get_connection_url(env_var: str = CONNECTION_ENV_VAR) -> str:
+    """URL de la base destination, lue dans l'environnement ou le fichier .env."""
+    load_dotenv()
+    url = os.environ.get(env_var)
+    if not url:
+        raise KeyError(f"Variable '{env_var}' absente de l'environnement et du fichier .env")
+    return url.strip()
+
+
+@lru_cache(maxsize=None)
+def get_engine(url: str = None) -> Engine:
+    """
+    Engine SQLAlchemy partagé par process (pool de connexions). Pour SQL Server (pyodbc),
+    fast_executemany envoie chaque tranche en un seul aller-retour au lieu d'un INSERT par ligne.
+    """
+    url = url or get_connection_url()
+    options = {"pool_size": 2, "pool_pre_ping": True}
+    if url.startswith("mssql+pyodbc"):
+        options["fast_executemany"] = True
+    return sa.create_engine(url, **options)
+
+
+def _sql_type(dtype):
+    # Texte sans longueur maximale (NVARCHAR(max) sous SQL Server) : la table est créée au
+    # premier fichier, une longueur tirée de ses données pourrait tronquer les suivants.
+    if dtype == pl.Datetime:
+        return sa.DateTime
+    return SQL_TYPES.get(dtype.base_type(), sa.Unicode())
+
+
+def ensure_table(engine: Engine, table_name: str, schema: pl.Schema) -> sa.Table:
+    """Crée la table destination si elle n'existe pas (colonnes du schéma + source_file)."""
+    metadata = sa.MetaData()
+    table = sa.Table(
+        table_name,
+        metadata,
+        *[sa.Column(name, _sql_type(dtype)) for name, dtype in schema.items()],
+        sa.Column(SOURCE_COLUMN, sa.String(255), index=True),
+    )
+    metadata.create_all(engine, checkfirst=True)
+    return table
+
+
+def _insert_sql(engine: Engine, table_name: str, columns: list) -> str:
+    quote = engine.dialect.identifier_preparer.quote
+    column_list = ", ".join(quote(col) for col in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    return f"INSERT INTO {quote(table_name)} ({column_list}) VALUES ({placeholders})"
+
+
+def _delete_sql(engine: Engine, table_name: str) -> str:
+    quote = engine.dialect.identifier_preparer.quote
+    return f"DELETE FROM {quote(table_name)} WHERE {quote(SOURCE_COLUMN)} = ?"
+
+
+def load_parquet_file(
+    path: str,
+    table_name: str = DEFAULT_TABLE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    engine: Engine = None,
+) -> dict:
+    """
+    Charge un fichier parquet transformé dans la table, par tranches de `batch_size` lignes
+    (scan_parquet().slice() : seule la tranche en cours est en mémoire).
+
+    Les lignes déjà chargées depuis ce fichier sont d'abord supprimées, puis tout est
+    inséré dans une seule transaction : relancer la tâche ne crée pas de doublons.
+    """
+    engine = engine or get_engine()
+    start = time.perf_counter()
+
+    source = pl.scan_parquet(path)
+    schema = source.collect_schema()
+    total_rows = source.select(pl.len()).collect().item()
+    ensure_table(engine, table_name, schema)
+
+    columns = list(schema.names()) + [SOURCE_COLUMN]
+    insert_sql = _insert_sql(engine, table_name, columns)
+    # Les NaN ne sont pas acceptés par SQL Server : on les envoie comme NULL.
+    float_columns = [name for name, dtype in schema.items() if dtype.is_float()]
+    source_name = os.path.basename(path)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+
+        cursor.execute(_delete_sql(engine, table_name), (source_name,))
+
+        for offset in range(0, total_rows, batch_size):
+            batch = (
+                source.slice(offset, batch_size)
+                .with_columns(pl.col(float_columns).fill_nan(None), pl.lit(source_name).alias(SOURCE_COLUMN))
+                .collect()
+            )
+            cursor.executemany(insert_sql, batch.rows())
+            print(f"  - {path} : {min(offset + batch_size, total_rows)}/{total_rows} lignes")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    seconds = time.perf_counter() - start
+    rows_per_s = total_rows / seconds if seconds > 0 else None
+    print(f"Chargé : {path} -> {table_name}, {total_rows} lignes en {seconds:.1f} s ({rows_per_s or 0:,.0f} lignes/s)")
+    return {"file": path, "table": table_name, "rows": total_rows, "seconds": seconds, "rows_per_s": rows_per_s}
+
+
+def load_dataset(
+    pattern: str,
+    table_name: str = DEFAULT_TABLE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    engine: Engine = None,
+) -> list:
+    """Charge tous les fichiers d'un motif (ex. une année du dataset partitionné), un fichier à la fois."""
+    files = sorted(glob.glob(pattern, recursive=True))
+    print(f"\n--- Chargement de {len(files)} fichier(s) dans '{table_name}' ---")
+    return [load_parquet_file(path, table_name, batch_size, engine) for path in files]
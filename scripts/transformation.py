@@ -1,14 +1,32 @@
+import hashlib
+import threading
+from functools import lru_cache
+
 import polars as pl
 import polars_st as st
 import geopandas as gpd
 from typing import List
 from polars._typing import SchemaDict
 
+from scripts.quality import count_rule_failures
+from scripts.zone_index import UNKNOWN_LOCATION_ID, outside_extent_expr, zone_bounds, zone_id_expr
+from scripts.zone_cache import add_location_ids_cached
 
 
-def add_location_ids(data_lazy, zones_df):
+def add_location_ids(data_lazy, zones_df, zone_grid=None, quantize_precision=None, stats=None):
     """
     Vérifie la présence des colonnes de coordonnées et les transforme en LocationID.
+
+    Si une grille précalculée (voir scripts.zone_index.build_zone_grid) est fournie,
+    elle remplace les deux sjoin : le test polygone n'est fait que pour les points
+    proches d'une frontière de zone.
+
+    Si quantize_precision est fourni, les coordonnées sont arrondies à ce nombre de
+    décimales et seules les clés uniques absentes du cache disque sont géocodées
+    (voir scripts.zone_cache). `stats` reçoit alors le taux de réussite du cache.
+
+    Dans tous les cas, les points hors de l'emprise des zones (0/0, hors NYC) reçoivent
+    directement UNKNOWN_LOCATION_ID : seuls les points plausibles vont au test spatial.
     """
     # Étape 1 : Vérification de la présence des colonnes (seule addition)
     required_cols = {"Start_Lon", "Start_Lat", "End_Lon", "End_Lat"}
@@ -18,25 +36,79 @@ def add_location_ids(data_lazy, zones_df):
         print('pas de coords longitude/ latitude')
         return data_lazy
 
-    # Étape 2 : Application de votre code de transformation exact
-    final_lazy_df = (
-        data_lazy.with_columns(
-            geometry=st.point(pl.concat_arr(pl.col("Start_Lon"), pl.col("Start_Lat")))
+    bounds = zone_bounds(zones_df, zone_grid)
+
+    if quantize_precision is not None:
+        return add_location_ids_cached(data_lazy, zones_df, zone_grid, quantize_precision, stats=stats, bounds=bounds)
+
+    if zone_grid is not None:
+        # La grille ne couvre que l'emprise : les points hors emprise y sont déjà écartés
+        # sans test polygone, il ne reste qu'à leur donner l'ID inconnu.
+        return data_lazy.with_columns(
+            PULocationID=pl.when(outside_extent_expr("Start_Lon", "Start_Lat", bounds))
+            .then(pl.lit(UNKNOWN_LOCATION_ID, dtype=pl.Int32))
+            .otherwise(zone_id_expr(zone_grid, "Start_Lon", "Start_Lat")),
+            DOLocationID=pl.when(outside_extent_expr("End_Lon", "End_Lat", bounds))
+            .then(pl.lit(UNKNOWN_LOCATION_ID, dtype=pl.Int32))
+            .otherwise(zone_id_expr(zone_grid, "End_Lon", "End_Lat")),
+        ).select(
+            pl.all().exclude(["Start_Lon", "Start_Lat", "End_Lon", "End_Lat"])
+        )
+
+    # Étape 2 : un seul sjoin pour les pickups et les dropoffs, sur les 4 colonnes de
+    # coordonnées uniquement ; les colonnes de la course ne passent jamais par la jointure.
+    # Chaque point reçoit la clé 2 * ligne (+1 pour le dropoff) : les IDs sont ensuite
+    # rattachés à leur ligne par une jointure sur le numéro de ligne.
+    # Seuls les points dans l'emprise des zones (et sans coordonnée manquante) sont
+    # construits et passent par le sjoin. Les points sont à gauche : le prédicat est
+    # "within" (le point est dans la zone), "contains" ne serait jamais vrai.
+    points = pl.concat([
+        data_lazy.with_row_index("_point_id").select(
+            pl.col("_point_id") * 2, lon="Start_Lon", lat="Start_Lat",
+            _outside=outside_extent_expr("Start_Lon", "Start_Lat", bounds),
+        ),
+        data_lazy.with_row_index("_point_id").select(
+            pl.col("_point_id") * 2 + 1, lon="End_Lon", lat="End_Lat",
+            _outside=outside_extent_expr("End_Lon", "End_Lat", bounds),
+        ),
+    ])
+
+    matches = (
+        points.filter(
+            ~pl.col("_outside")
+            & pl.col("lon").fill_nan(None).is_not_null()
+            & pl.col("lat").fill_nan(None).is_not_null()
         )
-        .st.sjoin(zones_df.lazy(), predicate="contains", how="left", left_on="geometry", right_on="geometry")
-        .rename({"LocationID": "PULocationID"})
-        .drop("geometry", "geometry_right")
         .with_columns(
-            geometry=st.point(pl.concat_arr(pl.col("End_Lon"), pl.col("End_Lat")))
+            geometry=st.point(pl.concat_arr(pl.col("lon"), pl.col("lat")))
         )
-        .st.sjoin(zones_df.lazy(), predicate="contains", how="left", left_on="geometry", right_on="geometry")
-        .rename({"LocationID": "DOLocationID"})
-        .drop("geometry", "geometry_right")
+        .st.sjoin(zones_df.lazy(), predicate="within", how="left", left_on="geometry", right_on="geometry")
+        .select("_point_id", "LocationID")
+        .unique("_point_id", keep="first")
+    )
+
+    location_ids = (
+        points.select("_point_id", "_outside")
+        .join(matches, on="_point_id", how="left")
         .select(
-            pl.all().exclude(["Start_Lon", "Start_Lat", "End_Lon", "End_Lat"])
+            "_point_id",
+            pl.when(pl.col("_outside")).then(pl.lit(UNKNOWN_LOCATION_ID)).otherwise(pl.col("LocationID")).alias("LocationID"),
         )
     )
-    
+
+    def ids_of(offset: int, name: str) -> pl.LazyFrame:
+        # offset 0 : pickups (clés paires), 1 : dropoffs (clés impaires).
+        return location_ids.filter(pl.col("_point_id") % 2 == offset).select(
+            _row=pl.col("_point_id") // 2, **{name: pl.col("LocationID")}
+        )
+
+    final_lazy_df = (
+        data_lazy.with_row_index("_row")
+        .join(ids_of(0, "PULocationID"), on="_row", how="left", maintain_order="left")
+        .join(ids_of(1, "DOLocationID"), on="_row", how="left", maintain_order="left")
+        .select(pl.all().exclude(["_row", "Start_Lon", "Start_Lat", "End_Lon", "End_Lat"]))
+    )
+
     return final_lazy_df
 
 
@@ -172,9 +244,10 @@ def type_convert(lazy_df: pl.LazyFrame) -> pl.LazyFrame:
     
 
 
-def enforce_schema_types(lazy_df: pl.LazyFrame, target_schema: dict) -> pl.LazyFrame:
+def enforce_schema_types(lazy_df: pl.LazyFrame, target_schema: dict, datetime_formats: dict = None) -> pl.LazyFrame:
     """
     Dynamically converts column types in a LazyFrame to match a target schema.
+    `datetime_formats` ({colonne: format}, voir resolve_datetime_formats) évite l'inférence du format des dates.
     """
     print("-> Dynamically checking and converting column types to match target schema...")
     
@@ -193,7 +266,7 @@ def enforce_schema_types(lazy_df: pl.LazyFrame, target_schema: dict) -> pl.LazyF
                 
                 # Special handling for String -> Datetime conversion
                 if current_type == pl.String and target_type == pl.Datetime:
-                    expression = pl.col(col_name).str.to_datetime()
+                    expression = parse_datetime(col_name, target_type, (datetime_formats or {}).get(col_name))
                 # For all other conversions, a standard .cast() is sufficient
                 else:
                     expression = pl.col(col_name).cast(target_type)
@@ -238,69 +311,186 @@ VENDOR_STRING_TO_ID_MAP = {
     "DDS": 3,
 }
 
+# Règles de normalisation des anciens payment_type texte : premier motif trouvé dans la valeur en majuscules.
+PAYMENT_TYPE_RULES = [
+    ("CRE", 1),  # Credit card
+    ("FLE", 0),  # Flex fare
+    ("CAS", 2),  # Cash
+    ("NO", 3),   # No charge
+    ("DIS", 4),  # Dispute
+]
+PAYMENT_TYPE_UNKNOWN = 5
+
+# Valeurs inconnues rencontrées par les normalisations, par colonne : {colonne: {valeur: nombre de lignes}}.
+# Lues (et remises à zéro) par pop_unknown_values après chaque fichier.
+_UNKNOWN_VALUES = {}
+_UNKNOWN_LOCK = threading.Lock()
+
+
+def _unknown_key(value):
+    """
+    Clé du registre : null et NaN deviennent "null" / "nan". Un NaN n'est jamais égal à
+    lui-même, il ouvrirait une nouvelle entrée à chaque batch au lieu de s'additionner.
+    """
+    if value is None:
+        return "null"
+    if value != value:
+        return "nan"
+    return value
+
+
+def pop_unknown_values() -> dict:
+    """Renvoie les valeurs inconnues vues depuis le dernier appel (valeurs en texte) et vide le registre."""
+    with _UNKNOWN_LOCK:
+        unknown = {}
+        for col, values in _UNKNOWN_VALUES.items():
+            seen = unknown.setdefault(col, {})
+            for value, count in values.items():
+                seen[str(value)] = seen.get(str(value), 0) + count
+        _UNKNOWN_VALUES.clear()
+    return unknown
+
+
+def snapshot_unknown_values() -> dict:
+    """Copie du registre des valeurs inconnues, à rendre à restore_unknown_values."""
+    with _UNKNOWN_LOCK:
+        return {col: dict(values) for col, values in _UNKNOWN_VALUES.items()}
+
+
+def restore_unknown_values(snapshot: dict):
+    """Remet le registre dans l'état de `snapshot` (ex. tranche refaite en mode basse mémoire)."""
+    with _UNKNOWN_LOCK:
+        _UNKNOWN_VALUES.clear()
+        _UNKNOWN_VALUES.update({col: dict(values) for col, values in snapshot.items()})
+
+
+def _distinct_index(series: pl.Series) -> tuple:
+    """
+    Valeurs distinctes de `series` (triées, sans null) et, pour chaque ligne, l'indice de
+    sa valeur parmi elles (null pour les lignes nulles) : résultat.gather(indices) redistribue
+    aux lignes un résultat calculé une seule fois par valeur distincte.
+    """
+    distinct = series.drop_nulls().unique().sort()
+    # Rang dense = position dans les valeurs distinctes triées (à partir de 1), null sur les nulls.
+    indices = series.rank("dense") - 1
+    return distinct, indices
+
+
+def _map_unique_values(col: str, classify, return_dtype) -> pl.Expr:
+    """
+    Normalise une colonne via une table de correspondance construite sur ses valeurs uniques :
+    `classify(valeur) -> (valeur normalisée, connue ?)` n'est appelée qu'une fois par valeur
+    distincte de chaque batch, puis la table est redistribuée aux lignes en un seul gather.
+    Les valeurs non reconnues sont comptées dans le registre lu par pop_unknown_values.
+
+    Uniquement des opérations Series : une requête Polars lancée depuis la fonction
+    (DataFrame.select, replace_strict...) bloque avec un seul thread (voir scripts.output_writer.write_partitions).
+    """
+    def apply(series: pl.Series) -> pl.Series:
+        counts = series.value_counts()
+        # NaN != NaN : les nombres de lignes sont retrouvés par la clé du registre.
+        rows = {
+            _unknown_key(value): count
+            for value, count in zip(counts.get_column(series.name).to_list(), counts.get_column("count").to_list())
+        }
+        distinct, indices = _distinct_index(series)
+
+        unknown = {}
+        mapped_values = []
+        for value in distinct.to_list() + [None]:
+            mapped, known = classify(value)
+            key = _unknown_key(value)
+            if not known and key in rows:
+                unknown[key] = rows[key]
+            mapped_values.append(mapped)
+        null_mapped = mapped_values.pop()
+
+        if unknown:
+            with _UNKNOWN_LOCK:
+                seen = _UNKNOWN_VALUES.setdefault(col, {})
+                for value, count in unknown.items():
+                    seen[value] = seen.get(value, 0) + count
+
+        # Les lignes nulles ont un indice null : elles reçoivent la valeur prévue pour null.
+        result = pl.Series(series.name, mapped_values, dtype=return_dtype).gather(indices)
+        if null_mapped is not None and series.null_count():
+            result = result.set(series.is_null(), null_mapped)
+        return result
+
+    return pl.col(col).map_batches(apply, return_dtype=return_dtype, is_elementwise=True)
+
+
+def classify_vendor(value):
+    """'CMT' -> (1, True) ; code inconnu -> (None, False)."""
+    if value is None:
+        return None, True
+    return VENDOR_STRING_TO_ID_MAP.get(value), value in VENDOR_STRING_TO_ID_MAP
+
+
+def classify_store_and_fwd(value):
+    """1.0 -> ('Y', True), 0.0 -> ('N', True) ; toute autre valeur donne 'N' et est signalée."""
+    return ("Y" if value == 1.0 else "N"), value in (0.0, 1.0)
+
+
+def classify_payment_type(value):
+    """'CREDIT' -> (1, True), 'Cash' -> (2, True)... ; sans motif connu -> (5, False)."""
+    if value is not None:
+        upper = value.upper()
+        for pattern, code in PAYMENT_TYPE_RULES:
+            if pattern in upper:
+                return code, True
+    return PAYMENT_TYPE_UNKNOWN, False
+
+
+def vendor_name_to_id(col: str) -> pl.Expr:
+    """Code fournisseur texte ('CMT', 'VTS', 'DDS') -> identifiant numérique."""
+    return _map_unique_values(col, classify_vendor, pl.Int64)
+
+
+def store_and_fwd_to_flag(col: str) -> pl.Expr:
+    """Ancien store_and_fwd_flag numérique (1.0 / 0.0) -> 'Y' / 'N'."""
+    return _map_unique_values(col, classify_store_and_fwd, pl.String)
+
+
+def payment_type_to_id(col: str) -> pl.Expr:
+    """Ancien payment_type texte ('CREDIT', 'Cash', 'No Charge'...) -> code numérique."""
+    return _map_unique_values(col, classify_payment_type, pl.Int64)
+
+
 def values_map(lazy_df: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Normalise fournisseur, store_and_fwd_flag et payment_type en une seule passe
+    (un seul with_columns, tables de correspondance sur les valeurs uniques).
+    """
     print("Mapping started (robust version)...")
     
     current_schema = lazy_df.collect_schema()
+    expressions = []
+    to_drop = []
     
     if "vendor_name" in current_schema:
-        processed_df = lazy_df.with_columns(
-            pl.col("vendor_name")
-              .replace_strict(VENDOR_STRING_TO_ID_MAP, default=None)
-              .alias("VendorID")
-        ).drop("vendor_name")
+        expressions.append(vendor_name_to_id("vendor_name").alias("VendorID"))
+        to_drop.append("vendor_name")
     elif "VendorID" in current_schema and current_schema["VendorID"] != pl.Int64:
         if  current_schema["VendorID"] != pl.Int32 : 
-            processed_df = lazy_df.with_columns(
-            pl.col("VendorID")
-              .replace_strict(VENDOR_STRING_TO_ID_MAP, default=None)
-            )
+            expressions.append(vendor_name_to_id("VendorID").alias("VendorID"))
         else : 
-            processed_df = lazy_df.with_columns(
-                pl.col("VendorID").cast(pl.Int64)
-        )
+            expressions.append(pl.col("VendorID").cast(pl.Int64))
     elif "VendorID" not in current_schema:
-         processed_df = lazy_df.with_columns(
-            pl.lit(None, dtype=pl.Int32).alias("VendorID")
-        )
-    else:
-        processed_df = lazy_df
-
-    current_schema = processed_df.collect_schema()
-    expressions = []
+        expressions.append(pl.lit(None, dtype=pl.Int32).alias("VendorID"))
 
     if "store_and_fwd_flag" in current_schema and current_schema["store_and_fwd_flag"] != pl.String:
         print("  - Converting 'store_and_fwd_flag'...")
-        expressions.append(
-            pl.when(pl.col("store_and_fwd_flag") == 1.0)
-              .then(pl.lit("Y"))
-              .otherwise(pl.lit("N"))
-              .alias("store_and_fwd_flag")
-        )
+        expressions.append(store_and_fwd_to_flag("store_and_fwd_flag").alias("store_and_fwd_flag"))
 
     if "payment_type" in current_schema and current_schema["payment_type"] == pl.String:
         print("  - Converting 'payment_type'...")
-        expressions.append(
-            pl.when(pl.col("payment_type").str.to_uppercase().str.contains("CRE"))
-              .then(pl.lit(1))
-              .when(pl.col("payment_type").str.to_uppercase().str.contains("FLE"))
-              .then(pl.lit(0))
-              .when(pl.col("payment_type").str.to_uppercase().str.contains("CAS"))
-              .then(pl.lit(2))
-              .when(pl.col("payment_type").str.to_uppercase().str.contains("NO"))
-              .then(pl.lit(3))
-              .when(pl.col("payment_type").str.to_uppercase().str.contains("DIS"))
-              .then(pl.lit(4))
-              .otherwise(pl.lit(5))
-              .cast(pl.Int64)
-              .alias("payment_type")
-        )
+        expressions.append(payment_type_to_id("payment_type").alias("payment_type"))
 
-    if expressions:
-        return processed_df.with_columns(expressions)
-    else:
+    if not expressions:
         print("  - No value mapping needed for store_and_fwd_flag or payment_type.")
-        return processed_df
+        return lazy_df
+    return lazy_df.with_columns(expressions).drop(to_drop)
 
 
 
@@ -414,4 +604,224 @@ def order_columns_by_schema(
 
     target_column_order = list(target_schema.keys())
     
-    return lazy_df.select(target_column_order)
\ No newline at end of file
+    return lazy_df.select(target_column_order)
+
+
+
+COORDINATE_COLUMNS = ["Start_Lon", "Start_Lat", "End_Lon", "End_Lat"]
+
+
+# Format connu des dates texte de chaque époque, par nom de colonne d'origine
+# (2009 : Trip_*_DateTime, 2010 : *_datetime), ex. "2009-01-04 02:52:00".
+ERA_DATETIME_FORMATS = {
+    "Trip_Pickup_DateTime": "%Y-%m-%d %H:%M:%S",
+    "Trip_Dropoff_DateTime": "%Y-%m-%d %H:%M:%S",
+    "pickup_datetime": "%Y-%m-%d %H:%M:%S",
+    "dropoff_datetime": "%Y-%m-%d %H:%M:%S",
+}
+# Formats essayés, dans l'ordre, si le format connu ne convient pas à l'échantillon.
+DATETIME_FORMAT_CANDIDATES = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S%.f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y %I:%M:%S %p",
+]
+# Lignes lues (en tête de fichier) pour valider le format.
+DATETIME_SAMPLE_ROWS = 10_000
+# Les dates sont à la seconde et se répètent beaucoup : True les convertit une fois par
+# valeur distincte (voir parse_datetime).
+PARSE_UNIQUE_DATETIMES = False
+
+
+def _format_fits(sample: pl.Series, fmt: str) -> bool:
+    parsed = sample.str.strptime(pl.Datetime("us"), fmt, strict=False, exact=True)
+    return parsed.null_count() == sample.null_count()
+
+
+def resolve_datetime_formats(lazy_df: pl.LazyFrame, sample_rows: int = DATETIME_SAMPLE_ROWS) -> dict:
+    """
+    Format des colonnes de dates texte, validé sur les `sample_rows` premières lignes :
+    le format connu de l'époque (ERA_DATETIME_FORMATS) d'abord, puis les candidats.
+    Renvoie {colonne renommée: format} ; une colonne sans format valide est absente
+    (Polars devinera alors le format, comme avant).
+    """
+    schema = lazy_df.collect_schema()
+    columns = [
+        col for col, dtype in schema.items()
+        if dtype == pl.String and RENAME_MAP.get(col, col) in ("tpep_pickup_datetime", "tpep_dropoff_datetime")
+    ]
+    if not columns:
+        return {}
+
+    sample = lazy_df.select(columns).head(sample_rows).collect()
+    formats = {}
+    for col in columns:
+        candidates = [ERA_DATETIME_FORMATS.get(col)] + DATETIME_FORMAT_CANDIDATES
+        fmt = next((fmt for fmt in candidates if fmt is not None and _format_fits(sample[col], fmt)), None)
+        if fmt is None:
+            print(f"  - Aucun format connu pour '{col}' (ex. {sample[col].drop_nulls().head(3).to_list()}) : format deviné par Polars.")
+        else:
+            formats[RENAME_MAP.get(col, col)] = fmt
+    return formats
+
+
+def parse_datetime(col: str, target_type, fmt: str = None, unique: bool = False) -> pl.Expr:
+    """
+    Colonne de dates texte -> `target_type`. Avec `fmt`, lecture à format fixe (pas
+    d'inférence) ; sans, str.to_datetime() devine le format.
+
+    À format fixe, le cache de valeurs de strptime est désactivé : le hachage de chaque
+    ligne coûte plus cher que la lecture elle-même.
+
+    `unique` : chaque batch est converti sur ses valeurs distinctes (propres au batch,
+    voir _distinct_index), puis le résultat est redistribué aux lignes par leur indice.
+    Ne paie que si les dates se répètent beaucoup (mesure : python -m scripts.bench_pipeline).
+    """
+    def convert(values):
+        # Expression (lecture directe) ou Series (valeurs distinctes d'un batch).
+        if fmt is None:
+            return values.str.to_datetime().cast(target_type)
+        return values.str.strptime(target_type, fmt, exact=True, cache=False)
+
+    if not unique:
+        return convert(pl.col(col))
+
+    def apply(series: pl.Series) -> pl.Series:
+        # Pas de catégories : leur dictionnaire est global au process et grossit de batch en batch.
+        distinct, indices = _distinct_index(series)
+        return convert(distinct).gather(indices).alias(series.name)
+
+    return pl.col(col).map_batches(apply, return_dtype=target_type, is_elementwise=True)
+
+
+def schema_fingerprint(schema: SchemaDict) -> str:
+    """Empreinte courte d'un schéma (noms, types et ordre des colonnes)."""
+    description = ";".join(f"{name}:{dtype}" for name, dtype in schema.items())
+    return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+def compile_plan(
+    input_schema: SchemaDict,
+    target_schema: SchemaDict,
+    datetime_formats: dict = None,
+    parse_unique_datetimes: bool = False,
+) -> dict:
+    """
+    Compile, pour un schéma d'entrée donné, ce que font col_rename, values_map,
+    add_missing_columns, enforce_schema_types et order_columns_by_schema :
+      - "rename_map" : les renommages (appliqués avant add_location_ids) ;
+      - "exprs"      : une seule projection (valeurs, colonnes manquantes, types, ordre).
+
+    Les types intermédiaires sont déduits du schéma, sans relire le LazyFrame.
+    Le plan est mis en cache : les fichiers d'une même époque (2009, 2010, 2011+)
+    réutilisent le même plan.
+
+    Les dates texte sont lues avec `datetime_formats` ({colonne renommée: format}, voir
+    resolve_datetime_formats) ; sans format, Polars le devine comme avant.
+    `parse_unique_datetimes` : voir parse_datetime.
+    """
+    return _compile_plan(
+        tuple(input_schema.items()),
+        tuple(target_schema.items()),
+        tuple(sorted((datetime_formats or {}).items())),
+        parse_unique_datetimes,
+    )
+
+
+@lru_cache(maxsize=None)
+def _compile_plan(input_items: tuple, target_items: tuple, datetime_formats: tuple, parse_unique_datetimes: bool) -> dict:
+    input_schema = dict(input_items)
+    target_schema = dict(target_items)
+    datetime_formats = dict(datetime_formats)
+    fingerprint = schema_fingerprint(input_schema)
+    print(f"Compilation du plan pour le schéma {fingerprint} ({len(input_schema)} colonnes).")
+
+    # 1. Renommages (même ordre de priorité que col_rename).
+    rename_map = {col: new for col, new in RENAME_MAP.items() if col in input_schema}
+    schema = {rename_map.get(col, col): dtype for col, dtype in input_schema.items()}
+
+    # 2. add_location_ids remplace les 4 coordonnées par PULocationID / DOLocationID.
+    #    Leur type dépend des zones fournies : None = inconnu, on castera toujours.
+    if set(COORDINATE_COLUMNS).issubset(schema):
+        for col in COORDINATE_COLUMNS:
+            del schema[col]
+        schema.update({"PULocationID": None, "DOLocationID": None})
+
+    # Pour chaque colonne : (expression, type produit par l'expression).
+    sources = {col: (pl.col(col), dtype) for col, dtype in schema.items()}
+
+    # 3. Valeurs (mêmes règles que values_map).
+    if "vendor_name" in sources:
+        sources["VendorID"] = (vendor_name_to_id("vendor_name"), pl.Int64)
+    elif "VendorID" in sources and schema["VendorID"] != pl.Int64:
+        if schema["VendorID"] != pl.Int32:
+            sources["VendorID"] = (vendor_name_to_id("VendorID"), pl.Int64)
+        else:
+            sources["VendorID"] = (pl.col("VendorID").cast(pl.Int64), pl.Int64)
+    elif "VendorID" not in sources:
+        sources["VendorID"] = (pl.lit(None, dtype=pl.Int32), pl.Int32)
+
+    if "store_and_fwd_flag" in schema and schema["store_and_fwd_flag"] != pl.String:
+        sources["store_and_fwd_flag"] = (store_and_fwd_to_flag("store_and_fwd_flag"), pl.String)
+
+    if "payment_type" in schema and schema["payment_type"] == pl.String:
+        sources["payment_type"] = (payment_type_to_id("payment_type"), pl.Int64)
+
+    # 4. Colonnes manquantes, types et ordre du schéma cible, en une seule projection.
+    exprs = []
+    for col, target_type in target_schema.items():
+        if col not in sources:
+            exprs.append(pl.lit(None, dtype=target_type).alias(col))
+            continue
+        expr, current_type = sources[col]
+        if current_type is None or current_type != target_type:
+            if current_type == pl.String and target_type == pl.Datetime:
+                expr = parse_datetime(col, target_type, datetime_formats.get(col), parse_unique_datetimes)
+            else:
+                expr = expr.cast(target_type)
+        exprs.append(expr.alias(col))
+
+    return {"fingerprint": fingerprint, "rename_map": rename_map, "exprs": exprs}
+
+
+def run_transformation(
+    source_lazy_df: pl.LazyFrame,
+    zones_df: pl.DataFrame,
+    target_schema: SchemaDict,
+    zone_grid: dict = None,
+    quantize_precision: int = None,
+    parse_unique_datetimes: bool = PARSE_UNIQUE_DATETIMES,
+    validate: bool = False,
+    location_stats: dict = None,
+) -> pl.LazyFrame:
+    """
+        renvoie Un nouveau LazyFrame aligné sur le schéma cible.
+
+        Le plan (renommages + projection finale) est compilé une fois par schéma
+        d'entrée, voir compile_plan. Le format des dates texte est vérifié sur un
+        échantillon (voir resolve_datetime_formats).
+
+        Avec `validate`, les règles de qualité sont comptées dans le même plan, sans
+        retirer de lignes (voir scripts.quality.count_rule_failures).
+
+        `location_stats` reçoit le taux de réussite du cache des zones quand
+        `quantize_precision` est fourni (voir add_location_ids).
+    """
+    print("--- START ---")
+
+    datetime_formats = resolve_datetime_formats(source_lazy_df)
+    plan = compile_plan(source_lazy_df.collect_schema(), target_schema, datetime_formats, parse_unique_datetimes)
+    print(f"Plan {plan['fingerprint']} : {len(plan['rename_map'])} renommage(s).")
+
+    renamed = source_lazy_df.rename(plan["rename_map"])
+
+    located = add_location_ids(renamed, zones_df, zone_grid, quantize_precision, location_stats)
+
+    final_lazy_df = located.select(plan["exprs"])
+    if validate:
+        final_lazy_df = count_rule_failures(final_lazy_df)
+
+    print("--- END ---")
+    
+    return final_lazy_df
@@ -0,0 +1,149 @@
+import os
+
+import polars as pl
+import polars_st as st
+
+from scripts.zone_index import lookup_zone_ids, outside_extent_expr, GRID_OUTSIDE, UNKNOWN_LOCATION_ID
+
+
+ZONE_CACHE_DIR = "data/cache/zone_keys"
+
+# Nombre de décimales conservées sur lon/lat (4 décimales ~ 11 m à New York).
+DEFAULT_PRECISION = 4
+
+KEY_COLUMNS = ["lon_key", "lat_key"]
+CACHE_SCHEMA = {"lon_key": pl.Int64, "lat_key": pl.Int64, "LocationID": pl.Int32}
+
+
+def _cache_path(cache_dir: str, precision: int) -> str:
+    return os.path.join(cache_dir, f"zone_keys_p{precision}.parquet")
+
+
+def load_zone_cache(cache_dir: str = ZONE_CACHE_DIR, precision: int = DEFAULT_PRECISION) -> pl.DataFrame:
+    """Charge le cache (clé quantifiée -> LocationID). S'il n'existe pas, renvoie un cache vide."""
+    path = _cache_path(cache_dir, precision)
+    if not os.path.exists(path):
+        return pl.DataFrame(schema=CACHE_SCHEMA)
+    return pl.read_parquet(path)
+
+
+def save_zone_cache(cache: pl.DataFrame, cache_dir: str = ZONE_CACHE_DIR, precision: int = DEFAULT_PRECISION):
+    """
+    Écrit le cache via un fichier temporaire renommé, pour qu'un lecteur ne voie jamais
+    un fichier à moitié écrit. Si deux process écrivent en même temps, le dernier gagne :
+    les clés perdues seront simplement recalculées au prochain passage.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(cache_dir, precision)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    cache.write_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def quantize(col: str, precision: int) -> pl.Expr:
+    """Arrondit une coordonnée à `precision` décimales et la stocke en entier."""
+    return (pl.col(col) * 10**precision).round().cast(pl.Int64, strict=False)
+
+
+def resolve_keys(keys: pl.DataFrame, zones_df, zone_grid: dict = None, precision: int = DEFAULT_PRECISION) -> pl.DataFrame:
+    """Calcule le LocationID du point central de chaque clé (lon_key, lat_key)."""
+    coords = keys.with_columns(
+        lon=pl.col("lon_key").cast(pl.Float64) / 10**precision,
+        lat=pl.col("lat_key").cast(pl.Float64) / 10**precision,
+    )
+
+    if zone_grid is not None:
+        ids = lookup_zone_ids(zone_grid, coords["lon"].to_numpy(), coords["lat"].to_numpy())
+        return keys.with_columns(
+            pl.Series("LocationID", ids, dtype=pl.Int32).replace(GRID_OUTSIDE, None)
+        )
+
+    return (
+        coords.lazy()
+        .with_columns(geometry=st.point(pl.concat_arr(pl.col("lon"), pl.col("lat"))))
+        .st.sjoin(zones_df.lazy(), predicate="within", how="left", left_on="geometry", right_on="geometry")
+        .select(KEY_COLUMNS + [pl.col("LocationID").cast(pl.Int32)])
+        .unique(KEY_COLUMNS, keep="first")
+        .collect()
+    )
+
+
+def add_location_ids_cached(
+    data_lazy: pl.LazyFrame,
+    zones_df,
+    zone_grid: dict = None,
+    precision: int = DEFAULT_PRECISION,
+    cache_dir: str = ZONE_CACHE_DIR,
+    stats: dict = None,
+    bounds: tuple = None,
+) -> pl.LazyFrame:
+    """
+    Variante de add_location_ids qui quantifie les coordonnées pickup/dropoff et
+    ne géocode que les clés uniques encore absentes du cache disque.
+
+    Les IDs sont ensuite rattachés au LazyFrame par jointure sur les clés. Si `stats`
+    est fourni, il est complété avec le taux de réussite du cache pour ce fichier
+    (les compteurs s'additionnent quand le même dict sert à plusieurs tranches).
+
+    Les clés uniques sont lues dès l'appel (un scan des 4 colonnes de coordonnées) :
+    construire le plan lit donc déjà le fichier une fois.
+
+    Avec `bounds`, les points hors de l'emprise des zones n'entrent pas dans le cache :
+    ils reçoivent directement UNKNOWN_LOCATION_ID.
+    """
+    points = {
+        "PULocationID": ("Start_Lon", "Start_Lat"),
+        "DOLocationID": ("End_Lon", "End_Lat"),
+    }
+
+    # 1. Les clés uniques du fichier (seules les 4 colonnes de coordonnées sont lues).
+    def plausible(lon: str, lat: str) -> pl.Expr:
+        return pl.lit(True) if bounds is None else ~outside_extent_expr(lon, lat, bounds)
+
+    keys = (
+        pl.concat([
+            data_lazy.filter(plausible(lon, lat)).select(lon_key=quantize(lon, precision), lat_key=quantize(lat, precision))
+            for lon, lat in points.values()
+        ])
+        .drop_nulls()
+        .unique()
+        .collect()
+    )
+
+    # 2. On ne géocode que celles qui ne sont pas déjà dans le cache.
+    cache = load_zone_cache(cache_dir, precision)
+    new_keys = keys.join(cache, on=KEY_COLUMNS, how="anti")
+    hits = keys.height - new_keys.height
+    hit_rate = hits / keys.height if keys.height else 1.0
+    print(f"Cache des zones (précision {precision}) : {hits}/{keys.height} clés déjà connues ({hit_rate:.1%}).")
+
+    if new_keys.height:
+        resolved = resolve_keys(new_keys, zones_df, zone_grid, precision)
+        cache = pl.concat([cache, resolved.select(CACHE_SCHEMA.keys()).cast(CACHE_SCHEMA)])
+        save_zone_cache(cache, cache_dir, precision)
+
+    if stats is not None:
+        stats["precision"] = precision
+        for name, count in (("unique_keys", keys.height), ("cache_hits", hits), ("cache_misses", new_keys.height)):
+            stats[name] = stats.get(name, 0) + count
+        stats["cache_hit_rate"] = stats["cache_hits"] / stats["unique_keys"] if stats["unique_keys"] else 1.0
+
+    # 3. On rattache les IDs au LazyFrame d'origine.
+    cache_lazy = cache.lazy()
+    result = data_lazy
+    for id_col, (lon, lat) in points.items():
+        result = result.with_columns(
+            lon_key=quantize(lon, precision), lat_key=quantize(lat, precision)
+        ).join(
+            cache_lazy.rename({"LocationID": id_col}), on=KEY_COLUMNS, how="left"
+        ).drop(KEY_COLUMNS)
+        if bounds is not None:
+            result = result.with_columns(
+                pl.when(plausible(lon, lat)).then(pl.col(id_col))
+                .otherwise(pl.lit(UNKNOWN_LOCATION_ID, dtype=pl.Int32))
+                .alias(id_col)
+            )
+
+    return result.select(
+        pl.all().exclude(["Start_Lon", "Start_Lat", "End_Lon", "End_Lat"])
+    )
@@ -0,0 +1,339 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import polars as pl
+import geopandas as gpd
+import polars_st as st
+import shapely
+from shapely import STRtree
+
+
+ZONES_SHAPEFILE = "data/taxi_zones/taxi_zones.shp"
+
+# Taille d'une cellule de la grille, en degrés (~170 m en latitude à New York).
+GRID_CELL_SIZE = 0.002
+
+# Valeurs spéciales de la grille : une cellule contient soit un LocationID (> 0),
+# soit l'un de ces deux marqueurs.
+GRID_OUTSIDE = 0     # la cellule ne touche aucune zone
+GRID_BOUNDARY = -1   # la cellule chevauche une frontière -> test exact nécessaire
+
+# Artefact binaire (zones en WKB dans de l'Arrow IPC + grille .npy) lu en memory-map par les workers.
+ZONE_ARTIFACT_DIR = "data/cache/zone_index"
+ZONE_ARTIFACT_VERSION = 2
+
+# Zone TLC « Unknown » (absente du shapefile) : attribuée directement aux points hors de
+# l'emprise des zones (0/0, coordonnées hors de New York), sans passer par le test spatial.
+# None : ces points gardent un LocationID nul, comme ceux qui ne tombent dans aucune zone.
+UNKNOWN_LOCATION_ID = 264
+
+
+def load_zone_polygons(shapefile_path: str = ZONES_SHAPEFILE):
+    """
+    Lit le shapefile des zones et renvoie (polygones en EPSG:4326, LocationID).
+    """
+    zones_gdf = gpd.read_file(shapefile_path).to_crs("EPSG:4326")
+    polygons = zones_gdf.geometry.to_numpy()
+    location_ids = zones_gdf["LocationID"].to_numpy().astype(np.int32)
+    return polygons, location_ids
+
+
+def load_zones(shapefile_path: str = ZONES_SHAPEFILE, with_grid: bool = True):
+    """
+    Charge les zones une seule fois et renvoie (zones_lazy pour le sjoin, grille ou None).
+
+    Les zones viennent de l'artefact binaire (voir load_zone_artifact) : pas de relecture
+    du shapefile ni de reprojection tant que le shapefile n'a pas changé.
+    """
+    artifact = load_zone_artifact(shapefile_path)
+    zone_grid = artifact["zone_grid"] if with_grid else None
+    return artifact["zones_lazy"], zone_grid
+
+
+def zone_bounds(zones_df, zone_grid: dict = None) -> tuple:
+    """Emprise (lon min, lat min, lon max, lat max) des zones : celle de la grille si fournie."""
+    if zone_grid is not None and "bounds" in zone_grid:
+        return zone_grid["bounds"]
+    geometry = zones_df.lazy().select("geometry").collect()["geometry"]
+    return tuple(float(v) for v in shapely.total_bounds(shapely.from_wkb(geometry.to_numpy())))
+
+
+def outside_extent_expr(lon_col: str, lat_col: str, bounds: tuple) -> pl.Expr:
+    """
+    True pour un point hors de l'emprise `bounds` ; False dans l'emprise ou si une
+    coordonnée manque (null / NaN : ce n'est pas un point hors zone, c'est une absence).
+    """
+    minx, miny, maxx, maxy = bounds
+    lon = pl.col(lon_col).cast(pl.Float64).fill_nan(None)
+    lat = pl.col(lat_col).cast(pl.Float64).fill_nan(None)
+    inside = lon.is_between(minx, maxx) & lat.is_between(miny, maxy)
+    return inside.not_().fill_null(False)
+
+
+def out_of_extent_counts(lazy_df: pl.LazyFrame, id_columns=("PULocationID", "DOLocationID")) -> dict:
+    """Nombre de lignes marquées UNKNOWN_LOCATION_ID par le préfiltre, par colonne d'ID."""
+    if UNKNOWN_LOCATION_ID is None:
+        return {}
+    counts = lazy_df.select((pl.col(col) == UNKNOWN_LOCATION_ID).sum() for col in id_columns).collect()
+    return {col: int(counts[col].item() or 0) for col in id_columns}
+
+
+def build_zone_grid(polygons, location_ids, cell_size: float = GRID_CELL_SIZE) -> dict:
+    """
+    Construit une grille régulière au-dessus des zones de taxi.
+
+    Chaque cellule entièrement à l'intérieur d'une zone reçoit directement son
+    LocationID ; seules les cellules traversées par une frontière gardent le
+    marqueur GRID_BOUNDARY et passent par un test polygone exact au moment du lookup.
+    """
+    polygons = np.asarray(polygons)
+    location_ids = np.asarray(location_ids, dtype=np.int32)
+
+    minx, miny, maxx, maxy = shapely.total_bounds(polygons)
+    nx = int(np.ceil((maxx - minx) / cell_size))
+    ny = int(np.ceil((maxy - miny) / cell_size))
+    print(f"Construction de la grille des zones : {ny} x {nx} cellules de {cell_size} degré(s)...")
+
+    x0, y0 = np.meshgrid(minx + np.arange(nx) * cell_size, miny + np.arange(ny) * cell_size)
+    x0, y0 = x0.ravel(), y0.ravel()
+    cells = shapely.box(x0, y0, x0 + cell_size, y0 + cell_size)
+
+    # 1. Les cellules qui touchent une frontière de zone devront être testées exactement.
+    boundary_tree = STRtree(shapely.boundary(polygons))
+    boundary_cells = np.unique(boundary_tree.query(cells, predicate="intersects")[0])
+
+    # 2. Les autres sont soit entièrement dans une zone, soit entièrement dehors :
+    #    le centre de la cellule suffit pour le savoir.
+    tree = STRtree(polygons)
+    codes = np.full(cells.size, GRID_OUTSIDE, dtype=np.int32)
+    centers = shapely.points(x0 + cell_size / 2, y0 + cell_size / 2)
+    center_idx, poly_idx = tree.query(centers, predicate="within")
+    first, pos = np.unique(center_idx, return_index=True)
+    codes[first] = location_ids[poly_idx[pos]]
+    codes[boundary_cells] = GRID_BOUNDARY
+
+    # 3. Pour les cellules frontière, on découpe les polygones à la taille de la cellule :
+    #    le test exact se fait ensuite contre quelques morceaux de quelques sommets
+    #    au lieu des polygones complets (~370 sommets en moyenne).
+    cell_idx, poly_idx = tree.query(cells[boundary_cells], predicate="intersects")
+    pieces = shapely.intersection(cells[boundary_cells][cell_idx], polygons[poly_idx])
+    keep = shapely.area(pieces) > 0
+    pieces, poly_idx = pieces[keep], poly_idx[keep]
+
+    print(f"  - {boundary_cells.size} cellule(s) frontière sur {cells.size}, {pieces.size} morceau(x) de zone.")
+
+    return {
+        "origin": (float(minx), float(miny)),
+        "bounds": (float(minx), float(miny), float(maxx), float(maxy)),
+        "cell_size": float(cell_size),
+        "codes": codes.reshape(ny, nx),
+        "polygons": polygons,
+        "location_ids": location_ids,
+        "tree": tree,
+        "piece_tree": STRtree(pieces),
+        "piece_polygon": poly_idx,
+    }
+
+
+def lookup_zone_ids(zone_grid: dict, lon, lat) -> np.ndarray:
+    """
+    Renvoie le LocationID de chaque point (GRID_OUTSIDE si le point n'est dans aucune zone).
+
+    Équivalent à un sjoin "within" (point dans le polygone), mais le test exact
+    n'est fait que pour les points tombant dans une cellule frontière.
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    codes_grid = zone_grid["codes"]
+    ny, nx = codes_grid.shape
+    minx, miny = zone_grid["origin"]
+    cell_size = zone_grid["cell_size"]
+
+    ix = np.floor((lon - minx) / cell_size)
+    iy = np.floor((lat - miny) / cell_size)
+    # Les NaN (coordonnées nulles) échouent à toutes les comparaisons -> hors grille.
+    valid = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+
+    codes = np.full(lon.shape, GRID_OUTSIDE, dtype=np.int32)
+    codes[valid] = codes_grid[iy[valid].astype(np.intp), ix[valid].astype(np.intp)]
+
+    boundary = np.flatnonzero(codes == GRID_BOUNDARY)
+    if boundary.size:
+        codes[boundary] = _exact_zone_ids(zone_grid, lon[boundary], lat[boundary])
+
+    return codes
+
+
+def _exact_zone_ids(zone_grid: dict, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Test polygone exact pour les points tombés dans une cellule frontière."""
+    location_ids = zone_grid["location_ids"]
+    piece_polygon = zone_grid["piece_polygon"]
+    points = shapely.points(lon, lat)
+    result = np.full(points.size, GRID_OUTSIDE, dtype=np.int32)
+
+    point_idx, piece_idx = zone_grid["piece_tree"].query(points, predicate="within")
+    first, pos = np.unique(point_idx, return_index=True)
+    result[first] = location_ids[piece_polygon[piece_idx[pos]]]
+
+    # Un point posé exactement sur un bord de découpe n'est "within" d'aucun morceau,
+    # même s'il est à l'intérieur de la zone : on le teste contre le polygone complet.
+    unresolved = np.ones(points.size, dtype=bool)
+    unresolved[first] = False
+    unresolved = np.flatnonzero(unresolved)
+    on_edge = np.unique(zone_grid["piece_tree"].query(points[unresolved], predicate="intersects")[0])
+    if on_edge.size:
+        on_edge = unresolved[on_edge]
+        point_idx, poly_idx = zone_grid["tree"].query(points[on_edge], predicate="within")
+        first, pos = np.unique(point_idx, return_index=True)
+        result[on_edge[first]] = location_ids[poly_idx[pos]]
+
+    return result
+
+
+def zone_id_expr(zone_grid: dict, lon_col: str, lat_col: str) -> pl.Expr:
+    """Expression Polars qui calcule le LocationID à partir de deux colonnes lon/lat."""
+
+    def _lookup(coords: pl.Series) -> pl.Series:
+        # Opérations Series natives seulement (voir scripts.output_writer.write_partitions).
+        frame = coords.struct.unnest()
+        lon = frame.get_column(lon_col).cast(pl.Float64).to_numpy()
+        lat = frame.get_column(lat_col).cast(pl.Float64).to_numpy()
+        ids = pl.Series(lookup_zone_ids(zone_grid, lon, lat), dtype=pl.Int32)
+        return ids.set(ids == GRID_OUTSIDE, None)
+
+    return pl.struct(lon_col, lat_col).map_batches(
+        _lookup, return_dtype=pl.Int32, is_elementwise=True
+    )
+
+
+def _shapefile_sources(shapefile_path: str) -> list:
+    """Fichiers qui composent le shapefile (.shp et ses compagnons) ; accepte aussi un dossier."""
+    if os.path.isdir(shapefile_path):
+        folder = shapefile_path
+        stems = {os.path.splitext(f)[0] for f in os.listdir(folder) if f.lower().endswith(".shp")}
+    else:
+        folder = os.path.dirname(shapefile_path)
+        stems = {os.path.splitext(os.path.basename(shapefile_path))[0]}
+    return sorted(
+        os.path.join(folder, f) for f in os.listdir(folder)
+        if os.path.splitext(f)[0] in stems and os.path.splitext(f)[1].lower() in (".shp", ".shx", ".dbf", ".prj")
+    )
+
+
+def shapefile_fingerprint(shapefile_path: str, cell_size: float = GRID_CELL_SIZE) -> str:
+    """Empreinte sha256 du shapefile et des paramètres de la grille : elle change si taxi_zones.shp change."""
+    digest = hashlib.sha256(f"v{ZONE_ARTIFACT_VERSION}|{cell_size}".encode())
+    for path in _shapefile_sources(shapefile_path):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_zone_artifact(
+    shapefile_path: str = ZONES_SHAPEFILE,
+    artifact_dir: str = ZONE_ARTIFACT_DIR,
+    cell_size: float = GRID_CELL_SIZE,
+) -> dict:
+    """
+    Lit et reprojette le shapefile une fois, puis écrit dans artifact_dir :
+      - zones.arrow  : LocationID + géométrie WKB (Arrow IPC non compressé, memory-mappable)
+      - pieces.arrow : morceaux de zones des cellules frontière de la grille
+      - grid.npy     : codes de la grille
+      - meta.json    : empreinte du shapefile source, écrit en dernier
+    """
+    print(f"Construction de l'artefact des zones dans '{artifact_dir}'...")
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    zones_gdf = gpd.read_file(shapefile_path).to_crs("EPSG:4326")
+    zones_df = st.from_geopandas(zones_gdf).select(pl.col("LocationID").cast(pl.Int32), "geometry")
+    zone_grid = build_zone_grid(zones_gdf.geometry.to_numpy(), zones_gdf["LocationID"].to_numpy(), cell_size)
+
+    pieces_df = pl.DataFrame({
+        "polygon_index": pl.Series(zone_grid["piece_polygon"], dtype=pl.Int64),
+        "geometry": pl.Series(shapely.to_wkb(zone_grid["piece_tree"].geometries), dtype=pl.Binary),
+    })
+
+    # Chaque fichier est écrit sous un nom temporaire puis renommé ; meta.json en dernier,
+    # pour qu'un lecteur ne valide jamais un artefact incomplet.
+    for name, write in (
+        ("zones.arrow", lambda path: zones_df.write_ipc(path, compression="uncompressed")),
+        ("pieces.arrow", lambda path: pieces_df.write_ipc(path, compression="uncompressed")),
+        ("grid.npy", lambda path: np.save(path, zone_grid["codes"])),
+    ):
+        tmp_path = os.path.join(artifact_dir, f"{os.getpid()}.tmp.{name}")
+        write(tmp_path)
+        os.replace(tmp_path, os.path.join(artifact_dir, name))
+
+    meta = {
+        "fingerprint": shapefile_fingerprint(shapefile_path, cell_size),
+        "source": os.path.abspath(shapefile_path),
+        "origin": zone_grid["origin"],
+        "bounds": zone_grid["bounds"],
+        "cell_size": zone_grid["cell_size"],
+        "version": ZONE_ARTIFACT_VERSION,
+    }
+    tmp_path = os.path.join(artifact_dir, f"{os.getpid()}.tmp.meta.json")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=4)
+    os.replace(tmp_path, os.path.join(artifact_dir, "meta.json"))
+
+    return meta
+
+
+def load_zone_artifact(
+    shapefile_path: str = ZONES_SHAPEFILE,
+    artifact_dir: str = ZONE_ARTIFACT_DIR,
+    cell_size: float = GRID_CELL_SIZE,
+) -> dict:
+    """
+    Ouvre l'artefact en memory-map ; il est reconstruit automatiquement s'il est absent
+    ou si son empreinte ne correspond plus au shapefile.
+
+    Renvoie {"zones_lazy": LazyFrame pour le sjoin, "zone_grid": grille pour lookup_zone_ids}.
+    """
+    meta_path = os.path.join(artifact_dir, "meta.json")
+    fingerprint = shapefile_fingerprint(shapefile_path, cell_size)
+
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta is None or meta.get("fingerprint") != fingerprint:
+        print("Artefact des zones absent ou périmé (shapefile modifié).")
+        meta = build_zone_artifact(shapefile_path, artifact_dir, cell_size)
+
+    zones_path = os.path.join(artifact_dir, "zones.arrow")
+    zones = pl.read_ipc(zones_path, memory_map=True)
+    pieces = pl.read_ipc(os.path.join(artifact_dir, "pieces.arrow"), memory_map=True)
+
+    polygons = shapely.from_wkb(zones["geometry"].to_numpy())
+    piece_geometries = shapely.from_wkb(pieces["geometry"].to_numpy())
+
+    zone_grid = {
+        "origin": tuple(meta["origin"]),
+        "bounds": tuple(meta["bounds"]),
+        "cell_size": meta["cell_size"],
+        "codes": np.load(os.path.join(artifact_dir, "grid.npy"), mmap_mode="r"),
+        "polygons": polygons,
+        "location_ids": zones["LocationID"].to_numpy(),
+        "tree": STRtree(polygons),
+        "piece_tree": STRtree(piece_geometries),
+        "piece_polygon": pieces["polygon_index"].to_numpy(),
+    }
+
+    return {
+        "zones_lazy": pl.scan_ipc(zones_path, memory_map=True).select("geometry", "LocationID"),
+        "zone_grid": zone_grid,
+    }
+
+
+if __name__ == "__main__":
+    # Étape de build : python -m scripts.zone_index [chemin du shapefile]
+    import sys
+
+    source = sys.argv[1] if len(sys.argv) > 1 else ZONES_SHAPEFILE
+    print(build_zone_artifact(source))
@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Les tests importent les modules du dépôt comme le DAG : `from scripts.xxx import ...`.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from scripts.zone_index import ZONES_SHAPEFILE, load_zone_artifact  # noqa: E402
+
+
+SHAPEFILE_PATH = os.path.join(REPO_ROOT, ZONES_SHAPEFILE)
+
+
+@pytest.fixture(scope="session")
+def zones(tmp_path_factory):
+    """(zones_lazy, grille) du shapefile du dépôt ; l'artefact est construit dans un dossier temporaire."""
+    artifact = load_zone_artifact(SHAPEFILE_PATH, str(tmp_path_factory.mktemp("zone_index")))
+    return artifact["zones_lazy"], artifact["zone_grid"]
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """Serveur de fichiers minimal : ETag/Last-Modified, GET conditionnels, Range et If-Range."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        if self.server.fail_head:
+            self.server.requests.append({"method": self.command, "path": self.path, "headers": dict(self.headers)})
+            self._send(405, {}, b"", send_body=False)
+            return
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body: bool):
+        server = self.server
+        server.requests.append({"method": self.command, "path": self.path, "headers": dict(self.headers)})
+        entry = server.files.get(self.path)
+        if entry is None:
+            self._send(404, {}, b"", send_body)
+            return
+        body = entry["body"]
+        validators = {"ETag": entry.get("etag"), "Last-Modified": entry.get("last_modified")}
+        headers = {name: value for name, value in validators.items() if value is not None}
+        headers["Content-Type"] = entry.get("content_type", "application/octet-stream")
+
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if (if_none_match is not None and if_none_match == entry.get("etag")) or (
+            if_none_match is None and if_modified_since is not None and if_modified_since == entry.get("last_modified")
+        ):
+            self._send(304, headers, b"", send_body)
+            return
+
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        range_ok = not server.ignore_range and (if_range is None or if_range in validators.values())
+        if requested and range_ok:
+            start = int(requested.split("=")[1].split("-")[0])
+            if start >= len(body):
+                self._send(416, {"Content-Range": f"bytes */{len(body)}"}, b"", send_body)
+                return
+            headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+            self._send(206, headers, body[start:], send_body)
+            return
+        self._send(200, headers, body, send_body)
+
+    def _send(self, status: int, headers: dict, body: bytes, send_body: bool):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def http_server():
+    """
+    Serveur HTTP local qui tient lieu du CDN TLC. server.files : {chemin: {"body", "etag",
+    "last_modified", "content_type"}} ; server.requests : requêtes reçues (méthode, chemin,
+    en-têtes) ; server.ignore_range : répond 200 à toutes les requêtes Range ;
+    server.fail_head : refuse les HEAD (405).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FileHandler)
+    server.daemon_threads = True
+    server.files = {}
+    server.requests = []
+    server.ignore_range = False
+    server.fail_head = False
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,107 @@
+import os
+import time
+
+import pytest
+
+from scripts.catalog import load_catalog, parse_catalog, read_catalog, select_files
+from scripts.find_parquet_links import find_parquet_links
+
+from conftest import REPO_ROOT
+
+FIXTURE_PATH = os.path.join(REPO_ROOT, "tests", "fixtures", "tlc_trip_record_data.html")
+PAGE_PATH = "/site/tlc/about/tlc-trip-record-data.page"
+CDN = "https://d37ci6vzurychx.cloudfront.net/trip-data/"
+TYPES = ["yellow", "green", "fhv", "fhvhv"]
+
+
+@pytest.fixture(scope="module")
+def page() -> bytes:
+    with open(FIXTURE_PATH, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def served(http_server, page):
+    http_server.files[PAGE_PATH] = {"body": page, "etag": '"page-v1"', "content_type": "text/html; charset=utf-8"}
+    return http_server
+
+
+def _page_requests(server) -> list:
+    return [request for request in server.requests if request["path"] == PAGE_PATH]
+
+
+def test_parse_keeps_only_tripdata_links(page):
+    files = parse_catalog(page.decode("utf-8"))
+
+    # 2025 (2 mois) et 2024 (12 mois) pour les 4 types, 2009 en yellow seulement.
+    assert len(files) == 4 * 2 + 4 * 12 + 12
+    urls = [entry["url"] for entry in files]
+    keys = [(entry["type"], entry["year"], entry["month"]) for entry in files]
+    assert len(set(keys)) == len(keys)
+    assert all(url.endswith(".parquet") and url == url.strip() for url in urls)
+    assert {entry["type"] for entry in files} == set(TYPES)
+    assert files == sorted(files, key=lambda f: (f["type"], f["year"], f["month"], f["url"]))
+
+    # Href terminé par un espace sur la page : l'URL est nettoyée.
+    assert {"type": "fhvhv", "year": 2024, "month": 5, "url": CDN + "fhvhv_tripdata_2024-05.parquet"} in files
+    # Second lien vers janvier 2009 (relatif, sur un autre hôte) : le premier de la page est gardé.
+    assert [url for url in urls if "yellow_tripdata_2009-01" in url] == [CDN + "yellow_tripdata_2009-01.parquet"]
+
+
+def test_relative_links_are_joined_to_the_page_url():
+    html = '<a href="/trip-data/green_tripdata_2024-03.parquet ">March</a>'
+    assert parse_catalog(html, "https://www.nyc.gov/site/tlc/page") == [
+        {"type": "green", "year": 2024, "month": 3, "url": "https://www.nyc.gov/trip-data/green_tripdata_2024-03.parquet"},
+    ]
+
+
+def test_select_files_by_type_and_month(page):
+    catalog = {"files": parse_catalog(page.decode("utf-8"))}
+
+    selected = select_files(catalog, ["yellow"], (2024, 11), (2025, 1))
+    assert [(entry["year"], entry["month"]) for entry in selected] == [(2024, 11), (2024, 12), (2025, 1)]
+    assert len(select_files(catalog, ["green", "fhv"], start=(2025, 1))) == 4
+    assert len(select_files(catalog, end=(2009, 12))) == 12
+
+
+def test_fresh_cache_is_reused_without_request(served, tmp_path):
+    url, path = served.url + PAGE_PATH, str(tmp_path / "catalog.json")
+
+    catalog = load_catalog(url, path)
+    assert len(_page_requests(served)) == 1
+    assert catalog["etag"] == '"page-v1"' and read_catalog(path) == catalog
+
+    assert load_catalog(url, path) == catalog
+    assert len(_page_requests(served)) == 1
+
+
+def test_expired_cache_sends_a_conditional_get(served, tmp_path):
+    url, path = served.url + PAGE_PATH, str(tmp_path / "catalog.json")
+    first = load_catalog(url, path)
+
+    # Page inchangée : 304, les fichiers du cache sont repris et la date de mise à jour avancée.
+    time.sleep(0.01)
+    second = load_catalog(url, path, ttl=0)
+    assert _page_requests(served)[-1]["headers"]["If-None-Match"] == '"page-v1"'
+    assert second["files"] == first["files"] and second["fetched_at"] > first["fetched_at"]
+    assert read_catalog(path) == second
+
+    # Page republiée avec un nouveau mois : elle est analysée de nouveau.
+    new_link = f'<a href="{CDN}yellow_tripdata_2025-03.parquet">March</a></body>'.encode()
+    served.files[PAGE_PATH].update(body=served.files[PAGE_PATH]["body"].replace(b"</body>", new_link), etag='"page-v2"')
+    third = load_catalog(url, path, ttl=0)
+    assert third["etag"] == '"page-v2"' and len(third["files"]) == len(first["files"]) + 1
+    assert CDN + "yellow_tripdata_2025-03.parquet" in find_parquet_links(url, path=path)
+
+
+def test_unreachable_page_falls_back_to_the_stale_cache(served, tmp_path):
+    url, path = served.url + PAGE_PATH, str(tmp_path / "catalog.json")
+    catalog = load_catalog(url, path)
+
+    del served.files[PAGE_PATH]
+    assert load_catalog(url, path, ttl=0) == catalog
+    # Sans cache, l'erreur remonte ; find_parquet_links renvoie alors une liste vide.
+    with pytest.raises(Exception):
+        load_catalog(url, str(tmp_path / "empty.json"))
+    assert find_parquet_links(url, path=str(tmp_path / "empty.json")) == []
+    assert find_parquet_links(url, path=path) == sorted(entry["url"] for entry in catalog["files"])
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+import pytest
+
+import scripts.download_files_v2 as download_files_v2
+import scripts.downloader as downloader
+from scripts.download_log import get_entry, open_log
+
+FILES = {
+    "/trip-data/yellow_tripdata_2024-01.parquet": b"january" * 20_000,
+    "/trip-data/yellow_tripdata_2024-02.parquet": b"february" * 20_000,
+}
+
+
+@pytest.fixture
+def served(http_server, tmp_path, monkeypatch):
+    # Journal et fichiers dans le dossier du test.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(download_files_v2, "LOG_DB", str(tmp_path / "download_log.sqlite"))
+    monkeypatch.setattr(download_files_v2, "LOG_FILE", str(tmp_path / "download_log.json"))
+    for path, body in FILES.items():
+        http_server.files[path] = {"body": body, "etag": f'"{path[-10:-8]}-v1"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    return http_server
+
+
+def _urls(server) -> list:
+    return [server.url + path for path in FILES]
+
+
+def _entry(name: str) -> dict:
+    conn = open_log(download_files_v2.LOG_DB, None)
+    try:
+        return get_entry(conn, name)
+    finally:
+        conn.close()
+
+
+def _gets(server) -> list:
+    return [request for request in server.requests if request["method"] == "GET"]
+
+
+def test_etags_are_recorded_and_unchanged_files_skipped(served, tmp_path):
+    reports = download_files_v2.download_files(_urls(served), str(tmp_path / "raw"), workers=2)
+    assert sorted(report["status"] for report in reports) == ["OK", "OK"]
+    assert _entry("yellow_tripdata_2024-01.parquet")["etag"] == '"01-v1"'
+
+    # Rien n'a changé : les HEAD suffisent, aucun GET.
+    served.requests.clear()
+    assert download_files_v2.download_files(_urls(served), str(tmp_path / "raw"), workers=2) == []
+    assert _gets(served) == []
+
+
+def test_conditional_get_when_head_fails(served, tmp_path):
+    download_files_v2.download_files(_urls(served), str(tmp_path / "raw"), workers=2)
+    served.fail_head = True
+    served.requests.clear()
+    served.files["/trip-data/yellow_tripdata_2024-02.parquet"] = {
+        "body": b"republished" * 10_000, "etag": '"02-v2"', "last_modified": "Fri, 01 Mar 2024 00:00:00 GMT",
+    }
+
+    reports = {os.path.basename(r["path"]): r for r in download_files_v2.download_files(_urls(served), str(tmp_path / "raw"))}
+
+    # Inchangé : GET conditionnel avec l'ETag du journal -> 304, rien n'est réécrit.
+    assert reports["yellow_tripdata_2024-01.parquet"]["status"] == "INCHANGÉ"
+    assert {request["headers"].get("If-None-Match") for request in _gets(served)} == {'"01-v1"', '"02-v1"'}
+    # Modifié : 200, fichier remplacé et nouvel ETag enregistré.
+    assert reports["yellow_tripdata_2024-02.parquet"]["status"] == "OK"
+    assert _entry("yellow_tripdata_2024-02.parquet")["etag"] == '"02-v2"'
+    with open(reports["yellow_tripdata_2024-02.parquet"]["path"], "rb") as f:
+        assert f.read() == b"republished" * 10_000
+
+
+def test_each_download_is_recorded_when_it_finishes(served, tmp_path, monkeypatch):
+    # Le second téléchargement attend que le premier soit dans le journal (max. 5 s).
+    seen_first = threading.Event()
+    download_file = downloader.download_file
+
+    def wait_for_first(session, url, local_path, *args, **kwargs):
+        if url.endswith("2024-02.parquet"):
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline and not seen_first.is_set():
+                if _entry("yellow_tripdata_2024-01.parquet") is not None:
+                    seen_first.set()
+                time.sleep(0.05)
+        return download_file(session, url, local_path, *args, **kwargs)
+
+    monkeypatch.setattr(downloader, "download_file", wait_for_first)
+    download_files_v2.download_files(_urls(served), str(tmp_path / "raw"), workers=2)
+
+    assert seen_first.is_set()
+    assert _entry("yellow_tripdata_2024-02.parquet") is not None
@@ -0,0 +1,105 @@
+import os
+import json
+
+import pytest
+
+from scripts.downloader import PART_SUFFIX, PART_VALIDATOR_SUFFIX, download_file, download_many, make_session
+
+FILE_PATH = "/trip-data/yellow_tripdata_2024-01.parquet"
+BODY = bytes(range(256)) * 4_000
+NEW_BODY = b"republished" * 50_000
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+@pytest.fixture
+def served(http_server):
+    http_server.files[FILE_PATH] = {"body": BODY, "etag": ETAG, "last_modified": LAST_MODIFIED}
+    return http_server
+
+
+def _interrupted_download(session, url, local_path, kept_bytes: int):
+    """Télécharge le fichier puis le remet dans l'état d'un transfert coupé après `kept_bytes` octets."""
+    download_file(session, url, local_path)
+    os.replace(local_path, local_path + PART_SUFFIX)
+    with open(local_path + PART_SUFFIX, "r+b") as f:
+        f.truncate(kept_bytes)
+    # Le .part garde la version (If-Range) qu'il avait pendant le transfert.
+    with open(local_path + PART_VALIDATOR_SUFFIX, "w") as f:
+        json.dump({"etag": ETAG, "last_modified": LAST_MODIFIED}, f)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_full_download_leaves_no_part_files(served, tmp_path):
+    local_path = str(tmp_path / "yellow_tripdata_2024-01.parquet")
+    with make_session() as session:
+        report = download_file(session, served.url + FILE_PATH, local_path, chunk_size=10_000)
+
+    assert report["status"] == "OK" and report["etag"] == ETAG and report["size"] == len(BODY)
+    assert _read(local_path) == BODY
+    assert not os.path.exists(local_path + PART_SUFFIX)
+    assert not os.path.exists(local_path + PART_VALIDATOR_SUFFIX)
+
+
+def test_resume_sends_if_range_and_appends(served, tmp_path):
+    local_path = str(tmp_path / "yellow_tripdata_2024-01.parquet")
+    with make_session() as session:
+        _interrupted_download(session, served.url + FILE_PATH, local_path, 300_000)
+        served.requests.clear()
+        report = download_file(session, served.url + FILE_PATH, local_path)
+
+    headers = served.requests[-1]["headers"]
+    assert headers["Range"] == "bytes=300000-" and headers["If-Range"] == ETAG
+    assert report["bytes"] == len(BODY) - 300_000
+    assert _read(local_path) == BODY
+
+
+def test_resume_restarts_when_the_file_changed(served, tmp_path):
+    local_path = str(tmp_path / "yellow_tripdata_2024-01.parquet")
+    with make_session() as session:
+        _interrupted_download(session, served.url + FILE_PATH, local_path, 300_000)
+        # Fichier republié entre la coupure et la reprise : If-Range ne correspond plus -> 200.
+        served.files[FILE_PATH] = {"body": NEW_BODY, "etag": '"v2"', "last_modified": "Tue, 02 Jan 2024 00:00:00 GMT"}
+        report = download_file(session, served.url + FILE_PATH, local_path)
+
+    assert report["etag"] == '"v2"' and report["bytes"] == len(NEW_BODY)
+    assert _read(local_path) == NEW_BODY
+
+
+def test_resume_restarts_when_the_server_ignores_range(served, tmp_path):
+    local_path = str(tmp_path / "yellow_tripdata_2024-01.parquet")
+    served.ignore_range = True
+    with make_session() as session:
+        _interrupted_download(session, served.url + FILE_PATH, local_path, 300_000)
+        report = download_file(session, served.url + FILE_PATH, local_path)
+
+    assert report["bytes"] == len(BODY)
+    assert _read(local_path) == BODY
+
+
+def test_part_without_validator_is_not_resumed(served, tmp_path):
+    local_path = str(tmp_path / "yellow_tripdata_2024-01.parquet")
+    with open(local_path + PART_SUFFIX, "wb") as f:
+        f.write(b"x" * 1_000)
+    with make_session() as session:
+        served.requests.clear()
+        download_file(session, served.url + FILE_PATH, local_path)
+
+    assert "Range" not in served.requests[-1]["headers"]
+    assert _read(local_path) == BODY
+
+
+def test_download_many_reports_missing_files(served, tmp_path):
+    jobs = [
+        (served.url + FILE_PATH, str(tmp_path / "a.parquet")),
+        (served.url + "/trip-data/missing.parquet", str(tmp_path / "b.parquet")),
+    ]
+    reports = {report["path"]: report for report in download_many(jobs, workers=2)}
+
+    assert reports[jobs[0][1]]["status"] == "OK"
+    assert reports[jobs[1][1]]["status"] == "ERREUR"
+    assert _read(jobs[0][1]) == BODY
@@ -0,0 +1,92 @@
+import geopandas as gpd
+import polars as pl
+import pytest
+
+from scripts.bench_zone_lookup import generate_points
+from scripts.transformation import add_location_ids
+from scripts.zone_index import UNKNOWN_LOCATION_ID
+
+from conftest import SHAPEFILE_PATH
+
+
+@pytest.fixture(scope="module")
+def zone_points():
+    """Un point intérieur par zone (representative_point) et le LocationID attendu."""
+    zones_gdf = gpd.read_file(SHAPEFILE_PATH).to_crs("EPSG:4326")
+    points = zones_gdf.geometry.representative_point()
+    return pl.DataFrame({
+        "Start_Lon": points.x.to_numpy(),
+        "Start_Lat": points.y.to_numpy(),
+        # Dropoff : la zone suivante, pour ne pas tester deux fois la même chose.
+        "End_Lon": points.x.to_numpy()[::-1].copy(),
+        "End_Lat": points.y.to_numpy()[::-1].copy(),
+        "expected_pu": zones_gdf["LocationID"].to_numpy(),
+        "expected_do": zones_gdf["LocationID"].to_numpy()[::-1].copy(),
+    }).with_columns(pl.col("expected_pu", "expected_do").cast(pl.Int32))
+
+
+@pytest.mark.parametrize("use_grid", [False, True], ids=["sjoin", "grid"])
+def test_zone_centroids_get_their_location_id(zones, zone_points, use_grid):
+    zones_lazy, zone_grid = zones
+    result = add_location_ids(zone_points.lazy(), zones_lazy, zone_grid if use_grid else None).collect()
+
+    assert result["PULocationID"].null_count() == 0
+    assert result["PULocationID"].cast(pl.Int32).to_list() == result["expected_pu"].to_list()
+    assert result["DOLocationID"].cast(pl.Int32).to_list() == result["expected_do"].to_list()
+
+
+@pytest.mark.parametrize("use_grid", [False, True], ids=["sjoin", "grid"])
+def test_quantized_cache_resolves_zone_centroids(zones, zone_points, use_grid, tmp_path, monkeypatch):
+    # Le cache disque (data/cache/zone_keys) est relatif au dossier courant.
+    monkeypatch.chdir(tmp_path)
+    zones_lazy, zone_grid = zones
+    stats = {}
+    result = add_location_ids(
+        zone_points.lazy(), zones_lazy, zone_grid if use_grid else None, quantize_precision=6, stats=stats
+    ).collect()
+
+    assert result["PULocationID"].to_list() == result["expected_pu"].to_list()
+    assert result["DOLocationID"].to_list() == result["expected_do"].to_list()
+    assert stats["cache_hits"] == 0 and stats["cache_misses"] == stats["unique_keys"] > 0
+
+    # Second passage : toutes les clés viennent du cache, avec les mêmes IDs.
+    stats = {}
+    again = add_location_ids(
+        zone_points.lazy(), zones_lazy, zone_grid if use_grid else None, quantize_precision=6, stats=stats
+    ).collect()
+    assert stats["cache_hit_rate"] == 1.0
+    assert again["PULocationID"].to_list() == result["PULocationID"].to_list()
+
+
+def test_grid_sjoin_and_cache_agree_including_out_of_extent(zones, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    zones_lazy, zone_grid = zones
+    minx, miny, maxx, maxy = zone_grid["bounds"]
+
+    # Points dans l'emprise (zones, eau, frontières) avec 0/0 et nulls, plus des cas à la main.
+    # Arrondis à 6 décimales : le cache quantifié (précision 6) voit alors les mêmes points.
+    points = generate_points(50_000, zone_grid["bounds"], seed=1)
+    special = pl.DataFrame({
+        "Start_Lon": [0.0, -80.0, float("nan"), None, minx - 1e-3, maxx + 1e-3, minx],
+        "Start_Lat": [0.0, 40.7, 40.7, 40.7, miny + 0.1, maxy - 0.1, miny],
+        "End_Lon": [-73.98, 0.0, -73.98, -73.98, -73.98, -73.98, maxx],
+        "End_Lat": [40.75, 0.0, float("nan"), None, 40.75, 40.75, maxy],
+    })
+    points = pl.concat([points, special]).with_columns(pl.all().round(6))
+
+    by_sjoin = add_location_ids(points.lazy(), zones_lazy).collect()
+    by_grid = add_location_ids(points.lazy(), zones_lazy, zone_grid).collect()
+    by_cache = add_location_ids(points.lazy(), zones_lazy, None, quantize_precision=6).collect()
+    by_cache_grid = add_location_ids(points.lazy(), zones_lazy, zone_grid, quantize_precision=6).collect()
+
+    for col in ("PULocationID", "DOLocationID"):
+        sjoin_ids = by_sjoin[col].cast(pl.Int32)
+        for other in (by_grid, by_cache, by_cache_grid):
+            assert sjoin_ids.ne_missing(other[col]).sum() == 0, col
+
+    # Hors de l'emprise -> UNKNOWN_LOCATION_ID ; coordonnée manquante -> null.
+    tail = by_grid.tail(special.height)
+    assert tail["PULocationID"].to_list()[:6] == [UNKNOWN_LOCATION_ID, UNKNOWN_LOCATION_ID, None, None,
+                                                 UNKNOWN_LOCATION_ID, UNKNOWN_LOCATION_ID]
+    assert tail["DOLocationID"].to_list()[1:4] == [UNKNOWN_LOCATION_ID, None, None]
+    assert by_grid["PULocationID"].null_count() < by_grid.height
@@ -0,0 +1,175 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+import scripts.low_memory as low_memory
+import scripts.parallel_transform as parallel_transform
+from scripts.bench_pipeline import generate_2009, generate_modern
+from scripts.low_memory import MIN_BATCH_ROWS, merge_sorted_parts
+from scripts.output_writer import write_partition
+
+from conftest import REPO_ROOT, SHAPEFILE_PATH
+
+KEY = "tpep_pickup_datetime"
+
+# Fichier 2009 de 20 millions de lignes (~3 Go une fois chargé) transformé sous un budget
+# de 2 Go. Génération et transformation dans deux processus à part : ru_maxrss ne mesure
+# alors que la transformation.
+CEILING_ROWS = 20_000_000
+CEILING_BUDGET_MB = 2_000
+
+GENERATE = textwrap.dedent("""
+    import os, sys
+    import polars as pl
+    from scripts.bench_pipeline import generate_2009
+
+    path, n_rows = sys.argv[1], int(sys.argv[2])
+    chunks = [f"{path}.{i}.tmp" for i in range(n_rows // 1_000_000)]
+    for seed, chunk in enumerate(chunks):
+        generate_2009(1_000_000, seed=seed).write_parquet(chunk)
+    pl.scan_parquet(chunks).sink_parquet(path, row_group_size=500_000)
+    for chunk in chunks:
+        os.remove(chunk)
+""")
+
+TRANSFORM = textwrap.dedent("""
+    import json, os, resource, sys
+    from scripts.bench_pipeline import generate_modern
+    from scripts.parallel_transform import transform_file
+    from scripts.zone_index import load_zone_artifact
+
+    shapefile_path, input_path, output_path, budget = sys.argv[1], sys.argv[2], sys.argv[3], float(sys.argv[4])
+    artifact = load_zone_artifact(shapefile_path, os.path.join(os.path.dirname(output_path), "zone_index"))
+    report = transform_file(
+        input_path, output_path, generate_modern(0).schema, artifact["zones_lazy"], artifact["zone_grid"],
+        low_memory={"batch_rows": 2_000_000, "memory_budget_mb": budget},
+    )
+    maxrss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("RESULT=" + json.dumps({"rows": report["rows"], "maxrss_mb": maxrss_mb}))
+""")
+
+
+def test_20m_rows_stay_under_the_memory_budget(tmp_path):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    input_path = str(tmp_path / "yellow_tripdata_2009-01.parquet")
+    output_path = str(tmp_path / "out" / "yellow_tripdata_2009-01.parquet")
+    subprocess.run([sys.executable, "-c", GENERATE, input_path, str(CEILING_ROWS)], env=env, check=True, timeout=1200)
+
+    completed = subprocess.run(
+        [sys.executable, "-c", TRANSFORM, SHAPEFILE_PATH, input_path, output_path, str(CEILING_BUDGET_MB)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=1800,
+    )
+    assert completed.returncode == 0, completed.stderr
+    result = json.loads(completed.stdout.split("RESULT=")[-1])
+
+    assert result["rows"] == CEILING_ROWS
+    assert result["maxrss_mb"] <= CEILING_BUDGET_MB
+    keys = pl.scan_parquet(output_path).select(pl.col(KEY).drop_nulls()).collect().to_series()
+    assert keys.len() == CEILING_ROWS and keys.is_sorted()
+
+
+def _sorted_parts(tmp_path, n_parts: int, rows: int) -> tuple:
+    """Parts triées (nulls à la fin) comme celles de transform_in_batches, et toutes leurs lignes."""
+    frames = []
+    for i in range(n_parts):
+        start = datetime(2024, 1, 1) + timedelta(minutes=i)
+        keys = [None if j % 17 == 0 else start + timedelta(seconds=(j * 7919 + i) % 86_400) for j in range(rows)]
+        frames.append(pl.DataFrame({KEY: keys, "part": [i] * rows, "row": list(range(rows))}))
+    parts = []
+    for i, frame in enumerate(frames):
+        parts.append(str(tmp_path / f"part-{i:05d}.parquet"))
+        write_partition(frame.lazy(), parts[-1], row_group_size=5_000)
+    return parts, pl.concat(frames)
+
+
+def test_merge_keeps_the_global_sort(tmp_path):
+    parts, rows = _sorted_parts(tmp_path, n_parts=5, rows=20_000)
+    output_path = str(tmp_path / "merged.parquet")
+    # Très peu de lignes en mémoire : beaucoup de tours de fusion.
+    merge_sorted_parts(parts, output_path, buffer_rows=3_000)
+
+    merged = pl.read_parquet(output_path)
+    assert merged.height == rows.height
+    assert merged[KEY].drop_nulls().is_sorted()
+    # Les courses sans date restent à la fin, comme avec write_partition.
+    assert merged[KEY].tail(rows[KEY].null_count()).null_count() == rows[KEY].null_count()
+    assert merged.sort("part", "row").equals(rows.sort("part", "row"))
+
+
+def test_merge_over_budget_raises(tmp_path):
+    parts, _ = _sorted_parts(tmp_path, n_parts=2, rows=1_000)
+    with pytest.raises(MemoryError):
+        merge_sorted_parts(parts, str(tmp_path / "merged.parquet"), memory_budget_mb=1, buffer_rows=MIN_BATCH_ROWS)
+
+
+def test_low_memory_never_plans_the_whole_file(zones, tmp_path, monkeypatch):
+    zones_lazy, zone_grid = zones
+    input_path = str(tmp_path / "yellow_tripdata_2009-01.parquet")
+    generate_2009(130_000, seed=5).write_parquet(input_path)
+    target_schema = generate_modern(0).schema
+
+    planned_rows = []
+    run_transformation = parallel_transform.run_transformation
+
+    def counting(lazy_df, *args, **kwargs):
+        planned_rows.append(lazy_df.select(pl.len()).collect().item())
+        return run_transformation(lazy_df, *args, **kwargs)
+
+    monkeypatch.setattr(parallel_transform, "run_transformation", counting)
+    low = parallel_transform.transform_file(
+        input_path, str(tmp_path / "low.parquet"), target_schema, zones_lazy, zone_grid,
+        low_memory={"batch_rows": MIN_BATCH_ROWS, "memory_budget_mb": None},
+    )
+    assert planned_rows and max(planned_rows) <= MIN_BATCH_ROWS
+
+    full = parallel_transform.transform_file(input_path, str(tmp_path / "full.parquet"), target_schema, zones_lazy, zone_grid)
+    assert low["rows"] == full["rows"] == 130_000
+    # Même sortie triée qu'en mode normal.
+    low_out, full_out = pl.read_parquet(low["output"]), pl.read_parquet(full["output"])
+    assert low_out[KEY].equals(full_out[KEY])
+    assert low_out.sort(low_out.columns, nulls_last=True).equals(full_out.sort(full_out.columns, nulls_last=True))
+
+
+def test_retried_batch_is_not_counted_twice(zones, tmp_path, monkeypatch):
+    zones_lazy, zone_grid = zones
+    input_path = str(tmp_path / "yellow_tripdata_2009-01.parquet")
+    trips = generate_2009(120_000, seed=7)
+    # Courses en échec des règles de qualité et valeurs de paiement inconnues.
+    trips.with_columns(
+        Fare_Amt=pl.when(pl.int_range(pl.len()) % 97 == 0).then(-pl.col("Fare_Amt")).otherwise(pl.col("Fare_Amt")),
+        Payment_Type=pl.when(pl.int_range(pl.len()) % 101 == 0).then(pl.lit("Bitcoin")).otherwise(pl.col("Payment_Type")),
+    ).write_parquet(input_path)
+    target_schema = generate_modern(0).schema
+
+    def run(name: str) -> dict:
+        return parallel_transform.transform_file(
+            input_path, str(tmp_path / name / "out.parquet"), target_schema, zones_lazy, zone_grid,
+            quality_dir=str(tmp_path / name), low_memory={"batch_rows": 100_000, "memory_budget_mb": 1e9},
+        )
+
+    expected = run("no_retry")
+    assert expected["quality"]["rows_failed"] > 0 and expected["unknown_values"]
+
+    # Pic au-delà du budget sur la première tranche seulement : elle est refaite avec 50 000 lignes.
+    peaks = [2e9]
+
+    @contextmanager
+    def fake_peak():
+        yield {"peak_mb": peaks.pop() if peaks else 0.0}
+
+    monkeypatch.setattr(low_memory, "track_peak_rss", fake_peak)
+    retried = run("retry")
+    assert not peaks
+
+    assert retried["rows"] == expected["rows"] == 120_000
+    assert retried["quality"]["rows_checked"] == 120_000
+    assert retried["quality"]["rows_failed"] == expected["quality"]["rows_failed"]
+    assert retried["quality"]["rules"] == expected["quality"]["rules"]
+    assert retried["unknown_values"] == expected["unknown_values"]
@@ -0,0 +1,86 @@
+import ast
+import importlib.util
+import os
+
+import polars as pl
+import pytest
+
+from scripts.manifest import TRANSFORM_MODULES, filter_jobs, record_reports
+
+from conftest import REPO_ROOT
+
+SCHEMA = {"VendorID": pl.Int64, "tpep_pickup_datetime": pl.Datetime("us")}
+OPTIONS = {
+    "quantize_precision": None,
+    "output_options": {"compression": "zstd", "row_group_size": 250_000, "sort_by": "tpep_pickup_datetime"},
+    "rollups": True,
+    "od_matrix": True,
+    "quality": True,
+    "quarantine": False,
+}
+
+
+def _imported_scripts(module: str, seen: set) -> set:
+    """Modules de scripts/ importés par `module`, directement ou non."""
+    if module in seen:
+        return seen
+    seen.add(module)
+    with open(os.path.join(REPO_ROOT, "scripts", f"{module}.py")) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module and node.module.startswith("scripts."):
+            _imported_scripts(node.module.split(".")[1], seen)
+    return seen
+
+
+def test_every_module_behind_transform_file_is_versioned():
+    # scripts.profiling mesure les étapes sans toucher aux sorties.
+    modules = _imported_scripts("parallel_transform", set()) - {"profiling"}
+    assert {f"{module}.py" for module in modules} <= set(TRANSFORM_MODULES)
+
+
+@pytest.fixture
+def processed(tmp_path):
+    """Une partition traitée et enregistrée dans le manifeste avec OPTIONS."""
+    input_path, output_path = str(tmp_path / "in.parquet"), str(tmp_path / "out.parquet")
+    for path in (input_path, output_path):
+        pl.DataFrame({"VendorID": [1, 2]}).write_parquet(path)
+    db_path = str(tmp_path / "manifest.sqlite")
+    jobs = [(input_path, output_path)]
+    assert filter_jobs(jobs, SCHEMA, db_path, OPTIONS) == jobs
+    record_reports([{"status": "OK", "file": input_path, "output": output_path, "rows": 2}], SCHEMA, db_path, OPTIONS)
+    return jobs, db_path
+
+
+def test_unchanged_partition_is_skipped(processed):
+    jobs, db_path = processed
+    assert filter_jobs(jobs, SCHEMA, db_path, dict(OPTIONS)) == []
+
+
+@pytest.mark.parametrize("name, value", [
+    ("output_options", {**OPTIONS["output_options"], "row_group_size": 100_000}),
+    ("quarantine", True),
+    ("rollups", False),
+    ("od_matrix", False),
+    ("quantize_precision", 4),
+])
+def test_changed_output_option_reprocesses(processed, name, value):
+    jobs, db_path = processed
+    assert filter_jobs(jobs, SCHEMA, db_path, {**OPTIONS, name: value}) == jobs
+
+
+def _dag_manifest_options(monkeypatch, memory_budget_mb) -> dict:
+    if memory_budget_mb is None:
+        monkeypatch.delenv("TAXI_MEMORY_BUDGET_MB", raising=False)
+    else:
+        monkeypatch.setenv("TAXI_MEMORY_BUDGET_MB", memory_budget_mb)
+    spec = importlib.util.spec_from_file_location("main_dag", os.path.join(REPO_ROOT, "dags", "main_dag.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.manifest_options()
+
+
+def test_memory_budget_does_not_reprocess(monkeypatch):
+    pytest.importorskip("airflow")
+    # Le mode basse mémoire donne la même sortie : changer le budget ne retraite rien.
+    assert _dag_manifest_options(monkeypatch, None) == _dag_manifest_options(monkeypatch, "4096")
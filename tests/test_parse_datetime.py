@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from scripts.transformation import parse_datetime
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _dates(n_rows: int, offset: int = 0) -> list:
+    start = datetime(2009, 1, 1) + timedelta(days=offset)
+    # Beaucoup de répétitions (précision à la minute) et des lignes nulles.
+    return [None if i % 13 == 0 else (start + timedelta(minutes=i % 997)).strftime(FORMAT) for i in range(n_rows)]
+
+
+@pytest.mark.parametrize("fmt", [FORMAT, None])
+def test_unique_parse_matches_the_direct_parse(fmt):
+    data = pl.DataFrame({"pickup": pl.Series(_dates(30_000) + _dates(30_000, offset=40), dtype=pl.String)})
+    target_type = pl.Datetime("us")
+
+    direct = data.select(parse_datetime("pickup", target_type, fmt))
+    # Plusieurs batches (streaming), chacun converti sur ses propres valeurs distinctes.
+    unique = data.lazy().select(parse_datetime("pickup", target_type, fmt, unique=True)).collect(engine="streaming")
+
+    assert unique.schema == direct.schema
+    assert unique.equals(direct)
+    assert unique["pickup"].null_count() == data["pickup"].null_count() > 0
+
+
+@pytest.mark.parametrize("fmt", [FORMAT, None])
+def test_unique_parse_rejects_unparseable_strings_like_the_direct_parse(fmt):
+    data = pl.DataFrame({"pickup": ["2009-01-01 10:00:00", None, "pas une date", "2009-01-01 10:00:00"]})
+    target_type = pl.Datetime("us")
+
+    with pytest.raises(pl.exceptions.InvalidOperationError):
+        data.select(parse_datetime("pickup", target_type, fmt))
+    with pytest.raises(pl.exceptions.InvalidOperationError):
+        data.select(parse_datetime("pickup", target_type, fmt, unique=True))
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import polars as pl
+
+from scripts.quality import QUALITY_RULES
+
+from conftest import REPO_ROOT, SHAPEFILE_PATH
+
+
+N_ROWS = 60_000
+
+# Exécuté dans un processus à part : POLARS_MAX_THREADS n'est lu qu'au chargement de Polars.
+# Fichier 2009 synthétique avec des courses en échec ; transform_file sans puis avec quarantaine.
+SCRIPT = textwrap.dedent("""
+    import json, os, sys
+    import numpy as np
+    import polars as pl
+
+    from scripts.bench_pipeline import generate_2009, generate_modern
+    from scripts.parallel_transform import transform_file
+    from scripts.zone_index import load_zone_artifact
+
+    shapefile_path, work_dir, n_rows = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    artifact = load_zone_artifact(shapefile_path, os.path.join(work_dir, "zone_index"))
+    rows = np.arange(n_rows)
+    trips = generate_2009(n_rows, seed=3).with_columns(
+        Fare_Amt=pl.when(pl.Series(rows % 97 == 0)).then(-pl.col("Fare_Amt")).otherwise(pl.col("Fare_Amt")),
+        Start_Lon=pl.when(pl.Series(rows % 89 == 0)).then(None).otherwise(pl.col("Start_Lon")),
+    )
+    input_path = os.path.join(work_dir, "yellow_tripdata_2009-01.parquet")
+    trips.write_parquet(input_path)
+
+    reports = {}
+    for name, quarantine_root in (("flag", None), ("quarantine", os.path.join(work_dir, "quarantine"))):
+        reports[name] = transform_file(
+            input_path, os.path.join(work_dir, name, "out.parquet"), generate_modern(0).schema,
+            artifact["zones_lazy"], artifact["zone_grid"],
+            quality_dir=os.path.join(work_dir, name), quarantine_root=quarantine_root,
+        )
+    print("REPORTS=" + json.dumps(reports, default=str))
+""")
+
+
+def test_quality_counts_with_a_single_polars_thread(tmp_path):
+    env = dict(os.environ, POLARS_MAX_THREADS="1", PYTHONPATH=REPO_ROOT)
+    completed = subprocess.run(
+        [sys.executable, "-c", SCRIPT, SHAPEFILE_PATH, str(tmp_path), str(N_ROWS)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=600,
+    )
+    assert completed.returncode == 0, completed.stderr
+    reports = json.loads(completed.stdout.split("REPORTS=")[-1])
+
+    # Sans quarantaine, toutes les courses sont écrites : les règles y sont évaluées directement.
+    written = pl.read_parquet(reports["flag"]["output"])
+    assert written.height == N_ROWS
+    expected = written.select(**{name: expr.fill_null(False).sum() for name, expr in QUALITY_RULES.items()}).row(0, named=True)
+    expected_failed = written.select(pl.any_horizontal(e.fill_null(False) for e in QUALITY_RULES.values()).sum()).item()
+    assert expected["negative_fare"] > 0 and expected["pu_location_null"] > 0
+
+    for name in ("flag", "quarantine"):
+        quality = reports[name]["quality"]
+        # Chaque course n'est comptée qu'une fois, même quand deux sorties partagent le plan.
+        assert quality["rows_checked"] == N_ROWS, name
+        assert quality["rows_failed"] == expected_failed, name
+        assert quality["rules"] == expected, name
+
+    quarantined = pl.read_parquet(reports["quarantine"]["quality"]["quarantine"])
+    assert quarantined.height == expected_failed
+    assert reports["quarantine"]["rows"] == N_ROWS - expected_failed
+    assert reports["quarantine"]["unknown_values"] == reports["flag"]["unknown_values"]
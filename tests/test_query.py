@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from scripts.output_writer import partition_path, write_partition
+from scripts.query import DATETIME_COLUMN, matching_row_groups, scan_trips
+
+
+def _month(year: int, month: int, rows: int, first: datetime, last: datetime) -> pl.DataFrame:
+    step = (last - first) / (rows - 1)
+    return pl.DataFrame({
+        DATETIME_COLUMN: [first + i * step for i in range(rows)],
+        "PULocationID": [(i % 263) + 1 for i in range(rows)],
+        "DOLocationID": [(i * 7 % 263) + 1 for i in range(rows)],
+        "VendorID": [i % 2 + 1 for i in range(rows)],
+        "fare_amount": [float(i % 50) for i in range(rows)],
+    }).with_columns(pl.col("PULocationID", "DOLocationID").cast(pl.Int32))
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    """Deux mois dont les fichiers TLC débordent sur les mois voisins, comme les vrais."""
+    root = str(tmp_path_factory.mktemp("dataset"))
+    frames = {
+        "yellow_tripdata_2024-01.parquet": _month(2024, 1, 20_000, datetime(2023, 12, 31, 22), datetime(2024, 2, 3, 5)),
+        "yellow_tripdata_2024-02.parquet": _month(2024, 2, 20_000, datetime(2024, 1, 31, 23), datetime(2024, 3, 1, 2)),
+    }
+    for name, frame in frames.items():
+        write_partition(frame.lazy(), partition_path(root, name), row_group_size=2_000)
+    return root, pl.concat(frames.values())
+
+
+@pytest.mark.parametrize("use_statistics", [True, False])
+@pytest.mark.parametrize("start, end", [
+    (datetime(2024, 2, 1), datetime(2024, 2, 4)),
+    (datetime(2023, 12, 31), datetime(2024, 1, 1)),
+    (datetime(2024, 1, 10), datetime(2024, 1, 11)),
+    (None, datetime(2024, 1, 1)),
+    (datetime(2024, 2, 29, 12), None),
+])
+def test_date_range_returns_trips_from_every_file(dataset, start, end, use_statistics):
+    root, trips = dataset
+    expected = trips
+    if start is not None:
+        expected = expected.filter(pl.col(DATETIME_COLUMN) >= start)
+    if end is not None:
+        expected = expected.filter(pl.col(DATETIME_COLUMN) < end)
+
+    result = scan_trips(start=start, end=end, root=root, use_statistics=use_statistics).collect()
+    assert result.height == expected.height > 0
+    assert result.sort(DATETIME_COLUMN).equals(expected.sort(DATETIME_COLUMN))
+
+
+def test_row_group_statistics_exclude_files(dataset):
+    root, _ = dataset
+    path = partition_path(root, "yellow_tripdata_2024-02.parquet")
+    assert matching_row_groups(path, {DATETIME_COLUMN: (datetime(2024, 1, 10), datetime(2024, 1, 11))}, {}) == 0
+    assert matching_row_groups(path, {DATETIME_COLUMN: (datetime(2024, 2, 10), datetime(2024, 2, 10) + timedelta(hours=1))}, {}) == 1
+
+    result = scan_trips(columns=["VendorID"], start="2024-02-10", end="2024-02-11", vendor_ids=[2], root=root).collect()
+    assert result.columns == ["VendorID"] and set(result["VendorID"]) == {2}
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+sa = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.dialects import mssql  # noqa: E402
+
+from scripts.sql_loader import SOURCE_COLUMN, ensure_table, load_dataset, load_parquet_file  # noqa: E402
+
+from conftest import REPO_ROOT  # noqa: E402
+
+
+def _trips(rows: int, offset: int = 0) -> pl.DataFrame:
+    return pl.DataFrame({
+        "VendorID": [i % 2 + 1 for i in range(rows)],
+        "tpep_pickup_datetime": [datetime(2024, 1, 1, i % 24, i % 60) for i in range(rows)],
+        "PULocationID": pl.Series([(i + offset) % 263 + 1 for i in range(rows)], dtype=pl.Int32),
+        "fare_amount": [float("nan") if i % 10 == 0 else i / 4 for i in range(rows)],
+        "store_and_fwd_flag": ["N" if i % 3 else "Y" for i in range(rows)],
+    })
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # SQLite tient lieu de SQL Server : même paramstyle "?" et même chemin de chargement.
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'destination.sqlite'}")
+    yield engine
+    engine.dispose()
+
+
+def _table(engine, table_name="yellow_tripdata") -> pl.DataFrame:
+    with engine.connect() as connection:
+        rows = connection.execute(sa.text(f"SELECT * FROM {table_name}")).mappings().all()
+    return pl.DataFrame([dict(row) for row in rows], infer_schema_length=None)
+
+
+def test_load_in_batches_and_reload_without_duplicates(engine, tmp_path):
+    path = str(tmp_path / "yellow_tripdata_2024-01.parquet")
+    trips = _trips(2_345)
+    trips.write_parquet(path)
+
+    report = load_parquet_file(path, batch_size=500, engine=engine)
+    assert report["rows"] == trips.height
+
+    loaded = _table(engine)
+    assert loaded.height == trips.height
+    assert set(loaded[SOURCE_COLUMN]) == {os.path.basename(path)}
+    # Les NaN arrivent en NULL, les autres valeurs sans changement.
+    assert loaded["fare_amount"].null_count() == trips["fare_amount"].is_nan().sum()
+    assert loaded["PULocationID"].to_list() == trips["PULocationID"].to_list()
+
+    # Relance de la tâche : les lignes du fichier sont remplacées, pas ajoutées.
+    load_parquet_file(path, batch_size=1_000, engine=engine)
+    assert _table(engine).height == trips.height
+
+
+def test_load_dataset_keeps_files_apart(engine, tmp_path):
+    for month, rows in ((1, 300), (2, 200)):
+        folder = tmp_path / "yellow" / "year=2024" / f"month={month:02d}"
+        folder.mkdir(parents=True)
+        _trips(rows, offset=month).write_parquet(folder / f"yellow_tripdata_2024-{month:02d}.parquet")
+
+    reports = load_dataset(str(tmp_path / "yellow" / "**" / "*.parquet"), batch_size=128, engine=engine)
+    assert [report["rows"] for report in reports] == [300, 200]
+
+    counts = _table(engine).group_by(SOURCE_COLUMN).len().sort(SOURCE_COLUMN)
+    assert counts["len"].to_list() == [300, 200]
+
+
+def test_long_strings_are_not_truncated(engine, tmp_path):
+    path = str(tmp_path / "yellow_tripdata_2024-03.parquet")
+    comment = "x" * 300
+    trips = _trips(3).with_columns(comment=pl.lit(comment))
+    trips.write_parquet(path)
+
+    # Colonne texte sans longueur maximale : NVARCHAR(max) sous SQL Server.
+    table = ensure_table(engine, "yellow_tripdata", trips.schema)
+    assert table.c.comment.type.compile(dialect=mssql.dialect()) == "NVARCHAR(max)"
+    load_parquet_file(path, engine=engine)
+    assert _table(engine)["comment"].to_list() == [comment] * 3
+
+
+def test_load_sql_is_mapped_over_transformed_partitions():
+    pytest.importorskip("airflow")
+    from airflow.models import DagBag
+
+    dag_bag = DagBag(dag_folder=os.path.join(REPO_ROOT, "dags", "main_dag.py"), include_examples=False)
+    dag = dag_bag.dags["test_taxi"]
+    # Chaque chargement attend la transformation de son fichier, pas seulement la liste des fichiers.
+    assert dag.get_task("load_sql").upstream_task_ids == {"transformation"}
+    assert dag.get_task("transformation").upstream_task_ids == {"list_partitions"}
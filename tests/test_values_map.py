@@ -0,0 +1,71 @@
+import numpy as np
+import polars as pl
+
+from scripts.transformation import classify_payment_type, classify_store_and_fwd, pop_unknown_values, values_map
+
+
+def _legacy_batch(n_rows: int, seed: int) -> pl.DataFrame:
+    """Colonnes 2009 : store_and_fwd_flag numérique avec des NaN et des nulls, payment_type texte."""
+    rng = np.random.default_rng(seed)
+    flag = rng.choice([0.0, 1.0, np.nan, 2.0], n_rows)
+    return pl.DataFrame({
+        "store_and_fwd_flag": flag,
+        "payment_type": rng.choice(["CASH", "Credit", "CSH", "No Charge"], n_rows),
+    }).with_columns(
+        pl.when(pl.int_range(pl.len()) % 10 == 0).then(None).otherwise(pl.col("store_and_fwd_flag")).alias("store_and_fwd_flag")
+    )
+
+
+def _expected_unknown(batches: list) -> dict:
+    data = pl.concat(batches)
+    flag = data["store_and_fwd_flag"]
+    return {
+        "store_and_fwd_flag": {
+            "nan": int(flag.is_nan().sum()),
+            "null": flag.null_count(),
+            "2.0": int((flag == 2.0).sum()),
+        },
+        "payment_type": {"CSH": int((data["payment_type"] == "CSH").sum())},
+    }
+
+
+def test_unknown_values_add_up_across_batches():
+    pop_unknown_values()
+    batches = [_legacy_batch(20_000, seed) for seed in range(4)]
+
+    # Un collect par batch : le registre doit additionner les NaN de chaque appel.
+    for batch in batches:
+        values_map(batch.lazy()).collect()
+
+    assert pop_unknown_values() == _expected_unknown(batches)
+
+
+def test_unknown_values_add_up_in_streaming_batches():
+    pop_unknown_values()
+    batches = [_legacy_batch(150_000, seed) for seed in range(3)]
+    result = values_map(pl.concat(batches).lazy()).collect(engine="streaming")
+
+    assert result.height == 450_000
+    assert pop_unknown_values() == _expected_unknown(batches)
+
+
+def test_mapping_matches_classify_row_by_row():
+    pop_unknown_values()
+    rng = np.random.default_rng(11)
+    # Colonne sale : nombreuses variantes d'écriture, nulls, valeurs inconnues.
+    spellings = ["CASH", "Cash", "cash", "CSH", "CREDIT", "Credit", "CRD", "No Charge", "NOC", "Dispute", "DIS", "UNK", None]
+    data = pl.DataFrame({
+        "store_and_fwd_flag": rng.choice([0.0, 1.0, np.nan, 2.0, -1.0], 50_000),
+        "payment_type": pl.Series(rng.choice(np.array(spellings, dtype=object), 50_000), dtype=pl.String),
+    })
+    result = values_map(data.lazy()).collect()
+
+    expected_payment = [classify_payment_type(value)[0] for value in data["payment_type"].to_list()]
+    expected_flag = [classify_store_and_fwd(value)[0] for value in data["store_and_fwd_flag"].to_list()]
+    assert result["payment_type"].to_list() == expected_payment
+    assert result["store_and_fwd_flag"].to_list() == expected_flag
+    assert pop_unknown_values()["payment_type"] == {
+        str(value): int(count)
+        for value, count in data["payment_type"].fill_null("null").value_counts().iter_rows()
+        if not classify_payment_type(None if value == "null" else value)[1]
+    }